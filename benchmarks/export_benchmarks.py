@@ -0,0 +1,246 @@
+"""
+Benchmarks for the export pipeline.
+
+Run from the project root, for example:
+    python -m benchmarks.export_benchmarks conversion --rows 200000
+    python -m benchmarks.export_benchmarks conversion --rows 200000 --mongo-uri mongodb://localhost:27017/DRS_TEST
+    python -m benchmarks.export_benchmarks styling --rows 100000
+    python -m benchmarks.export_benchmarks decoding --rows 1000000
+"""
+
+import argparse
+import io
+import random
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime, timedelta
+import bson
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from openpyxl import Workbook
+
+from export.incident_list import INCIDENT_HEADERS, create_incident_table
+from utils.report_query import build_server_format_pipeline, header_projection, SERVER_DATE_FORMAT
+from utils.row_stream import compact_rows
+from utils.table_writer import STYLE_MODES, write_data_rows
+
+BENCH_COLLECTION = "Bench_Incident_log"
+
+ACTIONS = ["collect arrears", "collect CPE", "collect arrears and CPE"]
+STATUSES = ["Incident Open", "Incident Close", "Incident Reject"]
+SOURCE_TYPES = ["Pilot Suspended", "Special", "Product Terminate"]
+
+
+def make_incident_documents(count, seed=42):
+    """Generate Incident_log shaped documents, including fields the exports never print"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    documents = []
+    for index in range(count):
+        documents.append({
+            "_id": ObjectId(),
+            "Task_Id": 20,
+            "Incident_Id": ObjectId(),
+            "Account_Num": f"{1000000 + index}",
+            "Incident_Status": rng.choice(STATUSES),
+            "Actions": rng.choice(ACTIONS),
+            "Monitor_Months": rng.randint(1, 5),
+            "Created_By": "bench",
+            "Created_Dtm": start + timedelta(minutes=index),
+            "Source_Type": rng.choice(SOURCE_TYPES),
+            "Arrears": round(rng.uniform(100, 100000), 2),
+            "Customer_Details": {"Customer_Name": f"Customer {index}", "Address": "Colombo", "Nic": f"{index:09d}V"},
+            "Product_Details": [{"Product_Id": index, "Product_Label": "PEO TV", "Status": "Active"}],
+        })
+    return documents
+
+
+def server_formatted(documents):
+    """Rows as the $project stage of build_server_format_pipeline returns them"""
+    rows = []
+    for document in documents:
+        row = {"_id": document["_id"]}
+        for header in INCIDENT_HEADERS:
+            if header not in document:
+                continue
+            value = document[header]
+            if isinstance(value, ObjectId):
+                value = str(value)
+            elif isinstance(value, datetime):
+                value = value.strftime(SERVER_DATE_FORMAT)
+            row[header] = value
+        rows.append(row)
+    return rows
+
+
+def _timed_sheet(rows):
+    """Host CPU seconds spent turning rows into the incident sheet"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    started = time.process_time()
+    create_incident_table(wb, rows, None)
+    return time.process_time() - started
+
+
+def bench_conversion(rows, mongo_uri=None):
+    """Client-side value conversion against rows pre-formatted by the server"""
+    documents = make_incident_documents(rows)
+    results = {
+        "client_conversion_sheet_cpu_s": _timed_sheet(documents),
+        "server_formatted_sheet_cpu_s": _timed_sheet(server_formatted(documents)),
+    }
+
+    if mongo_uri:
+        from pymongo import MongoClient
+
+        uri, db_name = mongo_uri.rsplit("/", 1)
+        client = MongoClient(uri)
+        try:
+            collection = client[db_name][BENCH_COLLECTION]
+            collection.drop()
+            collection.insert_many(documents)
+
+            started = time.process_time()
+            fetched = list(collection.find({}))
+            results["find_fetch_cpu_s"] = time.process_time() - started
+            results["find_total_cpu_s"] = results["find_fetch_cpu_s"] + _timed_sheet(fetched)
+
+            started = time.process_time()
+            fetched = list(collection.aggregate(build_server_format_pipeline({}, INCIDENT_HEADERS), allowDiskUse=True))
+            results["aggregate_fetch_cpu_s"] = time.process_time() - started
+            results["aggregate_total_cpu_s"] = results["aggregate_fetch_cpu_s"] + _timed_sheet(fetched)
+        finally:
+            client[db_name].drop_collection(BENCH_COLLECTION)
+            client.close()
+
+    return results
+
+
+def bench_styling(rows, mongo_uri=None):
+    """Data region cost per styling mode: CPU, cells carrying their own style, and styles.xml / sheet XML size"""
+    documents = make_incident_documents(rows)
+    results = {}
+    for mode in STYLE_MODES:
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "INCIDENT REPORT"
+        for col_idx, header in enumerate(INCIDENT_HEADERS, 1):
+            ws.cell(row=1, column=col_idx, value=header.replace('_', ' ').title())
+
+        started = time.process_time()
+        write_data_rows(ws, documents, INCIDENT_HEADERS, 1, style_mode=mode)
+        results[f"{mode}_rows_cpu_s"] = time.process_time() - started
+        results[f"{mode}_styled_cells"] = sum(1 for row in ws.iter_rows(min_row=2) for cell in row if cell.has_style)
+
+        started = time.process_time()
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        results[f"{mode}_save_cpu_s"] = time.process_time() - started
+        with zipfile.ZipFile(buffer) as package:
+            results[f"{mode}_styles_xml_bytes"] = package.getinfo("xl/styles.xml").file_size
+            results[f"{mode}_sheet_xml_bytes"] = package.getinfo("xl/worksheets/sheet1.xml").file_size
+
+    return results
+
+
+# Documents per encoded batch, roughly what one getMore returns for these documents
+DECODE_BATCH = 1000
+
+# Lazily decoded documents: top-level fields are decoded on first access, nested documents only when read
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def _timed_decode(batches, codec_options=None):
+    """CPU seconds and peak traced bytes to decode encoded batches into compact incident rows"""
+    def decode():
+        rows = []
+        for batch in batches:
+            documents = bson.decode_all(batch, codec_options) if codec_options else bson.decode_all(batch)
+            rows.extend(compact_rows(documents, INCIDENT_HEADERS))
+        return rows
+
+    # Timed and traced in separate passes, since tracing slows allocation-heavy code unevenly
+    started = time.process_time()
+    decode()
+    elapsed = time.process_time() - started
+
+    tracemalloc.start()
+    retained = decode()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del retained
+    return elapsed, peak
+
+
+def bench_decoding(rows, mongo_uri=None):
+    """Client decode cost of full documents, lazily decoded RawBSONDocuments and header-only projections"""
+    documents = make_incident_documents(rows)
+    projected_fields = ["_id"] + INCIDENT_HEADERS
+    full_batches = []
+    projected_batches = []
+    for start in range(0, rows, DECODE_BATCH):
+        chunk = documents[start:start + DECODE_BATCH]
+        full_batches.append(b"".join(bson.encode(document) for document in chunk))
+        projected_batches.append(b"".join(
+            bson.encode({field: document[field] for field in projected_fields if field in document}) for document in chunk
+        ))
+
+    results = {}
+    for mode, batches, codec_options in (
+        ("full", full_batches, None),
+        ("raw", full_batches, RAW_CODEC_OPTIONS),
+        ("projection", projected_batches, None),
+    ):
+        cpu, peak = _timed_decode(batches, codec_options)
+        results[f"{mode}_decode_cpu_s"] = cpu
+        results[f"{mode}_peak_mib"] = peak / 1048576
+
+    if mongo_uri:
+        from pymongo import MongoClient
+
+        uri, db_name = mongo_uri.rsplit("/", 1)
+        client = MongoClient(uri)
+        try:
+            collection = client[db_name][BENCH_COLLECTION]
+            collection.drop()
+            collection.insert_many(documents)
+            for mode, cursor_factory in (
+                ("full", lambda: collection.find({})),
+                ("raw", lambda: collection.with_options(codec_options=RAW_CODEC_OPTIONS).find({})),
+                ("projection", lambda: collection.find({}, header_projection(INCIDENT_HEADERS))),
+            ):
+                started = time.process_time()
+                fetched = list(compact_rows(cursor_factory(), INCIDENT_HEADERS))
+                results[f"{mode}_find_cpu_s"] = time.process_time() - started
+                del fetched
+        finally:
+            client[db_name].drop_collection(BENCH_COLLECTION)
+            client.close()
+
+    return results
+
+
+BENCHMARKS = {
+    "conversion": bench_conversion,
+    "styling": bench_styling,
+    "decoding": bench_decoding,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export pipeline benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--mongo-uri", default=None, help="mongodb://host:port/db to also measure against a live server")
+    args = parser.parse_args()
+
+    results = BENCHMARKS[args.benchmark](args.rows, mongo_uri=args.mongo_uri)
+    print(f"{args.benchmark} ({args.rows} rows)")
+    for name, value in results.items():
+        print(f"  {name:<32} {value:.3f}" if isinstance(value, float) else f"  {name:<32} {value}")
+
+
+if __name__ == "__main__":
+    main()
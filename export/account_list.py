@@ -0,0 +1,150 @@
+"This file fetches incident details for a list of account numbers read from a file and exports them in the incident table layout"
+
+
+import csv
+import logging
+import os
+from datetime import datetime
+from openpyxl import load_workbook
+from pymongo import ASCENDING
+from utils.connectDB import get_shared_db
+from utils.config_loader import is_enabled
+from utils.memory_profile import mark_phase
+from utils.parallel_fetch import fetch_partitioned
+from utils.report_query import fetch_rows
+from utils.row_stream import compact_rows
+from utils.stream_writers import write_streaming_workbook
+from utils.summary_stats import new_summary
+from export.incident_list import INCIDENT_COLLECTION, INCIDENT_HEADERS, build_incident_query
+from utils.time_budget import is_budget_timeout
+
+logger = logging.getLogger('excel_data_writer')
+
+ACCOUNT_FIELD = "Account_Num"
+
+# Account numbers per $in query; large enough to amortise the round trip, small enough to keep each query on the index
+DEFAULT_CHUNK_SIZE = 1000
+
+# Concurrent chunk queries, each on its own pooled connection
+DEFAULT_WORKERS = 4
+
+# Chunks fetched ahead of the one being written, per worker
+PENDING_CHUNKS_PER_WORKER = 2
+
+
+def read_account_numbers(account_file):
+    """Read account numbers from a .txt (one per line), .csv or .xlsx file, dropping blanks and duplicates
+
+    In .csv and .xlsx files the Account_Num column is used when the first row names
+    it, otherwise the first column.
+    """
+    extension = os.path.splitext(account_file)[1].lower()
+    if extension == ".xlsx":
+        wb = load_workbook(account_file, read_only=True)
+        try:
+            rows = [list(row) for row in wb.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            wb.close()
+    elif extension == ".csv":
+        with open(account_file, newline='', encoding='utf-8-sig') as account_csv:
+            rows = list(csv.reader(account_csv))
+    elif extension in (".txt", ""):
+        with open(account_file, encoding='utf-8-sig') as account_txt:
+            rows = [[line] for line in account_txt]
+    else:
+        raise ValueError(f"Invalid account_file '{account_file}'. Must be a .txt, .csv or .xlsx file")
+
+    column = 0
+    if rows and ACCOUNT_FIELD in [str(value).strip() for value in rows[0] if value is not None]:
+        column = [str(value).strip() if value is not None else "" for value in rows[0]].index(ACCOUNT_FIELD)
+        rows = rows[1:]
+
+    accounts = []
+    seen = set()
+    for row in rows:
+        if column >= len(row) or row[column] is None:
+            continue
+        # Spreadsheet cells may hold account numbers as numbers
+        value = row[column]
+        account = str(int(value)) if isinstance(value, float) and value.is_integer() else str(value).strip()
+        if account and account not in seen:
+            seen.add(account)
+            accounts.append(account)
+    return accounts
+
+
+def build_account_chunk_queries(accounts, base_query, chunk_size):
+    """Split the accounts into $in queries of at most chunk_size accounts, each combined with base_query"""
+    return [
+        dict(base_query, **{ACCOUNT_FIELD: {"$in": accounts[start:start + chunk_size]}})
+        for start in range(0, len(accounts), chunk_size)
+    ]
+
+
+def excel_incident_account_list(account_file, action_type=None, status=None, from_date=None, to_date=None,
+                                chunk_size=None, workers=None, server_format=None, summary=None):
+    """Fetch incidents for the accounts listed in account_file with parallel chunked $in queries and stream them to a workbook"""
+    try:
+        db = get_shared_db()
+        logger.info(f"Connected to MongoDB successfully | DRS")
+
+    except Exception as err:
+        print("Connection error")
+        logger.error(f"MongoDB connection failed: {str(err)}")
+        return False
+    else:
+        try:
+            collection = db[INCIDENT_COLLECTION]
+            chunk_size = int(chunk_size) if chunk_size else DEFAULT_CHUNK_SIZE
+            workers = int(workers) if workers else DEFAULT_WORKERS
+            if chunk_size < 1 or workers < 1:
+                raise ValueError("chunk_size and workers must be at least 1")
+
+            accounts = read_account_numbers(account_file)
+            if not accounts:
+                raise ValueError(f"No account numbers found in '{account_file}'")
+            base_query, filters = build_incident_query(action_type, status, from_date, to_date)
+            filters = dict({"accounts": f"{len(accounts)} from {os.path.basename(account_file)}"}, **filters)
+            chunk_queries = build_account_chunk_queries(accounts, base_query, chunk_size)
+
+            logger.info(f"Executing {len(chunk_queries)} chunked queries for {len(accounts)} accounts on {workers} threads: {base_query}")
+            # Fetching and writing are interleaved, so they are profiled as one phase
+            mark_phase("stream")
+            found_accounts = set()
+            account_column = INCIDENT_HEADERS.index(ACCOUNT_FIELD)
+
+            def incidents():
+                # Chunks are yielded in file order while the next ones are read on the pool
+                for row in fetch_partitioned(
+                    lambda chunk_query: compact_rows(
+                        fetch_rows(collection, chunk_query, INCIDENT_HEADERS, is_enabled(server_format),
+                                   sort=[(ACCOUNT_FIELD, ASCENDING), ("Created_Dtm", ASCENDING)]),
+                        INCIDENT_HEADERS
+                    ),
+                    chunk_queries, workers, workers * PENDING_CHUNKS_PER_WORKER
+                ):
+                    found_accounts.add(row[account_column])
+                    yield row
+
+            output_dir = "exports"
+            os.makedirs(output_dir, exist_ok=True)
+            filepath = os.path.join(output_dir, f"incidents_by_account_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+            totals = new_summary(INCIDENT_HEADERS) if is_enabled(summary) else None
+            count = write_streaming_workbook(filepath, "INCIDENT REPORT", INCIDENT_HEADERS, incidents(), filters, totals)
+
+            missing = len(accounts) - len(found_accounts & set(accounts))
+            logger.info(f"Found {count} incidents for {len(accounts) - missing} of {len(accounts)} accounts")
+            print(f"\nSuccessfully exported {count} records to: {filepath}")
+            return True
+
+        except ValueError as ve:
+            logger.error(f"Validation error: {str(ve)}")
+            print(f"Error: {str(ve)}")
+            return False
+        except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
+            logger.error(f"Export failed: {str(e)}", exc_info=True)
+            print(f"\nError during export: {str(e)}")
+            return False
@@ -0,0 +1,158 @@
+"""Dry-run plan of a task batch: compiled query, chosen index, preflight row count and projected output, writing no files"""
+
+import logging
+
+from bson import json_util
+
+from export.enrichment import build_lookup_stages, enriched_headers, parse_enrichment
+from export.report_engine import ENGINE_CSV, choose_task_engine, count_task_rows
+from export.report_registry import get_report_spec, split_engine_options
+from export.task_planner import estimate_task_seconds
+from utils.config_loader import is_enabled
+from utils.report_query import build_report_pipeline, build_server_format_pipeline
+
+logger = logging.getLogger('excel_data_writer')
+
+# Upper bound on choosing each query plan; the query itself is not run
+PLAN_TIME_MS = 5000
+
+# How the preflight count bounds the real row count, by its source
+ROW_BOUNDS = {"count": "", "count stopped at CSV_ROWS": "at least ", "collection size": "at most "}
+
+# Output bytes per written cell, measured on the incident layout with the benchmark dataset
+XLSX_BYTES_PER_CELL = 5
+CSV_BYTES_PER_CELL = 12
+
+
+def compile_task_query(function_name, params):
+    """Return (collection, explain command) for a registered task, or None for reports without a query stage"""
+    spec = get_report_spec(function_name)
+    if spec is None:
+        return None
+
+    query_params, options = split_engine_options(params)
+    query, _ = spec.build_query(**query_params)
+    enrich, enrich_mode = parse_enrichment(options.get("enrich"), options.get("enrich_mode"))
+    if enrich and enrich_mode == "lookup":
+        headers = enriched_headers(spec.headers, enrich)
+        pipeline = build_report_pipeline(query, headers, is_enabled(options.get("server_format")), stages=build_lookup_stages(enrich))
+        return spec.collection, {"aggregate": spec.collection, "pipeline": pipeline, "cursor": {}, "maxTimeMS": PLAN_TIME_MS}
+    if is_enabled(options.get("server_format")):
+        pipeline = build_server_format_pipeline(query, spec.headers)
+        return spec.collection, {"aggregate": spec.collection, "pipeline": pipeline, "cursor": {}, "maxTimeMS": PLAN_TIME_MS}
+    return spec.collection, {"find": spec.collection, "filter": query, "maxTimeMS": PLAN_TIME_MS}
+
+
+def _find_key(document, key):
+    """First value stored under key anywhere in a nested explain document"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+    for value in values:
+        found = _find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_indexes(stage):
+    """Index names used by a winning plan, or COLLSCAN when it reads the whole collection"""
+    indexes = []
+    stages = [stage]
+    while stages:
+        current = stages.pop()
+        if not isinstance(current, dict):
+            continue
+        if current.get("indexName"):
+            indexes.append(current["indexName"])
+        elif current.get("stage") == "COLLSCAN":
+            indexes.append("COLLSCAN")
+        # Newer servers nest the classic plan under queryPlan
+        stages.extend([current.get("queryPlan"), current.get("inputStage")] + list(current.get("inputStages", [])))
+    return indexes or ["unknown"]
+
+
+def explain_task_query(db, command):
+    """Explain a compiled query with queryPlanner verbosity, returning the index its winning plan uses without running it"""
+    explain = db.command("explain", command, verbosity="queryPlanner")
+    return {"index": ", ".join(_plan_indexes(_find_key(explain, "winningPlan")))}
+
+
+def projected_output_bytes(engine, rows, headers):
+    """Rough size of the exported file(s) for rows rows of the report's headers"""
+    per_cell = CSV_BYTES_PER_CELL if engine == ENGINE_CSV else XLSX_BYTES_PER_CELL
+    return rows * len(headers) * per_cell
+
+
+def plan_task(db, task, thresholds, engine_setting, history):
+    """Build the plan entry of one task; errors are reported in the entry instead of raised"""
+    task_id, function_name, _, params = task
+    entry = {"task_id": task_id, "function_name": function_name}
+    try:
+        compiled = compile_task_query(function_name, params)
+        engine, reason, counted = choose_task_engine(db, task_id, function_name, params, thresholds, engine_setting)
+        entry.update(engine=engine, engine_reason=reason)
+        if compiled is None:
+            entry["query"] = "report has no separate query stage"
+            entry["estimated_seconds"] = estimate_task_seconds(task_id, None, history)
+            return entry
+
+        collection, command = compiled
+        entry["collection"] = collection
+        entry["query"] = command.get("filter", command.get("pipeline"))
+        entry.update(explain_task_query(db, command))
+        # The preflight count is capped and time-limited, so planning never reads a large result
+        rows, source = counted or count_task_rows(db, function_name, params, thresholds)
+        entry.update(rows=rows, rows_source=source)
+        entry["projected_bytes"] = projected_output_bytes(engine, rows, get_report_spec(function_name).headers)
+        entry["estimated_seconds"] = estimate_task_seconds(task_id, rows, history)
+    except Exception as e:
+        logger.warning(f"Plan for Task {task_id} incomplete: {str(e)}")
+        entry["error"] = str(e)
+    return entry
+
+
+def format_plan_entry(entry):
+    """Readable block for one task of the plan"""
+    lines = [f"Task {entry['task_id']} ({entry['function_name']})"]
+    if "error" in entry:
+        lines.append(f"  error:          {entry['error']}")
+    if "query" in entry:
+        query = entry["query"] if isinstance(entry["query"], str) else json_util.dumps(entry["query"])
+        lines.append("  query:          " + (f"{entry['collection']} {query}" if "collection" in entry else query))
+    if "index" in entry:
+        lines.append(f"  index:          {entry['index']}")
+    if "rows" in entry:
+        lines.append(f"  rows:           {ROW_BOUNDS.get(entry['rows_source'], '')}{entry['rows']} ({entry['rows_source']})")
+    if "engine" in entry:
+        lines.append(f"  engine:         {entry['engine']} ({entry['engine_reason']})")
+    if "projected_bytes" in entry:
+        lines.append(f"  projected size: {ROW_BOUNDS.get(entry['rows_source'], '')}{entry['projected_bytes'] / 1048576:.2f} MiB")
+    if "estimated_seconds" in entry:
+        lines.append(f"  estimated time: {entry['estimated_seconds']:.1f}s")
+    return "\n".join(lines)
+
+
+def plan_batch(db, tasks, thresholds, engine_for_task, history):
+    """Plan every task of a batch and print the plan, returning the entries; no export is run
+
+    engine_for_task(task_id) returns the task's engine setting.
+    """
+    entries = [plan_task(db, task, thresholds, engine_for_task(task[0]), history) for task in tasks]
+    for entry in entries:
+        print(format_plan_entry(entry))
+        logger.info(f"Task {entry['task_id']} plan", extra={"plan": entry})
+
+    total_bytes = sum(entry.get("projected_bytes", 0) for entry in entries)
+    total_seconds = sum(entry.get("estimated_seconds", 0) for entry in entries)
+    # One capped count makes the batch total a lower bound too
+    bound = "at least " if any(entry.get("rows_source") == "count stopped at CSV_ROWS" for entry in entries) else ""
+    summary = f"Plan: {len(entries)} tasks, projected {bound}{total_bytes / 1048576:.2f} MiB, estimated {total_seconds:.1f}s run one after another"
+    print(summary)
+    logger.info(summary)
+    return entries
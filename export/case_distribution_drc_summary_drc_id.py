@@ -1,12 +1,15 @@
 import logging
 from datetime import datetime
-from bson import ObjectId
 from openpyxl import Workbook
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.time_budget import is_budget_timeout, limit_cursor, register_output
+from utils.connectDB import get_shared_db
+from utils.config_loader import is_enabled
+from export.drc_rollup import summarize_rollup
 import os
-from pymongo import MongoClient
 
 logger = logging.getLogger('excel_data_writer')
 
@@ -14,12 +17,11 @@ DRC_SUMMARY_HEADERS = [
     "created_dtm", "drc_id", "drc", "case_count", "tot_arrease", "proceed_on"
 ]
 
-def excel_drc_summary_detail(drc, case_distribution_batch_id):
-    """Fetch and export DRC summary details with a fixed Task_Id of 20 based on validated parameters"""
+def excel_drc_summary_detail(drc, case_distribution_batch_id, rollup=None, drc_id=None):
+    """Fetch and export DRC summary details with a fixed Task_Id of 20 based on validated parameters, or per DRC from the incremental rollup"""
     
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["DRS"]
+        db = get_shared_db()
         logger.info(f"Connected to MongoDB successfully | DRS")
 
     except Exception as err:
@@ -31,37 +33,48 @@ def excel_drc_summary_detail(drc, case_distribution_batch_id):
         try:
 
 
-            collection = db["Case_Distribution_DRC_Summary"]
-            query = {}
-
-            # Check each parameter and build query
-
-            # check drc
-            if drc is not None:
-                if drc == "D1":
-                    query[drc] = {"$regex": f"^{drc}$"}
-                elif drc == "D2":
-                    query[drc] = drc
-                else:
-                    raise ValueError(f"Invalid drc '{drc}'. Must be 'D1', or 'D2'")
+            if is_enabled(rollup):
+                # The rollup is keyed by drc_id, as in case_distribution_drc
+                match = {}
+                if drc_id is not None:
+                    match["drc_id"] = int(drc_id) if str(drc_id).isdigit() else drc_id
+                if case_distribution_batch_id is not None:
+                    match["case_distribution_batch_id"] = int(case_distribution_batch_id) if str(case_distribution_batch_id).isdigit() else case_distribution_batch_id
+                summaries = summarize_rollup(db, ["drc_id", "drc"], match)
+                drc = f"drc_id {drc_id}" if drc_id is not None else None
+                logger.info(f"Read {len(summaries)} DRC rows from the DRC rollup: {match}")
+            else:
+                collection = db["Case_Distribution_DRC_Summary"]
+                query = {}
+
+                # Check each parameter and build query
+
+                # check drc
+                if drc is not None:
+                    if drc == "D1":
+                        query[drc] = {"$regex": f"^{drc}$"}
+                    elif drc == "D2":
+                        query[drc] = drc
+                    else:
+                        raise ValueError(f"Invalid drc '{drc}'. Must be 'D1', or 'D2'")
             
 
-            # check case_distribution_batch_id 
-            if case_distribution_batch_id is not None:
-                if case_distribution_batch_id == 1:
-                    query[case_distribution_batch_id] = {"$regex": f"^{case_distribution_batch_id}$"}
-                elif case_distribution_batch_id == 2:
-                    query[case_distribution_batch_id] = case_distribution_batch_id
-                elif case_distribution_batch_id == 3:
-                    query[case_distribution_batch_id] = case_distribution_batch_id
-                else:
-                    raise ValueError(f"Invalid case distribution batch id '{case_distribution_batch_id}'. Must be 1, 2, or 3")
+                # check case_distribution_batch_id 
+                if case_distribution_batch_id is not None:
+                    if case_distribution_batch_id == 1:
+                        query[case_distribution_batch_id] = {"$regex": f"^{case_distribution_batch_id}$"}
+                    elif case_distribution_batch_id == 2:
+                        query[case_distribution_batch_id] = case_distribution_batch_id
+                    elif case_distribution_batch_id == 3:
+                        query[case_distribution_batch_id] = case_distribution_batch_id
+                    else:
+                        raise ValueError(f"Invalid case distribution batch id '{case_distribution_batch_id}'. Must be 1, 2, or 3")
 
 
-            #log and excute query
-            logger.info(f"Executing query on Case_Distribution_DRC_Summary: {query}")
-            summaries = list(collection.find(query)) #fetch data into array
-            logger.info(f"Found {len(summaries)} matching DRC summary records")
+                #log and excute query
+                logger.info(f"Executing query on Case_Distribution_DRC_Summary: {query}")
+                summaries = list(limit_cursor(collection.find(query))) #fetch data into array
+                logger.info(f"Found {len(summaries)} matching DRC summary records")
 
             if not summaries:
                 print("No DRC summary records found matching the selected filters")
@@ -83,6 +96,8 @@ def excel_drc_summary_detail(drc, case_distribution_batch_id):
             }):
                 raise Exception("Failed to create DRC summary sheet")
 
+            register_output(filepath)
+
             wb.save(filepath)
             if not summaries:
                 print("No drc summaries found matching the selected filters. Exported empty table to: {filepath}")
@@ -95,14 +110,12 @@ def excel_drc_summary_detail(drc, case_distribution_batch_id):
             print(f"Error: {str(ve)}")
             return False
         except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
             logger.error(f"Export failed: {str(e)}", exc_info=True)
             print(f"\nError during export: {str(e)}")
             return False
-        
-        finally:
-            if client:
-                client.close()
-                logger.info("MongoDB connection closed")
 
 
 
@@ -168,24 +181,11 @@ def create_drc_summary_table(wb, data, filters=None):
         
         # Data Rows (only if data exists)
         if data:
-            for record in data:
-                row_idx += 1
-                for col_idx, header in enumerate(DRC_SUMMARY_HEADERS, 1):
-                    value = record.get(header, "")
-                    if header == "drc_id" and isinstance(value, ObjectId):
-                        value = str(value)
-                    if header == "created_dtm" and isinstance(value, datetime):
-                        value = value.strftime('%Y-%m-%d %H:%M:%S')
-                    if header == "proceed_on" and isinstance(value, datetime):
-                        value = value.strftime('%Y-%m-%d %H:%M:%S')
-                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                    cell.font = STYLES['Border_Style']['font']
-                    cell.border = STYLES['Border_Style']['border']
-                    cell.alignment = STYLES['Border_Style']['alignment']
+            row_idx = write_data_rows(ws, data, DRC_SUMMARY_HEADERS, row_idx)
         
         # Add AutoFilter to headers
         last_col_letter = get_column_letter(len(DRC_SUMMARY_HEADERS))
-        ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}"
+        set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}")
         
         # Auto-adjust columns based on headers (and data if present)
         for col_idx in range(1, len(DRC_SUMMARY_HEADERS) + 1):
@@ -200,5 +200,7 @@ def create_drc_summary_table(wb, data, filters=None):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating DRC summary sheet: {str(e)}", exc_info=True)
         return False
\ No newline at end of file
@@ -1,28 +1,109 @@
 import logging
 from datetime import datetime, timedelta
-from bson import ObjectId
 from openpyxl import Workbook
-from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.summary_stats import new_summary, write_summary_sheet
+from utils.memory_profile import mark_phase
+from utils.connectDB import get_shared_db
+from utils.report_query import fetch_rows
+from utils.row_stream import compact_rows
+from utils.config_loader import is_enabled
+from utils.fragment_cache import fetch_with_fragments
+from utils.time_budget import is_budget_timeout, register_output
+from pymongo import ASCENDING
 import os
-from pymongo import MongoClient
 
 
 logger = logging.getLogger('excel_data_writer')
 
+CPE_COLLECTION = "Incident"
+
 CPE_HEADERS = [
     "Incident_Id", "Incident_Status", "Account_Num", "Actions",
     "Created_Dtm"
 ]
 
 
-def excel_cpe_detail(from_date, to_date, drc_commision_rule):
+def build_cpe_query(from_date, to_date, drc_commision_rule):
+    """Validate the task parameters and build the Incident query for CPE incidents and the filters shown on the sheet"""
+    query = {"Actions": "collect CPE"}  # Fixed to only collect CPE
+
+    # Validate and apply drc_commision_rule filter
+    if drc_commision_rule is not None:
+        if drc_commision_rule == "PEO TV":
+            query["Drc commision rule"] = {"$regex": f"^{drc_commision_rule}$"}
+        elif drc_commision_rule == "BB":
+            query["Actions"] = drc_commision_rule   
+        else:
+            raise ValueError(f"Invalid drc_commision_rule '{drc_commision_rule}'. Must be 'PEO TV', 'BB'")
+
+
+    # Apply date range filter
+    if from_date is not None and to_date is not None:
+        try:
+            # Check if from_date and to_date are in correct YYYY-MM-DD format
+            from_dt = datetime.strptime(from_date, '%Y-%m-%d')
+            to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
+
+            # Validate date range
+            if to_dt < from_dt:
+                raise ValueError("to_date cannot be earlier than from_date")
+
+           # Construct query                  
+            query["Created_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
+
+        except ValueError as ve:
+            if str(ve).startswith("to_date"):
+                raise
+            raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
+
+    filters = {
+        "action": "collect CPE",
+        "drc_commision_rule": drc_commision_rule,
+        "date_range": (datetime.strptime(from_date, '%Y-%m-%d') if from_date else None,
+                    datetime.strptime(to_date, '%Y-%m-%d') if to_date else None)
+    }
+    return query, filters
+
+
+def write_cpe_export(incidents, filters, summary=False):
+    """Export CPE incidents to a timestamped workbook"""
+    output_dir = "exports"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"cpe_incidents_{timestamp}.xlsx"
+    filepath = os.path.join(output_dir, filename)
+    os.makedirs(output_dir, exist_ok=True)
+
+    mark_phase("cells")
+    wb = Workbook()
+    wb.remove(wb.active)
+    totals = new_summary(CPE_HEADERS) if summary else None
+
+    if not create_cpe_table(wb, incidents, filters, totals):
+        raise Exception("Failed to create CPE incident sheet")
+
+    if totals is not None:
+        write_summary_sheet(wb, "CPE INCIDENT REPORT", totals)
+
+    mark_phase("save")
+    register_output(filepath)
+    wb.save(filepath)
+
+    if not incidents:
+        print("No CPE incidents found matching the selected filters. Exported empty table to: {filepath}")
+    else:
+        print(f"\nSuccessfully exported {len(incidents)} CPE records to: {filepath}")
+    return filepath
+
+
+def excel_cpe_detail(from_date, to_date, drc_commision_rule, server_format=None, fragment_cache=None, summary=None,
+                   fragment_mutable_days=None, fragment_max_age=None):
     """Fetch and export 'collect CPE' incidents from Incident collection"""
 
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["DRS"]
+        db = get_shared_db()
         logger.info(f"Connected to MongoDB successfully | DRS")
 
     except Exception as err:
@@ -32,67 +113,23 @@ def excel_cpe_detail(from_date, to_date, drc_commision_rule):
     else:
 
         try:
-            collection = db["Incident"]
-            query = {"Actions": "collect CPE"}  # Fixed to only collect CPE
-
-            # Validate and apply drc_commision_rule filter
-            if drc_commision_rule is not None:
-                if drc_commision_rule == "PEO TV":
-                    query["Drc commision rule"] = {"$regex": f"^{drc_commision_rule}$"}
-                elif drc_commision_rule == "BB":
-                    query["Actions"] = drc_commision_rule   
-                else:
-                    raise ValueError(f"Invalid drc_commision_rule '{drc_commision_rule}'. Must be 'PEO TV', 'BB'")
-                     
-
-            # Apply date range filter
-            if from_date is not None and to_date is not None:
-                try:
-                    # Check if from_date and to_date are in correct YYYY-MM-DD format
-                    from_dt = datetime.strptime(from_date, '%Y-%m-%d')
-                    to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-                    
-                    # Validate date range
-                    if to_dt < from_dt:
-                        raise ValueError("to_date cannot be earlier than from_date")
-                    
-                   # Construct query                  
-                    query["Created_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
-
-                except ValueError as ve:
-                    if str(ve).startswith("to_date"):
-                        raise
-                    raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
-
+            collection = db[CPE_COLLECTION]
+            query, filters = build_cpe_query(from_date, to_date, drc_commision_rule)
 
             logger.info(f"Executing query on Incident for CPE: {query}")
-            incidents = list(collection.find(query))
+            mark_phase("fetch")
+            if is_enabled(fragment_cache) and not is_enabled(server_format):
+                # Reuse cached days of earlier runs over overlapping date ranges
+                incidents = fetch_with_fragments(
+                    lambda day_query: fetch_rows(collection, day_query, CPE_HEADERS, sort=[("Created_Dtm", ASCENDING)]),
+                    "cpe_incidents", query, CPE_HEADERS,
+                    mutable_days=fragment_mutable_days, max_age=fragment_max_age
+                )
+            else:
+                incidents = list(compact_rows(fetch_rows(collection, query, CPE_HEADERS, is_enabled(server_format)), CPE_HEADERS))
             logger.info(f"Found {len(incidents)} matching CPE incidents")
 
-            # Export to Excel
-            output_dir = "exports"
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"cpe_incidents_{timestamp}.xlsx"
-            filepath = os.path.join(output_dir, filename)
-            os.makedirs(output_dir, exist_ok=True)
-
-            wb = Workbook()
-            wb.remove(wb.active)
-
-            if not create_cpe_table(wb, incidents, {
-                "action": "collect CPE",
-                "drc_commision_rule": drc_commision_rule,
-                "date_range": (datetime.strptime(from_date, '%Y-%m-%d') if from_date else None,
-                            datetime.strptime(to_date, '%Y-%m-%d') if to_date else None)
-            }):
-                raise Exception("Failed to create CPE incident sheet")
-
-            wb.save(filepath)
-
-            if not incidents:
-                print("No CPE incidents found matching the selected filters. Exported empty table to: {filepath}")
-            else:
-                print(f"\nSuccessfully exported {len(incidents)} CPE records to: {filepath}")
+            write_cpe_export(incidents, filters, is_enabled(summary))
             return True
 
         except ValueError as ve:
@@ -100,16 +137,15 @@ def excel_cpe_detail(from_date, to_date, drc_commision_rule):
             print(f"Error: {str(ve)}")
             return False
         except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
             logger.error(f"Export failed: {str(e)}", exc_info=True)
             print(f"\nError during export: {str(e)}")
             return False
-        finally:
-            if client:
-                client.close()
-                logger.info("MongoDB connection closed")
     
 
-def create_cpe_table(wb, data, filters=None):
+def create_cpe_table(wb, data, filters=None, summary=None):
     """Create formatted Excel sheet with CPE incident data"""
     try:
         ws = wb.create_sheet(title="CPE INCIDENT REPORT")
@@ -171,23 +207,12 @@ def create_cpe_table(wb, data, filters=None):
             ws.column_dimensions[get_column_letter(col_idx)].width = 20
         
         # Data Rows
-        for record in data:
-            row_idx += 1
-            for col_idx, header in enumerate(CPE_HEADERS, 1):
-                value = record.get(header, "")
-                if header == "Incident_Id" and isinstance(value, ObjectId):
-                    value = str(value)
-                if header == "Created_Dtm" and isinstance(value, datetime):
-                    value = value.strftime('%Y-%m-%d %H:%M:%S')
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.font = STYLES['Border_Style']['font']
-                cell.border = STYLES['Border_Style']['border']
-                cell.alignment = STYLES['Border_Style']['alignment']
+        row_idx = write_data_rows(ws, data, CPE_HEADERS, row_idx, summary=summary)
         
         # Add AutoFilter to all columns
         if data:
             last_col_letter = get_column_letter(len(CPE_HEADERS))
-            ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{row_idx}"
+            set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{row_idx}")
         
         # Auto-adjust columns
         for col_idx in range(1, len(CPE_HEADERS) + 1):
@@ -202,5 +227,7 @@ def create_cpe_table(wb, data, filters=None):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating CPE sheet: {str(e)}", exc_info=True)
         return False
\ No newline at end of file
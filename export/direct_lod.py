@@ -1,27 +1,106 @@
 import logging
 from datetime import datetime, timedelta
-from bson import ObjectId
 from openpyxl import Workbook
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.summary_stats import new_summary, write_summary_sheet
+from utils.memory_profile import mark_phase
+from utils.connectDB import get_shared_db
+from utils.report_query import fetch_rows
+from utils.row_stream import compact_rows
+from utils.config_loader import is_enabled
+from utils.time_budget import is_budget_timeout, register_output
 import os
-from pymongo import MongoClient
 
 logger = logging.getLogger('excel_data_writer')
 
+DIRECT_LOD_COLLECTION = "Incident"
+
 DIRECT_LOD_HEADERS = [
     "Incident_Id", "Incident_Status", "Account_Num", "Amount",
     "Source_Type"
 ]
 
 
-def excel_direct_lod_detail(from_date, to_date, drc_commision_rule):
+def build_direct_lod_query(from_date, to_date, drc_commision_rule):
+    """Validate the task parameters and build the Incident query for direct LOD incidents and the filters shown on the sheet"""
+    query = {"Incident_Status": "Direct LOD"}
+
+    # Validate and apply drc_commision_rule filter
+    if drc_commision_rule is not None:
+        if drc_commision_rule == "PEO TV":
+            query["drc_commision_rule"] = {"$regex": f"^{drc_commision_rule}$"}
+        elif drc_commision_rule == "BB":
+            query["drc_commision_rule"] = drc_commision_rule
+        else:
+            raise ValueError(f"Invalid drc_commision_rule '{drc_commision_rule}'. Must be 'PEO TV', 'BB'")
+
+
+
+    # Apply date range filter
+    if from_date is not None and to_date is not None:
+        try:
+            # Check if from_date and to_date are in correct YYYY-MM-DD format
+            from_dt = datetime.strptime(from_date, '%Y-%m-%d')
+            to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
+
+            # Validate date range
+            if to_dt < from_dt:
+                raise ValueError("to_date cannot be earlier than from_date")
+
+            # Construct query                  
+            query["Created_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
+
+        except ValueError as ve:
+            if str(ve).startswith("to_date"):
+                raise
+            raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
+
+    filters = {
+        "incident_status": "Direct LOD",
+        "drc_commision_rule": drc_commision_rule,
+        "date_range": (datetime.strptime(from_date, '%Y-%m-%d') if from_date else None,
+                    datetime.strptime(to_date, '%Y-%m-%d') if to_date else None)
+    }
+    return query, filters
+
+
+def write_direct_lod_export(incidents, filters, summary=False):
+    """Export direct LOD incidents to a timestamped workbook"""
+    output_dir = "exports"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"direct_lod_incidents_task_{timestamp}.xlsx"
+    filepath = os.path.join(output_dir, filename)
+    os.makedirs(output_dir, exist_ok=True)
+
+    mark_phase("cells")
+    wb = Workbook()
+    wb.remove(wb.active)
+    totals = new_summary(DIRECT_LOD_HEADERS) if summary else None
+
+    if not create_direct_lod_table(wb, incidents, filters, totals):
+        raise Exception(f"Failed to create direct LOD incident sheet")
+
+    if totals is not None:
+        write_summary_sheet(wb, "DIRECT LOD INCIDENTS REPORT", totals)
+
+    mark_phase("save")
+    register_output(filepath)
+    wb.save(filepath)
+    if not incidents:
+        print(f"No direct LOD incidents found for selected filters. Exported empty table to: {filepath}")
+    else:
+        print(f"\nSuccessfully exported {len(incidents)} direct LOD records to: {filepath}")
+    return filepath
+
+
+def excel_direct_lod_detail(from_date, to_date, drc_commision_rule, server_format=None, summary=None):
     """Fetch and export 'direct LOD' incidents from Incident collection with a given Task_Id"""
 
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["DRS"]
+        db = get_shared_db()
         logger.info(f"Connected to MongoDB successfully | DRS")
 
     except Exception as err:
@@ -31,67 +110,15 @@ def excel_direct_lod_detail(from_date, to_date, drc_commision_rule):
 
     else:
         try:
-            collection = db["Incident"]
-            query = {"Incident_Status": "Direct LOD"}
-
-            # Validate and apply drc_commision_rule filter
-            if drc_commision_rule is not None:
-                if drc_commision_rule == "PEO TV":
-                    query["drc_commision_rule"] = {"$regex": f"^{drc_commision_rule}$"}
-                elif drc_commision_rule == "BB":
-                    query["drc_commision_rule"] = drc_commision_rule
-                else:
-                    raise ValueError(f"Invalid drc_commision_rule '{drc_commision_rule}'. Must be 'PEO TV', 'BB'")
-            
+            collection = db[DIRECT_LOD_COLLECTION]
+            query, filters = build_direct_lod_query(from_date, to_date, drc_commision_rule)
 
-
-            # Apply date range filter
-            if from_date is not None and to_date is not None:
-                try:
-                    # Check if from_date and to_date are in correct YYYY-MM-DD format
-                    from_dt = datetime.strptime(from_date, '%Y-%m-%d')
-                    to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-                    
-                    # Validate date range
-                    if to_dt < from_dt:
-                        raise ValueError("to_date cannot be earlier than from_date")
-
-                    # Construct query                  
-                    query["Created_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
-
-                except ValueError as ve:
-                    if str(ve).startswith("to_date"):
-                        raise
-                    raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
-                
-                
             logger.info(f"Executing query on Incident for direct LOD : {query}")
-            incidents = list(collection.find(query))
+            mark_phase("fetch")
+            incidents = list(compact_rows(fetch_rows(collection, query, DIRECT_LOD_HEADERS, is_enabled(server_format)), DIRECT_LOD_HEADERS))
             logger.info(f"Found {len(incidents)} matching direct LOD incident")
 
-            # Export to Excel
-            output_dir = "exports"
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"direct_lod_incidents_task_{timestamp}.xlsx"
-            filepath = os.path.join(output_dir, filename)
-            os.makedirs(output_dir, exist_ok=True)
-
-            wb = Workbook()
-            wb.remove(wb.active)
-
-            if not create_direct_lod_table(wb, incidents, {
-                "incident_status": "Direct LOD",
-                "drc_commision_rule": drc_commision_rule,
-                "date_range": (datetime.strptime(from_date, '%Y-%m-%d') if from_date else None,
-                            datetime.strptime(to_date, '%Y-%m-%d') if to_date else None)
-            }):
-                raise Exception(f"Failed to create direct LOD incident sheet")
-
-            wb.save(filepath)
-            if not incidents:
-                print(f"No direct LOD incidents found for selected filters. Exported empty table to: {filepath}")
-            else:
-                print(f"\nSuccessfully exported {len(incidents)} direct LOD records to: {filepath}")
+            write_direct_lod_export(incidents, filters, is_enabled(summary))
             return False
 
         except ValueError as ve:
@@ -99,15 +126,14 @@ def excel_direct_lod_detail(from_date, to_date, drc_commision_rule):
             print(f"Error: {str(ve)}")
             return False
         except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
             logger.error(f"Export failed: {str(e)}", exc_info=True)
             print(f"\nError during export: {str(e)}")
             return False
-        finally:
-            if client:
-                client.close()
-                logger.info("MongoDB connection closed")
 
-def create_direct_lod_table(wb, data, filters=None):
+def create_direct_lod_table(wb, data, filters=None, summary=None):
     """Create formatted Excel sheet for Direct LOD incidents"""
     try:
         ws = wb.create_sheet(title="DIRECT LOD INCIDENTS REPORT")
@@ -179,23 +205,12 @@ def create_direct_lod_table(wb, data, filters=None):
             ws.column_dimensions[get_column_letter(col_idx)].width = 20
         
         # Data Rows
-        for record in data:
-            row_idx += 1
-            for col_idx, header in enumerate(DIRECT_LOD_HEADERS, 1):
-                value = record.get(header, "")
-                if header == "Incident_Id" and isinstance(value, ObjectId):
-                    value = str(value)
-                if header == "Created_Dtm" and isinstance(value, datetime):
-                    value = value.strftime('%Y-%m-%d %H:%M:%S')
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.font = STYLES['Border_Style']['font']
-                cell.border = STYLES['Border_Style']['border']
-                cell.alignment = STYLES['Border_Style']['alignment']
+        row_idx = write_data_rows(ws, data, DIRECT_LOD_HEADERS, row_idx, summary=summary)
         
         # Add AutoFilter to all columns
         if data:
             last_col_letter = get_column_letter(len(DIRECT_LOD_HEADERS))
-            ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{row_idx}"
+            set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{row_idx}")
         
         # Auto-adjust columns
         for col_idx in range(1, len(DIRECT_LOD_HEADERS) + 1):
@@ -210,5 +225,7 @@ def create_direct_lod_table(wb, data, filters=None):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating Direct LOD sheet: {str(e)}", exc_info=True)
         return False
\ No newline at end of file
@@ -1,15 +1,15 @@
 import logging
 from datetime import datetime, timedelta
-from bson import ObjectId
 from openpyxl import Workbook
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.time_budget import is_budget_timeout, limit_cursor, register_output
 import os
-from utils.connectDB import get_db_connection
+from utils.connectDB import get_db_connection, get_shared_db
 import logging.config
 from utils.config_loader import get_config
-from pymongo import MongoClient
 
 logger = logging.getLogger('excel_data_writer')
 
@@ -20,8 +20,7 @@ DRC_ASSIGN_BATCH_APPROVAL_HEADERS = [
 def excel_drc_assign_batch_approval(approver_ref):
     """Fetch and export DRC assign batch approval data based on validated approver_ref parameter"""
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["DRS"]
+        db = get_shared_db()
         logger.info(f"Connected to MongoDB successfully | DRS")
 
     except Exception as err:
@@ -42,7 +41,7 @@ def excel_drc_assign_batch_approval(approver_ref):
 
             # Log and execute query
             logger.info(f"Executing query: {query}")
-            batches = list(collection.find(query))
+            batches = list(limit_cursor(collection.find(query)))
             logger.info(f"Found {len(batches)} matching batch records")
 
             # Export to Excel even if no batches are found
@@ -60,6 +59,8 @@ def excel_drc_assign_batch_approval(approver_ref):
             }):
                 raise Exception("Failed to create DRC assign batch approval sheet")
 
+            register_output(filepath)
+
             wb.save(filepath)
             if not batches:
                 print(f"No batch approval records found matching the selected filters. Exported empty table to: {filepath}")
@@ -72,13 +73,12 @@ def excel_drc_assign_batch_approval(approver_ref):
             print(f"Error: {str(ve)}")
             return False
         except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
             logger.error(f"Export failed: {str(e)}", exc_info=True)
             print(f"\nError during export: {str(e)}")
             return False
-        finally:
-            if client:
-                client.close()
-                logger.info("MongoDB connection closed")
 
 def create_drc_assign_batch_approval_table(wb, data, filters=None):
     """Create formatted Excel sheet with DRC assign batch approval data, including headers even if no data"""
@@ -121,22 +121,11 @@ def create_drc_assign_batch_approval_table(wb, data, filters=None):
         
         # Data Rows (only if data exists)
         if data:
-            for record in data:
-                row_idx += 1
-                for col_idx, header in enumerate(DRC_ASSIGN_BATCH_APPROVAL_HEADERS, 1):
-                    value = record.get(header, "")
-                    if header == "Batch_id" and isinstance(value, ObjectId):
-                        value = str(value)
-                    if header == "created_dtm" and isinstance(value, datetime):
-                        value = value.strftime('%Y-%m-%d %H:%M:%S')
-                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                    cell.font = STYLES['Border_Style']['font']
-                    cell.border = STYLES['Border_Style']['border']
-                    cell.alignment = STYLES['Border_Style']['alignment']
+            row_idx = write_data_rows(ws, data, DRC_ASSIGN_BATCH_APPROVAL_HEADERS, row_idx)
         
         # Add AutoFilter to headers
         last_col_letter = get_column_letter(len(DRC_ASSIGN_BATCH_APPROVAL_HEADERS))
-        ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}"
+        set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}")
         
         # Auto-adjust columns based on headers (and data if present)
         for col_idx in range(1, len(DRC_ASSIGN_BATCH_APPROVAL_HEADERS) + 1):
@@ -151,5 +140,7 @@ def create_drc_assign_batch_approval_table(wb, data, filters=None):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating sheet: {str(e)}", exc_info=True)
         return False
\ No newline at end of file
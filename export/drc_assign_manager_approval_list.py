@@ -1,12 +1,13 @@
 import logging
 from datetime import datetime, timedelta
-from bson import ObjectId
 from openpyxl import Workbook
-from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.time_budget import aggregate_options, is_budget_timeout, register_output
+from utils.connectDB import get_shared_db
+from utils.row_stream import CountingIterator
 import os
-from pymongo import MongoClient
 
 
 logger = logging.getLogger('excel_data_writer')
@@ -18,11 +19,63 @@ APPROVAL_HEADERS = [
 
 VALID_APPROVAL_TYPES = ["a1", "a2"]
 
+def build_approval_pipeline(approval_type, from_date, to_date):
+    """Validate the task parameters and build the aggregation that flattens matching approve entries into rows"""
+    case_match = {}
+
+     # Check date range
+    if from_date is not None and to_date is not None:
+        try:
+            # Check if from_date and to_date are in correct YYYY-MM-DD format
+            from_dt = datetime.strptime(from_date, '%Y-%m-%d')
+            to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
+            
+            # Validate date range
+            if to_dt < from_dt:
+                raise ValueError("to_date cannot be earlier than from_date")
+            
+           # Construct query                  
+            case_match["Created_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
+
+        except ValueError as ve:
+            if str(ve).startswith("to_date"):
+                raise
+            raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
+
+
+    # approval_type lives inside the approve array, so it is matched on the embedded field
+    if approval_type is not None:
+        if approval_type not in VALID_APPROVAL_TYPES:
+            raise ValueError(f"Invalid approval type '{approval_type}'. Must be 'a1', 'a2'")
+        # Only cases holding at least one matching approval reach the $unwind
+        case_match["approve.approval_type"] = approval_type
+
+    pipeline = [
+        {"$match": case_match},
+        {"$unwind": "$approve"},
+    ]
+
+    # Drop the other approvals of a matching case once the array is unwound
+    if approval_type is not None:
+        pipeline.append({"$match": {"approve.approval_type": approval_type}})
+
+    pipeline.append({"$project": {
+        "_id": 0,
+        "case_id": 1,
+        "created_dtm": 1,
+        "created_by": 1,
+        "approval_type": "$approve.approval_type",
+        "approve_status": "$approve.approve_status",
+        "approved_by": "$approve.approved_by",
+        "remark": "$approve.remark"
+    }})
+    return pipeline
+
+
 def excel_drc_approval_detail(approval_type, from_date, to_date):
     """Fetch and export DRC assign manager approval details from Case_details collection"""
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["DRS"]
+        db = get_shared_db()
         logger.info(f"Connected to MongoDB successfully | DRS")
 
     except Exception as err:
@@ -33,86 +86,38 @@ def excel_drc_approval_detail(approval_type, from_date, to_date):
     else:
         try:
             collection = db["Case_details"]
-            query = {}
-
-             # Check date range
-            if from_date is not None and to_date is not None:
-                try:
-                    # Check if from_date and to_date are in correct YYYY-MM-DD format
-                    from_dt = datetime.strptime(from_date, '%Y-%m-%d')
-                    to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-                    
-                    # Validate date range
-                    if to_dt < from_dt:
-                        raise ValueError("to_date cannot be earlier than from_date")
-                    
-                   # Construct query                  
-                    query["Created_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
-
-                except ValueError as ve:
-                    if str(ve).startswith("to_date"):
-                        raise
-                    raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
-
-
-            # If approval_type is provided, filter within the approve array
-            if approval_type is not None:
-                if approval_type == "a1":
-                    query["approval_type"] = {"$regex": f"^{approval_type}$"}
-                elif approval_type == "a2":
-                    query["Incident_Status"] = approval_type
-                else:
-                    raise ValueError(f"Invalid approval type '{approval_type}'. Must be 'a1', 'a2'")
-
-
-                    
-
-            logger.info(f"Executing query on Case_details: {query}")
-            cases = list(collection.find(query))
-            logger.info(f"Found {len(cases)} matching case records")
-
-            if not cases:
-                print("No approval records found matching the selected filters")
-                return False
+            pipeline = build_approval_pipeline(approval_type, from_date, to_date)
 
-            # Process data to flatten the approve array
-            processed_data = []
-            for case in cases:
-                for approval in case.get("approve", []):
-                    if not approval_type or approval.get("approval_type") == approval_type:
-                        processed_data.append({
-                            "case_id": case.get("case_id", ""),
-                            "created_dtm": case.get("created_dtm", ""),
-                            "created_by": case.get("created_by", ""),
-                            "approval_type": approval.get("approval_type", ""),
-                            "approve_status": approval.get("approve_status", ""),
-                            "approved_by": approval.get("approved_by", ""),
-                            "remark": approval.get("remark", "")
-                        })
-
-            if not processed_data:
-                print("No approval records found within the approve array matching the filters")
-                return False
-
-            # Export to Excel
-            output_dir= "exports" 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"drc_approval_{timestamp}.xlsx"
-            filepath = os.path.join(output_dir, filename)
-            os.makedirs(output_dir, exist_ok=True)
+            # Flattened approval rows are streamed from the cursor straight into the sheet
+            logger.info(f"Executing aggregation on Case_details: {pipeline}")
+            approvals = CountingIterator(collection.aggregate(pipeline, allowDiskUse=True, **aggregate_options()))
 
             wb = Workbook()
             wb.remove(wb.active)
 
-            if not create_approval_table(wb, processed_data, {
+            if not create_approval_table(wb, approvals, {
                 "approval_type": approval_type,
                 "date_range": (datetime.strptime(from_date, '%Y-%m-%d') if from_date else None,
                             datetime.strptime(to_date, '%Y-%m-%d') if to_date else None)
             }):
                 raise Exception("Failed to create DRC approval sheet")
 
+            logger.info(f"Found {approvals.count} matching approval records")
+            if not approvals.count:
+                print("No approval records found matching the selected filters")
+                return False
+
+            # Export to Excel
+            output_dir= "exports" 
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"drc_approval_{timestamp}.xlsx"
+            filepath = os.path.join(output_dir, filename)
+            os.makedirs(output_dir, exist_ok=True)
+
+            register_output(filepath)
+
             wb.save(filepath)
-            print(f"\nSuccessfully exported {len(processed_data)} DRC approval records to: {filepath}")
+            print(f"\nSuccessfully exported {approvals.count} DRC approval records to: {filepath}")
             return True
 
         except ValueError as ve:
@@ -120,6 +125,9 @@ def excel_drc_approval_detail(approval_type, from_date, to_date):
             print(f"Error: {str(ve)}")
             return False
         except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
             logger.error(f"Export failed: {str(e)}", exc_info=True)
             print(f"\nError during export: {str(e)}")
             return False
@@ -177,23 +185,12 @@ def create_approval_table(wb, data, filters=None):
             ws.column_dimensions[get_column_letter(col_idx)].width = 20
         
         # Data Rows
-        for record in data:
-            row_idx += 1
-            for col_idx, header in enumerate(APPROVAL_HEADERS, 1):
-                value = record.get(header, "")
-                if header == "case_id" and isinstance(value, ObjectId):
-                    value = str(value)
-                if header == "created_dtm" and isinstance(value, datetime):
-                    value = value.strftime('%Y-%m-%d %H:%M:%S')
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.font = STYLES['Border_Style']['font']
-                cell.border = STYLES['Border_Style']['border']
-                cell.alignment = STYLES['Border_Style']['alignment']
+        row_idx = write_data_rows(ws, data, APPROVAL_HEADERS, row_idx)
         
         # Add AutoFilter to all columns
-        if data:
+        if row_idx > header_row:
             last_col_letter = get_column_letter(len(APPROVAL_HEADERS))
-            ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{row_idx}"
+            set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{row_idx}")
         
         # Auto-adjust columns
         for col_idx in range(1, len(APPROVAL_HEADERS) + 1):
@@ -208,5 +205,7 @@ def create_approval_table(wb, data, filters=None):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating DRC approval sheet: {str(e)}", exc_info=True)
         return False
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""DRC summary detail with per-RTOM and per-DRC totals from one $facet aggregation, written to one workbook"""
+
+import logging
+import os
+from datetime import datetime
+from openpyxl import Workbook
+from utils.connectDB import get_shared_db
+from utils.memory_profile import mark_phase
+from utils.stream_writers import append_streaming_row, start_streaming_sheet
+from utils.time_budget import aggregate_options, is_budget_timeout, register_output
+from export.drc_summary_rtom import DRC_SUMMARY_HEADERS as RTOM_TOTAL_HEADERS, VALID_DRC_VALUES
+
+logger = logging.getLogger('excel_data_writer')
+
+DRC_SUMMARY_COLLECTION = "Case_Distribution_DRC_Summary"
+
+DETAIL_HEADERS = [
+    "created_dtm", "drc_id", "drc", "rtom", "case_count", "tot_arrease", "proceed_on"
+]
+
+DRC_TOTAL_HEADERS = [
+    "drc_id", "drc", "case_count", "tot_arrease"
+]
+
+# $facet returns its branches in one document, which the server caps at 16 MB;
+# detail rows past this many are left out and the sheet says so
+DETAIL_ROW_LIMIT = 50000
+
+
+def build_drc_combined_query(drc=None, case_distribution_batch_id=None):
+    """Validate the task parameters and build the Case_Distribution_DRC_Summary query and the filters shown on the sheets"""
+    query = {}
+    if drc is not None and str(drc).strip():
+        if drc not in VALID_DRC_VALUES:
+            raise ValueError(f"Invalid drc '{drc}'. Must be one of: {', '.join(VALID_DRC_VALUES)}")
+        query["drc"] = drc
+
+    if case_distribution_batch_id is not None and str(case_distribution_batch_id).strip():
+        batch_id = str(case_distribution_batch_id).strip()
+        if not batch_id.isdigit():
+            raise ValueError(f"Invalid case_distribution_batch_id '{case_distribution_batch_id}'. Must be a number")
+        query["case_distribution_batch_id"] = int(batch_id)
+
+    filters = {"drc": drc, "case_distribution_batch_id": case_distribution_batch_id}
+    return query, filters
+
+
+def _totals_branch(group_fields):
+    """$facet branch summing case_count and tot_arrease per value of group_fields"""
+    return [
+        {"$group": {
+            "_id": {field: f"${field}" for field in group_fields},
+            "case_count": {"$sum": "$case_count"},
+            "tot_arrease": {"$sum": "$tot_arrease"},
+        }},
+        {"$project": dict({field: f"$_id.{field}" for field in group_fields}, _id=0, case_count=1, tot_arrease=1)},
+        {"$sort": {field: 1 for field in group_fields}},
+    ]
+
+
+def build_drc_combined_pipeline(query):
+    """One aggregation returning the detail rows and both sets of totals as $facet branches over the matched documents"""
+    pipeline = [{"$match": query}] if query else []
+    pipeline.append({"$facet": {
+        # One row more than the limit shows whether detail rows were left out
+        "detail": [
+            {"$sort": {"created_dtm": 1, "_id": 1}},
+            {"$limit": DETAIL_ROW_LIMIT + 1},
+            {"$project": dict({header: 1 for header in DETAIL_HEADERS}, _id=0)},
+        ],
+        "by_rtom": _totals_branch(RTOM_TOTAL_HEADERS[:1]),
+        "by_drc": _totals_branch(DRC_TOTAL_HEADERS[:2]),
+    }})
+    return pipeline
+
+
+def excel_drc_combined_report(drc=None, case_distribution_batch_id=None):
+    """Fetch DRC summary detail, RTOM totals and DRC totals in one round trip and export them as sheets of one workbook"""
+    try:
+        db = get_shared_db()
+        logger.info(f"Connected to MongoDB successfully | DRS")
+
+    except Exception as err:
+        print("Connection error")
+        logger.error(f"MongoDB connection failed: {str(err)}")
+        return False
+    else:
+        try:
+            query, filters = build_drc_combined_query(drc, case_distribution_batch_id)
+            pipeline = build_drc_combined_pipeline(query)
+
+            logger.info(f"Executing $facet aggregation on {DRC_SUMMARY_COLLECTION}: {query}")
+            mark_phase("fetch")
+            facets = next(db[DRC_SUMMARY_COLLECTION].aggregate(pipeline, allowDiskUse=True, **aggregate_options()), {})
+            detail = facets.get("detail", [])
+            detail_filters = filters
+            if len(detail) > DETAIL_ROW_LIMIT:
+                detail = detail[:DETAIL_ROW_LIMIT]
+                detail_filters = dict(filters, detail_rows=f"first {DETAIL_ROW_LIMIT}; use the DRC summary export for all rows")
+                logger.warning(f"Combined DRC report detail stopped at {DETAIL_ROW_LIMIT} rows; totals cover every row")
+            logger.info(f"Found {len(detail)} detail rows, {len(facets.get('by_rtom', []))} RTOMs and {len(facets.get('by_drc', []))} DRCs")
+
+            output_dir = "exports"
+            os.makedirs(output_dir, exist_ok=True)
+            filepath = os.path.join(output_dir, f"drc_combined_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+
+            mark_phase("cells")
+            wb = Workbook(write_only=True)
+            views = [
+                ("Detail", "DRC SUMMARY REPORT", DETAIL_HEADERS, detail, detail_filters),
+                ("By RTOM", "RTOM TOTALS", RTOM_TOTAL_HEADERS, facets.get("by_rtom", []), filters),
+                ("By DRC", "DRC TOTALS", DRC_TOTAL_HEADERS, facets.get("by_drc", []), filters),
+            ]
+            for sheet_title, title, headers, rows, sheet_filters in views:
+                ws, columns = start_streaming_sheet(wb, title, headers, sheet_filters, sheet_title)
+                for row in rows:
+                    append_streaming_row(ws, columns, row)
+
+            mark_phase("save")
+            register_output(filepath)
+            wb.save(filepath)
+            print(f"\nSuccessfully exported {len(detail)} DRC summary records with RTOM and DRC totals to: {filepath}")
+            return True
+
+        except ValueError as ve:
+            logger.error(f"Validation error: {str(ve)}")
+            print(f"Error: {str(ve)}")
+            return False
+        except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
+            logger.error(f"Export failed: {str(e)}", exc_info=True)
+            print(f"\nError during export: {str(e)}")
+            return False
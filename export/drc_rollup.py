@@ -0,0 +1,221 @@
+"""Incrementally maintained case_count / tot_arrease rollup of case_distribution_drc per batch, DRC and RTOM"""
+
+import logging
+from datetime import datetime
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from pymongo import ASCENDING, DeleteOne, ReplaceOne, UpdateOne
+from utils.connectDB import get_shared_db
+from utils.time_budget import budget_expired
+
+logger = logging.getLogger('excel_data_writer')
+
+SOURCE_COLLECTION = "case_distribution_drc"
+
+# One document per (case_distribution_batch_id, drc_id, rtom) holding case_count and tot_arrease
+ROLLUP_COLLECTION = "Case_Distribution_DRC_Rollup"
+
+# The contribution each source document last made to the rollup, so updates and deletes can be reversed
+LEDGER_COLLECTION = "Case_Distribution_DRC_Rollup_Ledger"
+
+# Watermark and change stream resume token
+STATE_COLLECTION = "Export_State"
+STATE_ID = "case_distribution_drc_rollup"
+
+ROLLUP_KEYS = ("case_distribution_batch_id", "drc_id", "rtom")
+
+# Source documents applied per bulk write
+ROLLUP_BATCH_SIZE = 1000
+
+# How long a change stream read waits for new events before the run ends
+CHANGE_STREAM_WAIT_MS = 1000
+
+VALID_MODES = ("watermark", "change_stream")
+
+
+def _amount(value):
+    """arrease as a float; missing or non-numeric values count as 0"""
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _contribution(document):
+    """The rollup key, DRC name and amount a source document adds"""
+    return {
+        "key": {field: document.get(field) for field in ROLLUP_KEYS},
+        "drc": document.get("drc"),
+        "arrease": _amount(document.get("arrease")),
+    }
+
+
+def _transaction_supported(client):
+    return client.topology_description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+
+def _apply_changes(db, changes, state_update, session=None):
+    """Apply a batch of (source _id, document or None for a delete) to the rollup, ledger and state
+
+    Each change is compared with the ledger, so replaying a change that was already
+    applied adds nothing.
+    """
+    ledger = db[LEDGER_COLLECTION]
+    previous = {entry["_id"]: entry for entry in ledger.find({"_id": {"$in": [source_id for source_id, _ in changes]}}, session=session)}
+
+    deltas = {}
+    # DRC name of each key, carried on the rollup document so reports can group by drc_id and drc
+    names = {}
+    ledger_ops = []
+    for source_id, document in changes:
+        old = previous.get(source_id)
+        new = _contribution(document) if document is not None else None
+        if old == (dict(new, _id=source_id) if new else None):
+            continue
+
+        for entry, sign in ((old, -1), (new, 1)):
+            if entry is None:
+                continue
+            key = tuple(entry["key"][field] for field in ROLLUP_KEYS)
+            delta = deltas.setdefault(key, [0, 0.0])
+            delta[0] += sign
+            delta[1] += sign * entry["arrease"]
+
+        if new is not None and new.get("drc") is not None:
+            names[tuple(new["key"][field] for field in ROLLUP_KEYS)] = new["drc"]
+        if new is None:
+            ledger_ops.append(DeleteOne({"_id": source_id}))
+        else:
+            ledger_ops.append(ReplaceOne({"_id": source_id}, dict(new, _id=source_id), upsert=True))
+        previous[source_id] = dict(new, _id=source_id) if new else None
+
+    now = datetime.now()
+    rollup_ops = [
+        UpdateOne(
+            {"_id": dict(zip(ROLLUP_KEYS, key))},
+            {"$inc": {"case_count": count, "tot_arrease": amount},
+             "$set": dict(zip(ROLLUP_KEYS, key), updated_dtm=now, **({"drc": names[key]} if key in names else {}))},
+            upsert=True,
+        )
+        # A zero delta still writes when it carries the DRC name, such as a source re-read before names were kept
+        for key, (count, amount) in deltas.items() if count or amount or key in names
+    ]
+
+    if rollup_ops:
+        db[ROLLUP_COLLECTION].bulk_write(rollup_ops, ordered=False, session=session)
+    if ledger_ops:
+        ledger.bulk_write(ledger_ops, ordered=False, session=session)
+    db[STATE_COLLECTION].update_one({"_id": STATE_ID}, {"$set": state_update}, upsert=True, session=session)
+    return len(rollup_ops)
+
+
+def apply_changes(db, changes, state_update):
+    """Apply a batch atomically when the deployment supports transactions"""
+    client = db.client
+    if not _transaction_supported(client):
+        return _apply_changes(db, changes, state_update)
+
+    with client.start_session() as session:
+        return session.with_transaction(lambda s: _apply_changes(db, changes, state_update, s))
+
+
+def catch_up_by_watermark(db, state):
+    """Apply source documents inserted after the saved _id watermark, returning how many were read
+
+    New documents are found by _id, so this picks up inserts only; updates and
+    deletes need the change stream mode.
+    """
+    watermark = state.get("last_id")
+    query = {"_id": {"$gt": watermark}} if watermark is not None else {}
+    read = 0
+
+    while not budget_expired():
+        batch = list(db[SOURCE_COLLECTION].find(query).sort("_id", ASCENDING).limit(ROLLUP_BATCH_SIZE))
+        if not batch:
+            break
+        apply_changes(db, [(document["_id"], document) for document in batch], {"last_id": batch[-1]["_id"]})
+        read += len(batch)
+        query = {"_id": {"$gt": batch[-1]["_id"]}}
+
+    return read
+
+
+def follow_change_stream(db, state):
+    """Apply inserts, updates and deletes from the change stream until it is idle, returning how many were read"""
+    options = {"full_document": "updateLookup", "max_await_time_ms": CHANGE_STREAM_WAIT_MS}
+    if state.get("resume_token"):
+        options["resume_after"] = state["resume_token"]
+
+    read = 0
+    with db[SOURCE_COLLECTION].watch(**options) as stream:
+        # Without a saved token the stream starts now, so bring the rollup up to date first;
+        # inserts seen by both paths are applied once thanks to the ledger
+        if not state.get("resume_token"):
+            read += catch_up_by_watermark(db, state)
+
+        changes = []
+        while stream.alive and not budget_expired():
+            event = stream.try_next()
+            if event is not None:
+                source_id = event["documentKey"]["_id"]
+                if event["operationType"] == "delete":
+                    changes.append((source_id, None))
+                elif event["operationType"] in ("insert", "update", "replace"):
+                    # A document deleted before its update was looked up has no fullDocument
+                    changes.append((source_id, event.get("fullDocument")))
+
+            if changes and (event is None or len(changes) >= ROLLUP_BATCH_SIZE):
+                apply_changes(db, changes, {"resume_token": stream.resume_token})
+                read += len(changes)
+                changes = []
+            if event is None:
+                break
+
+    return read
+
+
+def update_drc_rollup(mode="watermark"):
+    """Bring the DRC/RTOM rollup up to date with case_distribution_drc, returning True on success"""
+    try:
+        if mode not in VALID_MODES:
+            raise ValueError(f"Invalid mode '{mode}'. Must be one of: {', '.join(VALID_MODES)}")
+
+        db = get_shared_db()
+        state = db[STATE_COLLECTION].find_one({"_id": STATE_ID}) or {}
+
+        if mode == "change_stream":
+            read = follow_change_stream(db, state)
+        else:
+            read = catch_up_by_watermark(db, state)
+
+        logger.info(f"DRC rollup updated from {read} {SOURCE_COLLECTION} changes ({mode})")
+        return True
+
+    except ValueError as ve:
+        logger.error(f"Validation error: {str(ve)}")
+        print(f"Error: {str(ve)}")
+        return False
+    except Exception as e:
+        logger.error(f"DRC rollup update failed: {str(e)}", exc_info=True)
+        return False
+
+
+def summarize_rollup(db, group_fields, match=None):
+    """Sum the rollup over group_fields, returning rows with those fields plus case_count and tot_arrease"""
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline += [
+        {"$group": {
+            "_id": {field: f"${field}" for field in group_fields},
+            "case_count": {"$sum": "$case_count"},
+            "tot_arrease": {"$sum": "$tot_arrease"},
+        }},
+        {"$project": dict({field: f"$_id.{field}" for field in group_fields}, _id=0, case_count=1, tot_arrease=1)},
+        {"$sort": {field: 1 for field in group_fields}},
+    ]
+    return list(db[ROLLUP_COLLECTION].aggregate(pipeline))
@@ -1,11 +1,15 @@
 import logging
 from datetime import datetime
-from bson import ObjectId
 from openpyxl import Workbook
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.time_budget import is_budget_timeout, limit_cursor, register_output
 import os
+from utils.connectDB import get_shared_db
+from utils.config_loader import is_enabled
+from export.drc_rollup import summarize_rollup
 
 logger = logging.getLogger('excel_data_writer')
 
@@ -15,21 +19,23 @@ DRC_SUMMARY_HEADERS = [
 
 VALID_DRC_VALUES = ["D1", "D2"]
 
-def excel_drc_summary_rtom_detail(db, drc=None, output_path="exports"):
-    """Fetch and export DRC summary details from Case_Distribution_DRC_Summary collection"""
+def excel_drc_summary_rtom_detail(db=None, drc=None, output_path="exports", rollup=None, drc_id=None):
+    """Fetch and export DRC summary details from Case_Distribution_DRC_Summary collection, or per RTOM from the incremental rollup"""
     try:
-        collection = db["Case_Distribution_DRC_Summary"]
-        query = {}
+        # Tasks run from coreConfig.ini pass no db, so use the shared client
+        if db is None:
+            db = get_shared_db()
 
-        # Validate and apply drc filter
-        if drc and drc.strip():
-            if drc not in VALID_DRC_VALUES:
-                raise ValueError(f"Invalid drc '{drc}'. Must be one of: {', '.join(VALID_DRC_VALUES)}")
-            query["drc"] = drc
-
-        logger.info(f"Executing query on Case_Distribution_DRC_Summary: {query}")
-        summaries = list(collection.find(query))
-        logger.info(f"Found {len(summaries)} matching DRC summary records")
+        if is_enabled(rollup):
+            # The rollup is keyed by drc_id, as in case_distribution_drc
+            match = {}
+            if drc_id is not None:
+                match["drc_id"] = int(drc_id) if str(drc_id).isdigit() else drc_id
+            summaries = summarize_rollup(db, ["rtom"], match)
+            drc = f"drc_id {drc_id}" if drc_id is not None else None
+            logger.info(f"Read {len(summaries)} RTOM rows from the DRC rollup: {match}")
+        else:
+            summaries = fetch_drc_summaries(db, drc)
 
         if not summaries:
             print("No DRC summary records found matching the selected filters")
@@ -47,6 +53,8 @@ def excel_drc_summary_rtom_detail(db, drc=None, output_path="exports"):
         if not create_drc_summary_rtom_table(wb, summaries, {"drc": drc}):
             raise Exception("Failed to create DRC summary sheet")
 
+        register_output(filepath)
+
         wb.save(filepath)
         print(f"\nSuccessfully exported {len(summaries)} DRC summary records to: {filepath}")
         return True
@@ -56,10 +64,29 @@ def excel_drc_summary_rtom_detail(db, drc=None, output_path="exports"):
         print(f"Error: {str(ve)}")
         return False
     except Exception as e:
+        # A budget stop is reported once, by the task runner
+        if is_budget_timeout(e):
+            return False
         logger.error(f"Export failed: {str(e)}", exc_info=True)
         print(f"\nError during export: {str(e)}")
         return False
 
+def fetch_drc_summaries(db, drc=None):
+    """Read the prebuilt Case_Distribution_DRC_Summary rows, optionally for one drc"""
+    collection = db["Case_Distribution_DRC_Summary"]
+    query = {}
+
+    # Validate and apply drc filter
+    if drc and drc.strip():
+        if drc not in VALID_DRC_VALUES:
+            raise ValueError(f"Invalid drc '{drc}'. Must be one of: {', '.join(VALID_DRC_VALUES)}")
+        query["drc"] = drc
+
+    logger.info(f"Executing query on Case_Distribution_DRC_Summary: {query}")
+    summaries = list(limit_cursor(collection.find(query)))
+    logger.info(f"Found {len(summaries)} matching DRC summary records")
+    return summaries
+
 def create_drc_summary_rtom_table(wb, data, filters=None):
     """Create formatted Excel sheet with DRC summary data"""
     try:
@@ -101,19 +128,12 @@ def create_drc_summary_rtom_table(wb, data, filters=None):
             ws.column_dimensions[get_column_letter(col_idx)].width = 20
         
         # Data Rows
-        for record in data:
-            row_idx += 1
-            for col_idx, header in enumerate(DRC_SUMMARY_HEADERS, 1):
-                value = record.get(header, "")
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.font = STYLES['Border_Style']['font']
-                cell.border = STYLES['Border_Style']['border']
-                cell.alignment = STYLES['Border_Style']['alignment']
+        row_idx = write_data_rows(ws, data, DRC_SUMMARY_HEADERS, row_idx)
         
         # Add AutoFilter to all columns
         if data:
             last_col_letter = get_column_letter(len(DRC_SUMMARY_HEADERS))
-            ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{row_idx}"
+            set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{row_idx}")
         
         # Auto-adjust columns
         for col_idx in range(1, len(DRC_SUMMARY_HEADERS) + 1):
@@ -128,6 +148,8 @@ def create_drc_summary_rtom_table(wb, data, filters=None):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating DRC summary sheet: {str(e)}", exc_info=True)
         return False
 
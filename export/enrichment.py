@@ -0,0 +1,186 @@
+"""Extra export columns joined from related collections, by server-side $lookup or from per-batch LRU dimension caches"""
+
+import logging
+from collections import OrderedDict, namedtuple
+
+from utils.report_query import fetch_rows
+from utils.row_stream import compact_rows
+from utils.time_budget import limit_cursor
+
+logger = logging.getLogger('excel_data_writer')
+
+# collection: collection the columns come from
+# local_field: export column holding the join key; it may be a column added by an earlier dimension
+# foreign_field: field of collection matched against it
+# fields: columns added to the export, from the first matching document
+Dimension = namedtuple("Dimension", ["collection", "local_field", "foreign_field", "fields"])
+
+# Keyed by the names used in a task's enrich option; dimensions are joined in the order listed there
+DIMENSIONS = {
+    "case_distribution": Dimension(
+        "case_distribution_drc", "Account_Num", "account_num",
+        ("case_distribution_batch_id", "drc_id", "rtom"),
+    ),
+    "drc": Dimension(
+        "Case_Distribution_DRC_Summary", "drc_id", "drc_id",
+        ("drc",),
+    ),
+}
+
+# lookup joins on the server in the report's own aggregation; cache resolves keys
+# in the export process, each distinct key once per batch
+ENRICH_MODES = ("lookup", "cache")
+DEFAULT_ENRICH_MODE = "cache"
+
+# Rows collected before their keys are resolved with one $in query per dimension
+ENRICH_BATCH_ROWS = 1000
+
+# Keys kept per dimension cache; the least recently used are dropped past this
+DIMENSION_CACHE_ENTRIES = 100000
+
+# Caches of the batch running in this process, keyed by database and dimension name
+_caches = {}
+
+
+def parse_enrichment(enrich, enrich_mode=None):
+    """Return (dimension names, mode) for a task's enrich and enrich_mode options, raising ValueError on unknown values"""
+    names = [name.strip() for name in str(enrich or "").split(",") if name.strip()]
+    unknown = [name for name in names if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Invalid enrich '{', '.join(unknown)}'. Must be one of: {', '.join(DIMENSIONS)}")
+    mode = (enrich_mode or DEFAULT_ENRICH_MODE).strip().lower()
+    if mode not in ENRICH_MODES:
+        raise ValueError(f"Invalid enrich_mode '{enrich_mode}'. Must be one of: {', '.join(ENRICH_MODES)}")
+    return names, mode
+
+
+def enriched_headers(headers, names):
+    """The report headers followed by the columns the dimensions add; a column the report already has is kept as is"""
+    columns = list(headers)
+    for name in names:
+        dimension = DIMENSIONS[name]
+        if dimension.local_field not in columns:
+            raise ValueError(f"enrich {name} joins on {dimension.local_field}, which this report does not have")
+        columns.extend(field for field in dimension.fields if field not in columns)
+    return columns
+
+
+def build_lookup_stages(names):
+    """Aggregation stages adding each dimension's fields from the first matching document of its collection"""
+    stages = []
+    for name in names:
+        dimension = DIMENSIONS[name]
+        joined = f"_{name}"
+        stages.append({"$lookup": {
+            "from": dimension.collection,
+            "localField": dimension.local_field,
+            "foreignField": dimension.foreign_field,
+            "as": joined,
+        }})
+        stages.append({"$addFields": {field: {"$arrayElemAt": [f"${joined}.{field}", 0]} for field in dimension.fields}})
+        stages.append({"$project": {joined: 0}})
+    return stages
+
+
+class DimensionCache:
+    """Least recently used field values of one dimension, keyed by its foreign field
+
+    Keys without a matching document are cached as well, so a miss costs one query per batch too.
+    """
+
+    def __init__(self, collection, dimension, max_entries=DIMENSION_CACHE_ENTRIES):
+        self.collection = collection
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.queries = 0
+
+    def get_many(self, keys):
+        """Field values for each key, reading the keys not cached with $in queries"""
+        missing = []
+        for key in keys:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                missing.append(key)
+
+        found = {}
+        for start in range(0, len(missing), ENRICH_BATCH_ROWS):
+            chunk = missing[start:start + ENRICH_BATCH_ROWS]
+            projection = dict({field: 1 for field in self.dimension.fields}, **{self.dimension.foreign_field: 1, "_id": 0})
+            cursor = limit_cursor(self.collection.find({self.dimension.foreign_field: {"$in": chunk}}, projection))
+            self.queries += 1
+            for document in cursor:
+                # The first matching document wins, as in the $lookup mode
+                found.setdefault(document.get(self.dimension.foreign_field),
+                                 tuple(document.get(field, "") for field in self.dimension.fields))
+
+        values = {key: self.entries[key] for key in keys if key in self.entries}
+        for key in missing:
+            values[key] = self.entries[key] = found.get(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return values
+
+
+def dimension_cache(db, name):
+    """The batch's cache for a dimension, created on first use"""
+    cache_key = (db.name, name)
+    if cache_key not in _caches:
+        dimension = DIMENSIONS[name]
+        _caches[cache_key] = DimensionCache(db[dimension.collection], dimension)
+    return _caches[cache_key]
+
+
+def clear_dimension_caches():
+    """Drop every dimension cache, so the next batch reads current values"""
+    _caches.clear()
+
+
+def _enrich_batch(db, rows, headers, names):
+    columns = list(headers)
+    rows = [list(row[:len(headers)]) for row in rows]
+    for name in names:
+        dimension = DIMENSIONS[name]
+        key_index = columns.index(dimension.local_field)
+        added = [(index, field) for index, field in enumerate(dimension.fields) if field not in columns]
+        # Blank keys match nothing, so they are not looked up
+        keys = list({row[key_index] for row in rows if row[key_index] not in (None, "")})
+        values = dimension_cache(db, name).get_many(keys)
+        for row in rows:
+            found = values.get(row[key_index]) if row[key_index] not in (None, "") else None
+            row.extend(found[index] if found else "" for index, _ in added)
+        columns.extend(field for _, field in added)
+    return [tuple(row) for row in rows]
+
+
+def enrich_rows(db, rows, headers, names):
+    """Yield compact rows of headers extended with the dimension columns, resolving keys ENRICH_BATCH_ROWS rows at a time
+
+    Each distinct key is read once per batch, however many rows or tasks share it.
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ENRICH_BATCH_ROWS:
+            yield from _enrich_batch(db, batch, headers, names)
+            batch = []
+    if batch:
+        yield from _enrich_batch(db, batch, headers, names)
+
+    for name in names:
+        cache = dimension_cache(db, name)
+        logger.info(f"Enrichment {name}: {cache.queries} queries, {cache.hits} cache hits, {len(cache.entries)} keys cached")
+
+
+def fetch_enriched_rows(db, collection_name, query, headers, names, mode, server_format=False):
+    """Run a report query with the dimension columns added, by $lookup stages or from the dimension caches
+
+    Rows are documents in lookup mode and compact rows of enriched_headers in cache mode.
+    """
+    if mode == "lookup":
+        return fetch_rows(db[collection_name], query, enriched_headers(headers, names), server_format, stages=build_lookup_stages(names))
+    rows = fetch_rows(db[collection_name], query, headers, server_format)
+    return enrich_rows(db, compact_rows(rows, headers), headers, names)
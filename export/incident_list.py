@@ -3,30 +3,125 @@
 
 import logging
 from datetime import datetime, timedelta
-from bson import ObjectId
 from openpyxl import Workbook
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.summary_stats import new_summary, write_summary_sheet
+from utils.memory_profile import mark_phase
+from utils.report_query import fetch_rows
+from utils.row_stream import compact_rows
 import os
-from utils.connectDB import get_db_connection
+from utils.connectDB import get_db_connection, get_shared_db
 import logging.config
-from utils.config_loader import get_config
-from pymongo import MongoClient
+from utils.config_loader import get_config, is_enabled
+from pymongo import ASCENDING
+from utils.checkpoint import checkpoint_key, fetch_with_checkpoint, clear_checkpoint
+from utils.fragment_cache import fetch_with_fragments
+from utils.time_budget import is_budget_timeout, register_output
 
 logger = logging.getLogger('excel_data_writer')
 
+INCIDENT_COLLECTION = "Incident_log"
+
 INCIDENT_HEADERS = [
     "Task_Id", "Incident_Id", "Account_Num", "Incident_Status", "Actions",
     "Monitor_Months", "Created_By", "Created_Dtm", "Source_Type"
 ]
 
-def excel_incident_detail(action_type, status, from_date, to_date):
+def build_incident_query(action_type, status, from_date, to_date):
+    """Validate the task parameters and build the Incident_log query and the filters shown on the sheet"""
+    query = {} 
+
+    # Check each parameter and build query
+    # Check action_type
+    if action_type is not None:
+        if action_type == "collect arrears and CPE":
+            query["Actions"] = {"$regex": f"^{action_type}$"}
+        elif action_type == "collect arrears":
+            query["Actions"] = action_type
+        elif action_type == "collect CPE":
+            query["Actions"] = action_type
+        else:
+            raise ValueError(f"Invalid action_type '{action_type}'. Must be 'collect arrears and CPE', 'collect arrears', or 'collect CPE'")
+    
+
+    # Check status
+    if status is not None:
+        if status == "Incident Open":
+            query["Incident_Status"] = {"$regex": f"^{status}$"}
+        elif status == "Incident close":
+            query["Incident_Status"] = status
+        elif status == "Incident reject":
+            query["Incident_Status"] = status
+        else:
+            raise ValueError(f"Invalid status '{status}'. Must be 'Incident Open', 'Incident Close', or 'Incident Reject'")
+
+
+
+    # Check date range
+    if from_date is not None and to_date is not None:
+        try:
+            # Check if from_date and to_date are in correct YYYY-MM-DD format
+            from_dt = datetime.strptime(from_date, '%Y-%m-%d')
+            to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
+            
+            # Validate date range
+            if to_dt < from_dt:
+                raise ValueError("to_date cannot be earlier than from_date")
+            
+           # Construct query                  
+            query["Created_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
+
+        except ValueError as ve:
+            if str(ve).startswith("to_date"):
+                raise
+            raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
+
+    filters = {
+        "action": action_type,
+        "status": status,
+        "date_range": (from_dt if from_date is not None else None, to_dt if to_date is not None else None)
+    }
+    return query, filters
+
+
+def write_incident_export(incidents, filters, summary=False):
+    """Export incidents to a timestamped workbook, even if no incidents are found"""
+    output_dir = "exports"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"incidents_details_{timestamp}.xlsx"
+    filepath = os.path.join(output_dir, filename)
+    os.makedirs(output_dir, exist_ok=True)
+
+    mark_phase("cells")
+    wb = Workbook()
+    wb.remove(wb.active)
+    totals = new_summary(INCIDENT_HEADERS) if summary else None
+
+    if not create_incident_table(wb, incidents, filters, totals):
+        raise Exception("Failed to create incident sheet")
+
+    if totals is not None:
+        write_summary_sheet(wb, "INCIDENT REPORT", totals)
+
+    mark_phase("save")
+    register_output(filepath)
+    wb.save(filepath)
+    if not incidents:
+        print("No incidents found matching the selected filters. Exported empty table to: {filepath}")
+    else:
+        print(f"\nSuccessfully exported {len(incidents)} records to: {filepath}")
+    return filepath
+
+
+def excel_incident_detail(action_type, status, from_date, to_date, server_format=None, checkpoint=None, fragment_cache=None, summary=None,
+                          fragment_mutable_days=None, fragment_max_age=None, checkpoint_max_age=None):
 
     """Fetch and export incidents with a fixed Task_Id of 20 based on validated parameters"""
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["DRS"]
+        db = get_shared_db()
         logger.info(f"Connected to MongoDB successfully | DRS")
 
     except Exception as err:
@@ -36,104 +131,49 @@ def excel_incident_detail(action_type, status, from_date, to_date):
     else:
         try:   
 
-            collection = db["Incident_log"]
-            query = {} 
-
-            # Check each parameter and build query
-            # Check action_type
-            if action_type is not None:
-                if action_type == "collect arrears and CPE":
-                    query["Actions"] = {"$regex": f"^{action_type}$"}
-                elif action_type == "collect arrears":
-                    query["Actions"] = action_type
-                elif action_type == "collect CPE":
-                    query["Actions"] = action_type
-                else:
-                    raise ValueError(f"Invalid action_type '{action_type}'. Must be 'collect arrears and CPE', 'collect arrears', or 'collect CPE'")
-            
+            collection = db[INCIDENT_COLLECTION]
+            query, filters = build_incident_query(action_type, status, from_date, to_date)
 
-            # Check status
-            if status is not None:
-                if status == "Incident Open":
-                    query["Incident_Status"] = {"$regex": f"^{status}$"}
-                elif status == "Incident close":
-                    query["Incident_Status"] = status
-                elif status == "Incident reject":
-                    query["Incident_Status"] = status
-                else:
-                    raise ValueError(f"Invalid status '{status}'. Must be 'Incident Open', 'Incident Close', or 'Incident Reject'")
-
-
-
-            # Check date range
-            if from_date is not None and to_date is not None:
-                try:
-                    # Check if from_date and to_date are in correct YYYY-MM-DD format
-                    from_dt = datetime.strptime(from_date, '%Y-%m-%d')
-                    to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-                    
-                    # Validate date range
-                    if to_dt < from_dt:
-                        raise ValueError("to_date cannot be earlier than from_date")
-                    
-                   # Construct query                  
-                    query["Created_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
-
-                except ValueError as ve:
-                    if str(ve).startswith("to_date"):
-                        raise
-                    raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
-
-            
             # Log and execute query
             logger.info(f"Executing query: {query}")
-            incidents = list(collection.find(query))  # Fetch data into an array
+            mark_phase("fetch")
+            if is_enabled(checkpoint):
+                # Iterate in _id order and persist progress so a failed run resumes where it stopped
+                checkpoint_id = checkpoint_key("incidents_details", query, INCIDENT_HEADERS, is_enabled(server_format))
+                incidents = fetch_with_checkpoint(
+                    lambda resume_query: fetch_rows(collection, resume_query, INCIDENT_HEADERS, is_enabled(server_format), sort=[("_id", ASCENDING)]),
+                    query, checkpoint_id, INCIDENT_HEADERS, max_age=checkpoint_max_age
+                )
+            elif is_enabled(fragment_cache) and not is_enabled(server_format):
+                # Reuse cached days of earlier runs over overlapping date ranges
+                incidents = fetch_with_fragments(
+                    lambda day_query: fetch_rows(collection, day_query, INCIDENT_HEADERS, sort=[("Created_Dtm", ASCENDING)]),
+                    "incidents_details", query, INCIDENT_HEADERS,
+                    mutable_days=fragment_mutable_days, max_age=fragment_max_age
+                )
+            else:
+                incidents = list(compact_rows(fetch_rows(collection, query, INCIDENT_HEADERS, is_enabled(server_format)), INCIDENT_HEADERS))  # Fetch data into an array
             logger.info(f"Found {len(incidents)} matching incidents")
 
-           
-
-            # Export to Excel even if no incidents are found
-            output_dir = "exports"
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"incidents_details_{timestamp}.xlsx"
-            filepath = os.path.join(output_dir, filename)
-            os.makedirs(output_dir, exist_ok=True)
-
-            wb = Workbook()
-            wb.remove(wb.active)
-
-            if not create_incident_table(wb, incidents, {
-                "action": action_type,
-                "status": status,
-                "date_range": (from_dt if from_date is not None else None, to_dt if to_date is not None else None)
-            }):
-                raise Exception("Failed to create incident sheet")
-
-            wb.save(filepath)
-            if not incidents:
-                print("No incidents found matching the selected filters. Exported empty table to: {filepath}")
-            else:
-                print(f"\nSuccessfully exported {len(incidents)} records to: {filepath}")
+            write_incident_export(incidents, filters, is_enabled(summary))
+            if is_enabled(checkpoint):
+                clear_checkpoint(checkpoint_id)
             return True
 
-            
-
-
         except ValueError as ve:
             logger.error(f"Validation error: {str(ve)}")
             print(f"Error: {str(ve)}")
             return False
         except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
             logger.error(f"Export failed: {str(e)}", exc_info=True)
             print(f"\nError during export: {str(e)}")
             return False
-        finally:
-            if client:
-                client.close()
-                logger.info("MongoDB connection closed")
 
 
-def create_incident_table(wb, data, filters=None):
+def create_incident_table(wb, data, filters=None, summary=None):
     """Create formatted Excel sheet with filtered incident data, including headers even if no data"""
     try:
         ws = wb.create_sheet(title="INCIDENT REPORT")
@@ -194,22 +234,11 @@ def create_incident_table(wb, data, filters=None):
         
         # Data Rows (only if data exists)
         if data:
-            for record in data:
-                row_idx += 1
-                for col_idx, header in enumerate(INCIDENT_HEADERS, 1):
-                    value = record.get(header, "")
-                    if header == "Incident_Id" and isinstance(value, ObjectId):
-                        value = str(value)
-                    if header == "Created_Dtm" and isinstance(value, datetime):
-                        value = value.strftime('%Y-%m-%d %H:%M:%S')
-                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                    cell.font = STYLES['Border_Style']['font']
-                    cell.border = STYLES['Border_Style']['border']
-                    cell.alignment = STYLES['Border_Style']['alignment']
+            row_idx = write_data_rows(ws, data, INCIDENT_HEADERS, row_idx, summary=summary)
         
         # Add AutoFilter to headers
         last_col_letter = get_column_letter(len(INCIDENT_HEADERS))
-        ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}"
+        set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}")
         
         # Auto-adjust columns based on headers (and data if present)
         for col_idx in range(1, len(INCIDENT_HEADERS) + 1):
@@ -224,5 +253,7 @@ def create_incident_table(wb, data, filters=None):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating sheet: {str(e)}", exc_info=True)
         return False
\ No newline at end of file
@@ -1,28 +1,70 @@
 import logging
-from datetime import datetime, timedelta
-from bson import ObjectId
+from datetime import datetime
 from openpyxl import Workbook
-from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.summary_stats import new_summary, write_summary_sheet
+from utils.memory_profile import mark_phase
+from utils.report_query import fetch_rows
+from utils.row_stream import compact_rows
 import os
-from utils.connectDB import get_db_connection
-import logging.config
-from utils.config_loader import get_config
-from pymongo import MongoClient
+from utils.connectDB import get_shared_db
+from utils.config_loader import is_enabled
+from pymongo import ASCENDING
+from utils.checkpoint import checkpoint_key, fetch_with_checkpoint, clear_checkpoint
+from utils.parallel_fetch import fetch_rows_partitioned
+from utils.time_budget import is_budget_timeout, register_output
 
 logger = logging.getLogger('excel_data_writer')
 
+INCIDENT_OPEN_FOR_DISTRIBUTION_COLLECTION = "Incident_log"
+
 INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS = [
     "Id", "Incident_Status", "Account_Num", "Actions",
     "Arrears", "Source_Type"
 ]
 
-def excel_incident_open_distribution():
+def build_incident_open_distribution_query():
+    """Build the Incident_log query for open incidents; this report takes no filter parameters"""
+    query = {"Incident_Status": "Incident Open"}  # Fixed filter for open incidents
+    return query, None
+
+
+def write_incident_open_distribution_export(incidents, filters=None, summary=False):
+    """Export open incidents to a timestamped workbook, even if no incidents are found"""
+    output_dir = "exports"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"incident_open_distribution_{timestamp}.xlsx"
+    filepath = os.path.join(output_dir, filename)
+    os.makedirs(output_dir, exist_ok=True)
+
+    mark_phase("cells")
+    wb = Workbook()
+    wb.remove(wb.active)
+    totals = new_summary(INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS) if summary else None
+
+    if not create_incident_open_distribution_table(wb, incidents, summary=totals):
+        raise Exception("Failed to create incident open distribution sheet")
+
+    if totals is not None:
+        write_summary_sheet(wb, "OPEN INCIDENT DISTRIBUTION", totals)
+
+    mark_phase("save")
+    register_output(filepath)
+    wb.save(filepath)
+    if not incidents:
+        print(f"No open incidents found. Exported empty table to: {filepath}")
+    else:
+        print(f"\nSuccessfully exported {len(incidents)} records to: {filepath}")
+    return filepath
+
+
+def excel_incident_open_distribution(server_format=None, checkpoint=None, parallel_partitions=None, partition_field=None, split_method=None, summary=None,
+                                     checkpoint_max_age=None):
     """Fetch and export all open incidents for distribution without parameter filtering"""
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["DRS"]
+        db = get_shared_db()
         logger.info(f"Connected to MongoDB successfully | DRS")
 
     except Exception as err:
@@ -31,44 +73,43 @@ def excel_incident_open_distribution():
         return False
     else:
         try:
-            collection = db["Incident_log"]
-            query = {"Incident_Status": "Incident Open"}  # Fixed filter for open incidents
+            collection = db[INCIDENT_OPEN_FOR_DISTRIBUTION_COLLECTION]
+            query, filters = build_incident_open_distribution_query()
 
             # Log and execute query
             logger.info(f"Executing query: {query}")
-            incidents = list(collection.find(query))
+            mark_phase("fetch")
+            if is_enabled(checkpoint):
+                # Iterate in _id order and persist progress so a failed run resumes where it stopped
+                checkpoint_id = checkpoint_key("incident_open_distribution", query, INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS, is_enabled(server_format))
+                incidents = fetch_with_checkpoint(
+                    lambda resume_query: fetch_rows(collection, resume_query, INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS, is_enabled(server_format), sort=[("_id", ASCENDING)]),
+                    query, checkpoint_id, INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS, max_age=checkpoint_max_age
+                )
+            elif parallel_partitions is not None and int(parallel_partitions) > 1:
+                # Read disjoint ranges on parallel cursors and concatenate them in range order
+                incidents = list(fetch_rows_partitioned(
+                    collection, query, INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS, int(parallel_partitions),
+                    partition_field or "_id", split_method or "sample", is_enabled(server_format)
+                ))
+            else:
+                incidents = list(compact_rows(fetch_rows(collection, query, INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS, is_enabled(server_format)), INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS))
             logger.info(f"Found {len(incidents)} matching incidents")
 
-            # Export to Excel even if no incidents are found
-            output_dir = "exports"
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"incident_open_distribution_{timestamp}.xlsx"
-            filepath = os.path.join(output_dir, filename)
-            os.makedirs(output_dir, exist_ok=True)
-
-            wb = Workbook()
-            wb.remove(wb.active)
-
-            if not create_incident_open_distribution_table(wb, incidents):
-                raise Exception("Failed to create incident open distribution sheet")
-
-            wb.save(filepath)
-            if not incidents:
-                print(f"No open incidents found. Exported empty table to: {filepath}")
-            else:
-                print(f"\nSuccessfully exported {len(incidents)} records to: {filepath}")
+            write_incident_open_distribution_export(incidents, filters, is_enabled(summary))
+            if is_enabled(checkpoint):
+                clear_checkpoint(checkpoint_id)
             return True
 
         except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
             logger.error(f"Export failed: {str(e)}", exc_info=True)
             print(f"\nError during export: {str(e)}")
             return False
-        finally:
-            if client:
-                client.close()
-                logger.info("MongoDB connection closed")
 
-def create_incident_open_distribution_table(wb, data):
+def create_incident_open_distribution_table(wb, data, summary=None):
     """Create formatted Excel sheet with open incident distribution data, including headers even if no data"""
     try:
         ws = wb.create_sheet(title="OPEN INCIDENT DISTRIBUTION")
@@ -94,20 +135,11 @@ def create_incident_open_distribution_table(wb, data):
         
         # Data Rows (only if data exists)
         if data:
-            for record in data:
-                row_idx += 1
-                for col_idx, header in enumerate(INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS, 1):
-                    value = record.get(header, "")
-                    if header == "Id" and isinstance(value, ObjectId):
-                        value = str(value)
-                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                    cell.font = STYLES['Border_Style']['font']
-                    cell.border = STYLES['Border_Style']['border']
-                    cell.alignment = STYLES['Border_Style']['alignment']
+            row_idx = write_data_rows(ws, data, INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS, row_idx, summary=summary)
         
         # Add AutoFilter to headers
         last_col_letter = get_column_letter(len(INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS))
-        ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}"
+        set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}")
         
         # Auto-adjust columns based on headers (and data if present)
         for col_idx in range(1, len(INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS) + 1):
@@ -122,5 +154,7 @@ def create_incident_open_distribution_table(wb, data):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating sheet: {str(e)}", exc_info=True)
         return False
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""Fan a registered report out to one workbook or sheet per drc, rtom or commission rule from a single cursor pass"""
+
+import logging
+import os
+import re
+from datetime import datetime
+
+from openpyxl import Workbook
+
+from export.enrichment import DIMENSIONS, enriched_headers, fetch_enriched_rows, parse_enrichment
+from export.report_registry import get_report_spec, split_engine_options
+from utils.config_loader import is_enabled
+from utils.memory_profile import mark_phase
+from utils.progress import report_progress
+from utils.report_query import fetch_rows
+from utils.stream_writers import append_streaming_row, start_streaming_sheet
+from utils.time_budget import CHECK_INTERVAL, check_deadline, register_output
+
+logger = logging.getLogger('excel_data_writer')
+
+# Keys a report can be partitioned by; each is read from the document field the report's
+# partition_fields maps it to, or from the enriched column of the same name
+PARTITION_KEYS = ("drc", "rtom", "drc_commision_rule")
+
+# One workbook per partition value, or one workbook with a sheet per value
+PARTITION_OUTPUTS = ("files", "sheets")
+
+# Label for documents without the partition field
+UNASSIGNED_PARTITION = "Unassigned"
+
+# Excel sheet titles are at most 31 characters and exclude these
+_SHEET_TITLE_INVALID = re.compile(r'[\[\]:*?/\\]')
+
+
+def validate_partition_options(partition_by, partition_output=None):
+    """Raise ValueError for an unknown partition key or output layout"""
+    if partition_by not in PARTITION_KEYS:
+        raise ValueError(f"Invalid partition_by '{partition_by}'. Must be one of: {', '.join(PARTITION_KEYS)}")
+    if partition_output and partition_output not in PARTITION_OUTPUTS:
+        raise ValueError(f"Invalid partition_output '{partition_output}'. Must be one of: {', '.join(PARTITION_OUTPUTS)}")
+
+
+def partition_source(spec, partition_by, enrich=()):
+    """The column partition_by is read from: the document field the report maps it to, or a column added by enrich
+
+    Raises ValueError when the report produces neither, rather than writing every row to one unassigned partition.
+    """
+    field = (spec.partition_fields or {}).get(partition_by)
+    if field:
+        # Enriched rows carry only the report and dimension columns
+        if enrich:
+            raise ValueError(f"partition_by {partition_by} reads the '{field}' field of the documents and cannot be combined with enrich")
+        return field
+    if partition_by in enriched_headers(spec.headers, enrich):
+        return partition_by
+    dimensions = [name for name, dimension in DIMENSIONS.items() if partition_by in dimension.fields]
+    raise ValueError(f"{spec.file_prefix} cannot be partitioned by {partition_by}: its documents have no such field"
+                     + (f"; enrich with {' or '.join(dimensions)} to add it" if dimensions else ""))
+
+
+def partition_label(value):
+    """Text naming a partition value in file names, sheet titles and filters"""
+    if value is None or value == "":
+        return UNASSIGNED_PARTITION
+    return str(value).strip() or UNASSIGNED_PARTITION
+
+
+def _file_label(label, taken):
+    """A file name part for label, distinct from the labels already used on a case-insensitive filesystem"""
+    base = re.sub(r'[^A-Za-z0-9_-]+', '_', label).strip('_') or UNASSIGNED_PARTITION
+    file_label = base
+    number = 2
+    while file_label.lower() in taken:
+        file_label = f"{base}_{number}"
+        number += 1
+    taken.add(file_label.lower())
+    return file_label
+
+
+def _sheet_title(label, taken):
+    """A valid sheet title for label, distinct from the titles already used"""
+    base = _SHEET_TITLE_INVALID.sub('_', label)[:31] or UNASSIGNED_PARTITION
+    title = base
+    number = 2
+    while title.lower() in taken:
+        suffix = f" ({number})"
+        title = f"{base[:31 - len(suffix)]}{suffix}"
+        number += 1
+    taken.add(title.lower())
+    return title
+
+
+def run_partitioned_export(db, function_name, params):
+    """Stream a registered report into one output per partition value, returning True on success
+
+    The query runs once. Each row is routed by its partition_source column to a
+    write-only sheet opened the first time that value is seen, so every writer
+    streams at the same time and memory does not grow with the row count.
+    """
+    spec = get_report_spec(function_name)
+    query_params, options = split_engine_options(params)
+    partition_by = options.get("partition_by")
+    partition_output = options.get("partition_output") or "files"
+    validate_partition_options(partition_by, partition_output)
+    enrich, enrich_mode = parse_enrichment(options.get("enrich"), options.get("enrich_mode"))
+    source = partition_source(spec, partition_by, enrich)
+    query, filters = spec.build_query(**query_params)
+
+    output_dir = "exports"
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    server_format = is_enabled(options.get("server_format"))
+    headers = enriched_headers(spec.headers, enrich)
+
+    logger.info(f"Executing query (partitioned by {partition_by} into {partition_output}): {query}")
+    mark_phase("stream")
+    if enrich:
+        rows = fetch_enriched_rows(db, spec.collection, query, spec.headers, enrich, enrich_mode, server_format)
+    else:
+        # The partition field is fetched alongside the report's columns but not written
+        headers_read = headers if source in headers else headers + [source]
+        rows = fetch_rows(db[spec.collection], query, headers_read, server_format)
+
+    # Enriched rows in cache mode are compact rows of headers; documents are read by field name
+    source_index = headers.index(source) if source in headers else None
+    workbooks = {}
+    writers = {}
+    sheet_titles = set()
+    counts = {}
+    count = 0
+    report_progress(count)
+    for count, record in enumerate(rows, 1):
+        if count % CHECK_INTERVAL == 0:
+            check_deadline()
+            report_progress(count)
+
+        label = partition_label(record[source_index] if isinstance(record, tuple) else record.get(source))
+        writer = writers.get(label)
+        if writer is None:
+            partition_filters = dict(filters or {}, **{partition_by: label})
+            if partition_output == "sheets":
+                if None not in workbooks:
+                    workbooks[None] = Workbook(write_only=True)
+                wb = workbooks[None]
+                writer = start_streaming_sheet(wb, spec.title, headers, partition_filters, _sheet_title(label, sheet_titles))
+            else:
+                wb = workbooks[label] = Workbook(write_only=True)
+                writer = start_streaming_sheet(wb, spec.title, headers, partition_filters)
+            writers[label] = writer
+            counts[label] = 0
+
+        append_streaming_row(*writer, record)
+        counts[label] += 1
+    report_progress(count)
+
+    mark_phase("save")
+    if not workbooks:
+        # No rows: still produce the report with its header
+        workbooks[None] = Workbook(write_only=True)
+        start_streaming_sheet(workbooks[None], spec.title, headers, filters)
+
+    paths = []
+    file_labels = set()
+    for label, wb in workbooks.items():
+        if label is None:
+            path = os.path.join(output_dir, f"{spec.file_prefix}_by_{partition_by}_{timestamp}.xlsx")
+        else:
+            path = os.path.join(output_dir, f"{spec.file_prefix}_{partition_by}_{_file_label(label, file_labels)}_{timestamp}.xlsx")
+        register_output(path)
+        wb.save(path)
+        paths.append(path)
+
+    logger.info(f"Exported {count} rows in {len(counts)} {partition_by} partitions: " +
+                ", ".join(f"{label} {rows_written}" for label, rows_written in counts.items()))
+    print(f"\nSuccessfully exported {count} records by {partition_by} to {len(paths)} file(s): {', '.join(paths)}")
+    return True
@@ -1,28 +1,96 @@
 import logging
 from datetime import datetime, timedelta
-from bson import ObjectId
 from openpyxl import Workbook
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 from utils.style_loader import STYLES
+from utils.table_writer import set_auto_filter, write_data_rows
+from utils.summary_stats import new_summary, write_summary_sheet
+from utils.memory_profile import mark_phase
+from utils.report_query import fetch_rows
+from utils.row_stream import compact_rows
 import os
-from utils.connectDB import get_db_connection
+from utils.connectDB import get_db_connection, get_shared_db
 import logging.config
-from utils.config_loader import get_config
-from pymongo import MongoClient
+from utils.config_loader import get_config, is_enabled
+from utils.time_budget import is_budget_timeout, register_output
 
 logger = logging.getLogger('excel_data_writer')
 
+PENDING_REJECT_COLLECTION = "Incident_log"
+
 PENDING_REJECT_INCIDENT_HEADERS = [
     "Incident_Id", "Incident_Status", "Account_Num", "Filtered_Reason",
     "Rejected_Dtm", "Source_Type"
 ]
 
-def excel_pending_reject_incident(drc_commission_rules, from_date, to_date):
+def build_pending_reject_query(drc_commission_rules, from_date, to_date):
+    """Validate the task parameters and build the Incident_log query for pending/reject incidents and the filters shown on the sheet"""
+    query = {"Incident_Status": {"$in": ["Incident Pending", "Incident Reject"]}}
+
+    # Check drc_commission_rules
+    if drc_commission_rules is not None:
+        if isinstance(drc_commission_rules, list) and drc_commission_rules:
+            query["Filtered_Reason"] = {"$in": drc_commission_rules}
+        else:
+            raise ValueError("drc_commission_rules must be a non-empty list of valid commission rules")
+
+    # Check date range
+    if from_date is not None and to_date is not None:
+        try:
+            from_dt = datetime.strptime(from_date, '%Y-%m-%d')
+            to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
+
+            if to_dt < from_dt:
+                raise ValueError("to_date cannot be earlier than from_date")
+
+            query["Rejected_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
+
+        except ValueError as ve:
+            if str(ve).startswith("to_date"):
+                raise
+            raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
+
+    filters = {
+        "drc_commission_rules": drc_commission_rules,
+        "date_range": (from_dt if from_date is not None else None, to_dt if to_date is not None else None)
+    }
+    return query, filters
+
+
+def write_pending_reject_export(incidents, filters, summary=False):
+    """Export pending/reject incidents to a timestamped workbook, even if no incidents are found"""
+    output_dir = "exports"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"pending_reject_incidents_{timestamp}.xlsx"
+    filepath = os.path.join(output_dir, filename)
+    os.makedirs(output_dir, exist_ok=True)
+
+    mark_phase("cells")
+    wb = Workbook()
+    wb.remove(wb.active)
+    totals = new_summary(PENDING_REJECT_INCIDENT_HEADERS) if summary else None
+
+    if not create_pending_reject_incident_table(wb, incidents, filters, totals):
+        raise Exception("Failed to create pending/reject incident sheet")
+
+    if totals is not None:
+        write_summary_sheet(wb, "PENDING REJECT INCIDENT REPORT", totals)
+
+    mark_phase("save")
+    register_output(filepath)
+    wb.save(filepath)
+    if not incidents:
+        print(f"No pending/reject incidents found matching the selected filters. Exported empty table to: {filepath}")
+    else:
+        print(f"\nSuccessfully exported {len(incidents)} records to: {filepath}")
+    return filepath
+
+
+def excel_pending_reject_incident(drc_commission_rules, from_date, to_date, server_format=None, summary=None):
     """Fetch and export pending/reject incidents based on validated parameters"""
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["DRS"]
+        db = get_shared_db()
         logger.info(f"Connected to MongoDB successfully | DRS")
 
     except Exception as err:
@@ -31,58 +99,16 @@ def excel_pending_reject_incident(drc_commission_rules, from_date, to_date):
         return False
     else:
         try:
-            collection = db["Incident_log"]
-            query = {"Incident_Status": {"$in": ["Incident Pending", "Incident Reject"]}}
-
-            # Check drc_commission_rules
-            if drc_commission_rules is not None:
-                if isinstance(drc_commission_rules, list) and drc_commission_rules:
-                    query["Filtered_Reason"] = {"$in": drc_commission_rules}
-                else:
-                    raise ValueError("drc_commission_rules must be a non-empty list of valid commission rules")
-
-            # Check date range
-            if from_date is not None and to_date is not None:
-                try:
-                    from_dt = datetime.strptime(from_date, '%Y-%m-%d')
-                    to_dt = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-                    
-                    if to_dt < from_dt:
-                        raise ValueError("to_date cannot be earlier than from_date")
-                    
-                    query["Rejected_Dtm"] = {"$gte": from_dt, "$lte": to_dt}
-
-                except ValueError as ve:
-                    if str(ve).startswith("to_date"):
-                        raise
-                    raise ValueError(f"Invalid date format. Use 'YYYY-MM-DD'. Error: {str(ve)}")
+            collection = db[PENDING_REJECT_COLLECTION]
+            query, filters = build_pending_reject_query(drc_commission_rules, from_date, to_date)
 
             # Log and execute query
             logger.info(f"Executing query: {query}")
-            incidents = list(collection.find(query))
+            mark_phase("fetch")
+            incidents = list(compact_rows(fetch_rows(collection, query, PENDING_REJECT_INCIDENT_HEADERS, is_enabled(server_format)), PENDING_REJECT_INCIDENT_HEADERS))
             logger.info(f"Found {len(incidents)} matching incidents")
 
-            # Export to Excel even if no incidents are found
-            output_dir = "exports"
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"pending_reject_incidents_{timestamp}.xlsx"
-            filepath = os.path.join(output_dir, filename)
-            os.makedirs(output_dir, exist_ok=True)
-
-            wb = Workbook()
-            wb.remove(wb.active)
-
-            if not create_pending_reject_incident_table(wb, incidents, {
-                "drc_commission_rules": drc_commission_rules,
-                "date_range": (from_dt if from_date is not None else None, to_dt if to_date is not None else None)
-            }):
-                raise Exception("Failed to create pending/reject incident sheet")
-
-            wb.save(filepath)
-            if not incidents:
-                print(f"No pending/reject incidents found matching the selected filters. Exported empty table to: {filepath}")
-            else:
-                print(f"\nSuccessfully exported {len(incidents)} records to: {filepath}")
+            write_pending_reject_export(incidents, filters, is_enabled(summary))
             return True
 
         except ValueError as ve:
@@ -90,15 +116,14 @@ def excel_pending_reject_incident(drc_commission_rules, from_date, to_date):
             print(f"Error: {str(ve)}")
             return False
         except Exception as e:
+            # A budget stop is reported once, by the task runner
+            if is_budget_timeout(e):
+                return False
             logger.error(f"Export failed: {str(e)}", exc_info=True)
             print(f"\nError during export: {str(e)}")
             return False
-        finally:
-            if client:
-                client.close()
-                logger.info("MongoDB connection closed")
 
-def create_pending_reject_incident_table(wb, data, filters=None):
+def create_pending_reject_incident_table(wb, data, filters=None, summary=None):
     """Create formatted Excel sheet with pending/reject incident data, including headers even if no data"""
     try:
         ws = wb.create_sheet(title="PENDING REJECT INCIDENT REPORT")
@@ -150,22 +175,11 @@ def create_pending_reject_incident_table(wb, data, filters=None):
         
         # Data Rows (only if data exists)
         if data:
-            for record in data:
-                row_idx += 1
-                for col_idx, header in enumerate(PENDING_REJECT_INCIDENT_HEADERS, 1):
-                    value = record.get(header, "")
-                    if header == "Incident_Id" and isinstance(value, ObjectId):
-                        value = str(value)
-                    if header == "Rejected_Dtm" and isinstance(value, datetime):
-                        value = value.strftime('%Y-%m-%d %H:%M:%S')
-                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                    cell.font = STYLES['Border_Style']['font']
-                    cell.border = STYLES['Border_Style']['border']
-                    cell.alignment = STYLES['Border_Style']['alignment']
+            row_idx = write_data_rows(ws, data, PENDING_REJECT_INCIDENT_HEADERS, row_idx, summary=summary)
         
         # Add AutoFilter to headers
         last_col_letter = get_column_letter(len(PENDING_REJECT_INCIDENT_HEADERS))
-        ws.auto_filter.ref = f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}"
+        set_auto_filter(ws, f"{get_column_letter(1)}{header_row}:{last_col_letter}{header_row}")
         
         # Auto-adjust columns based on headers (and data if present)
         for col_idx in range(1, len(PENDING_REJECT_INCIDENT_HEADERS) + 1):
@@ -180,5 +194,7 @@ def create_pending_reject_incident_table(wb, data, filters=None):
         return True
     
     except Exception as e:
+        if is_budget_timeout(e):
+            raise
         logger.error(f"Error creating sheet: {str(e)}", exc_info=True)
         return False
@@ -0,0 +1,34 @@
+"""Build and save report workbooks in worker processes, since openpyxl serialization is CPU-bound"""
+
+import time
+
+from export.report_registry import get_report_spec
+from utils.progress import DEFAULT_PROGRESS_INTERVAL, set_expected_rows, set_progress_state, track_progress
+from utils.row_stream import row_values
+
+
+def pack_rows(rows, headers):
+    """Reduce compact rows or documents to tuples of the header values before they are pickled to a worker"""
+    return [tuple(row_values(row, headers)[:len(headers)]) for row in rows]
+
+
+def write_report(task_id, function_name, rows, filters, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    """Write a report from rows already fetched, tracking the task's progress, returning (file path, seconds)"""
+    started = time.perf_counter()
+    spec = get_report_spec(function_name)
+    with track_progress(task_id, progress_interval):
+        set_expected_rows(len(rows))
+        try:
+            filepath = spec.write(rows, filters)
+        except Exception:
+            # The states run_task reports for a task
+            set_progress_state("failed")
+            raise
+        set_progress_state("succeeded")
+    return filepath, time.perf_counter() - started
+
+
+def submit_report_write(executor, task_id, function_name, rows, filters, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    """Queue a report write on a process pool, returning a future of (file path, seconds)"""
+    spec = get_report_spec(function_name)
+    return executor.submit(write_report, task_id, function_name, pack_rows(rows, spec.headers), filters, progress_interval)
@@ -0,0 +1,192 @@
+"""Pick the writer for a registered report from a preflight row count, and run the streaming writers"""
+
+import logging
+import os
+from datetime import datetime
+
+from export.enrichment import enriched_headers, fetch_enriched_rows, parse_enrichment
+from export.partitioned_export import partition_source, run_partitioned_export, validate_partition_options
+from export.report_registry import get_report_spec, split_engine_options
+from utils.config_loader import is_enabled, is_option_set
+from utils.memory_profile import mark_phase
+from utils.parallel_fetch import fetch_rows_partitioned
+from utils.progress import set_expected_rows
+from utils.report_query import fetch_rows
+from utils.stream_writers import write_csv_parts, write_streaming_workbook
+from utils.summary_stats import new_summary, write_summary_csv
+
+logger = logging.getLogger('excel_data_writer')
+
+# Fully styled in-memory workbook written by the report's own function
+ENGINE_STYLED = "styled"
+# Write-only workbook streamed from the cursor
+ENGINE_STREAMING = "streaming"
+# Numbered CSV files streamed from the cursor
+ENGINE_CSV = "csv"
+
+ENGINES = (ENGINE_STYLED, ENGINE_STREAMING, ENGINE_CSV)
+
+# Defaults for the [TASK_RUNNER] thresholds; a sheet holds at most 1,048,576 rows
+DEFAULT_STREAMING_ROWS = 100000
+DEFAULT_CSV_ROWS = 1000000
+DEFAULT_CSV_PART_ROWS = 1000000
+
+# Upper bound on the preflight count; past it the collection size is used instead
+PREFLIGHT_TIME_MS = 2000
+
+# Engine options that need the styled path's own fetch (checkpointing, cached days)
+STYLED_ONLY_OPTIONS = ("checkpoint", "fragment_cache")
+
+
+def load_engine_thresholds(config_parser):
+    """Read STREAMING_ROWS, CSV_ROWS and CSV_PART_ROWS from [TASK_RUNNER]"""
+    return {
+        "streaming_rows": config_parser.getint('TASK_RUNNER', 'STREAMING_ROWS', fallback=DEFAULT_STREAMING_ROWS),
+        "csv_rows": config_parser.getint('TASK_RUNNER', 'CSV_ROWS', fallback=DEFAULT_CSV_ROWS),
+        "csv_part_rows": config_parser.getint('TASK_RUNNER', 'CSV_PART_ROWS', fallback=DEFAULT_CSV_PART_ROWS),
+    }
+
+
+def preflight_count(collection, query, cap):
+    """Count the query's documents up to cap, returning (rows, source)
+
+    The count stops at cap since more rows would not change the engine. If it
+    cannot finish within PREFLIGHT_TIME_MS the collection size is used as an
+    upper bound.
+    """
+    if not query:
+        return collection.estimated_document_count(), "collection size"
+    try:
+        return collection.count_documents(query, limit=cap, maxTimeMS=PREFLIGHT_TIME_MS), "count"
+    except Exception as e:
+        logger.info(f"Preflight count on {collection.name} did not finish ({str(e)}); using collection size")
+        return collection.estimated_document_count(), "collection size"
+
+
+def count_task_rows(db, function_name, params, thresholds):
+    """Preflight count of a registered task's documents as (rows, source), or None for an unregistered report
+
+    source is "count" only for an exact count; a count stopped at CSV_ROWS or the collection size is an upper bound.
+    """
+    spec = get_report_spec(function_name)
+    if spec is None:
+        return None
+    query_params, _ = split_engine_options(params)
+    query, _ = spec.build_query(**query_params)
+    rows, source = preflight_count(db[spec.collection], query, thresholds["csv_rows"])
+    if source == "count" and rows >= thresholds["csv_rows"]:
+        source = "count stopped at CSV_ROWS"
+    return rows, source
+
+
+def select_engine(rows, thresholds):
+    """Return (engine, reason) for an export of rows rows"""
+    if rows >= thresholds["csv_rows"]:
+        return ENGINE_CSV, f"{rows} rows >= CSV_ROWS {thresholds['csv_rows']}"
+    if rows >= thresholds["streaming_rows"]:
+        return ENGINE_STREAMING, f"{rows} rows >= STREAMING_ROWS {thresholds['streaming_rows']}"
+    return ENGINE_STYLED, f"{rows} rows < STREAMING_ROWS {thresholds['streaming_rows']}"
+
+
+def choose_task_engine(db, task_id, function_name, params, thresholds, engine="auto", counted=None):
+    """Decide how a task is written, returning (engine, reason, counted) and logging the decision
+
+    engine is the task's 'engine' setting: auto, or one of ENGINES to force it. counted is the
+    (rows, source) of an earlier count_task_rows, used instead of counting again; the count the
+    decision used, or None when it needed none, comes back for the next decision about the task.
+    Unregistered reports and tasks using checkpoint or fragment_cache always take the styled
+    path, since only it implements them; parallel_partitions reads feed any engine; partitioned tasks always stream, and
+    enriched tasks never take the styled path, whose sheets have fixed columns. A partition key
+    the report cannot produce, from its documents or an enriched column, raises ValueError.
+    """
+    spec = get_report_spec(function_name)
+    query_params, options = split_engine_options(params)
+    partition_by = options.get("partition_by")
+    enrich, _ = parse_enrichment(options.get("enrich"), options.get("enrich_mode"))
+    if spec is None:
+        if partition_by or enrich:
+            raise ValueError(f"{'partition_by' if partition_by else 'enrich'} needs a report registered in export.report_registry; {function_name} is not")
+        return ENGINE_STYLED, "report has no separate query stage", None
+
+    styled_only = [name for name in STYLED_ONLY_OPTIONS if is_option_set(options.get(name))]
+    # Enriched and partitioned exports read through cursors of their own
+    own_reads = styled_only + (["parallel_partitions"] if is_option_set(options.get("parallel_partitions")) else [])
+    if enrich:
+        enriched_headers(spec.headers, enrich)
+        if own_reads:
+            raise ValueError(f"enrich cannot be combined with {', '.join(own_reads)}")
+    if partition_by:
+        conflicts = own_reads + (["summary"] if is_option_set(options.get("summary")) else [])
+        if conflicts:
+            raise ValueError(f"partition_by cannot be combined with {', '.join(conflicts)}")
+        validate_partition_options(partition_by, options.get("partition_output"))
+        partition_source(spec, partition_by, enrich)
+        # Every partition gets its own write-only writer, fed from the one cursor
+        decision = (ENGINE_STREAMING, f"partitioned by {partition_by}")
+    elif styled_only:
+        decision = (ENGINE_STYLED, f"task uses {', '.join(styled_only)}")
+    elif engine and engine != "auto":
+        if engine not in ENGINES:
+            raise ValueError(f"Invalid engine '{engine}'. Must be 'auto' or one of: {', '.join(ENGINES)}")
+        decision = (engine, "set in task configuration")
+    else:
+        if counted is None:
+            counted = count_task_rows(db, function_name, params, thresholds)
+        rows, source = counted
+        if source == "count":
+            # An exact count gives the streaming writers their percent complete and ETA
+            set_expected_rows(rows)
+        engine, reason = select_engine(rows, thresholds)
+        decision = (engine, f"{reason} ({source})")
+
+    if enrich and decision[0] == ENGINE_STYLED:
+        decision = (ENGINE_STREAMING, f"enriched with {', '.join(enrich)}")
+
+    logger.info(f"Task {task_id} engine: {decision[0]} | {decision[1]}")
+    return decision[0], decision[1], counted
+
+
+def run_engine_export(db, function_name, params, engine, thresholds):
+    """Stream a registered report to a write-only workbook, CSV parts or one workbook per partition, returning True on success"""
+    spec = get_report_spec(function_name)
+    query_params, options = split_engine_options(params)
+    if options.get("partition_by"):
+        return run_partitioned_export(db, function_name, params)
+
+    query, filters = spec.build_query(**query_params)
+
+    output_dir = "exports"
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, f"{spec.file_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+    enrich, enrich_mode = parse_enrichment(options.get("enrich"), options.get("enrich_mode"))
+    headers = enriched_headers(spec.headers, enrich)
+    server_format = is_enabled(options.get("server_format"))
+
+    logger.info(f"Executing query ({engine} engine): {query}")
+    # Fetching and writing are interleaved here, so they are profiled as one phase
+    mark_phase("stream")
+    partitions = int(options.get("parallel_partitions") or 0)
+    if enrich:
+        rows = fetch_enriched_rows(db, spec.collection, query, spec.headers, enrich, enrich_mode, server_format)
+    elif partitions > 1:
+        # Parallel range cursors stream straight into the writer
+        rows = fetch_rows_partitioned(db[spec.collection], query, spec.headers, partitions,
+                                      options.get("partition_field") or "_id", options.get("split_method") or "sample", server_format)
+    else:
+        rows = fetch_rows(db[spec.collection], query, spec.headers, server_format)
+    summary = new_summary(headers) if is_enabled(options.get("summary")) else None
+
+    if engine == ENGINE_CSV:
+        paths, count = write_csv_parts(base_path, headers, rows, thresholds["csv_part_rows"], summary)
+        if summary is not None:
+            # A CSV file has no sheets, so the summary goes to a file of its own
+            paths.append(write_summary_csv(f"{base_path}_summary.csv", summary))
+        print(f"\nSuccessfully exported {count} records to {len(paths)} CSV file(s): {', '.join(paths)}")
+    else:
+        filepath = f"{base_path}.xlsx"
+        count = write_streaming_workbook(filepath, spec.title, headers, rows, filters, summary)
+        print(f"\nSuccessfully exported {count} records to: {filepath}")
+
+    logger.info(f"Exported {count} rows with the {engine} engine")
+    return True
@@ -0,0 +1,86 @@
+"""Registry of exports whose query and workbook stages can be run separately by the task runner"""
+
+from collections import namedtuple
+
+from export.cpe_list import CPE_COLLECTION, CPE_HEADERS, build_cpe_query, write_cpe_export
+from export.direct_lod import DIRECT_LOD_COLLECTION, DIRECT_LOD_HEADERS, build_direct_lod_query, write_direct_lod_export
+from export.incident_list import INCIDENT_COLLECTION, INCIDENT_HEADERS, build_incident_query, write_incident_export
+from export.incident_open_for_distribution import (
+    INCIDENT_OPEN_FOR_DISTRIBUTION_COLLECTION,
+    INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS,
+    build_incident_open_distribution_query,
+    write_incident_open_distribution_export,
+)
+from export.pending_reject_list import (
+    PENDING_REJECT_COLLECTION,
+    PENDING_REJECT_INCIDENT_HEADERS,
+    build_pending_reject_query,
+    write_pending_reject_export,
+)
+from export.rejected_list import REJECTED_COLLECTION, REJECTED_HEADERS, build_rejected_query, write_rejected_export
+
+# collection: source collection name
+# headers: columns written by the report, in sheet order
+# build_query: takes the task parameters and returns (query, filters), raising ValueError on invalid input
+# write: takes (rows, filters) and writes the workbook, returning the file path
+# file_prefix, title: output file name prefix and sheet title, shared by the streaming and CSV engines
+# partition_fields: {partition key: document field} for the partition keys the report's documents hold
+ReportSpec = namedtuple("ReportSpec", ["collection", "headers", "build_query", "write", "file_prefix", "title", "partition_fields"],
+                        defaults=(None,))
+
+# Task parameters consumed by the report engine rather than by build_query
+ENGINE_OPTIONS = (
+    "server_format", "checkpoint", "parallel_partitions", "partition_field", "split_method", "fragment_cache",
+    "fragment_mutable_days", "fragment_max_age", "checkpoint_max_age", "partition_by", "partition_output", "summary", "enrich", "enrich_mode",
+)
+
+# Keyed by the function_name used in the [Task_N] sections
+REPORTS = {
+    "excel_incident_detail": ReportSpec(
+        INCIDENT_COLLECTION, INCIDENT_HEADERS, build_incident_query, write_incident_export,
+        "incidents_details", "INCIDENT REPORT",
+    ),
+    "excel_incident_open_distribution": ReportSpec(
+        INCIDENT_OPEN_FOR_DISTRIBUTION_COLLECTION,
+        INCIDENT_OPEN_FOR_DISTRIBUTION_HEADERS,
+        build_incident_open_distribution_query,
+        write_incident_open_distribution_export,
+        "incident_open_distribution",
+        "OPEN INCIDENT DISTRIBUTION",
+    ),
+    "excel_pending_reject_incident": ReportSpec(
+        PENDING_REJECT_COLLECTION,
+        PENDING_REJECT_INCIDENT_HEADERS,
+        build_pending_reject_query,
+        write_pending_reject_export,
+        "pending_reject_incidents",
+        "PENDING REJECT INCIDENT REPORT",
+    ),
+    "excel_cpe_detail": ReportSpec(
+        CPE_COLLECTION, CPE_HEADERS, build_cpe_query, write_cpe_export,
+        "cpe_incidents", "CPE INCIDENT REPORT",
+        {"drc_commision_rule": "Drc commision rule"},
+    ),
+    "excel_direct_lod_detail": ReportSpec(
+        DIRECT_LOD_COLLECTION, DIRECT_LOD_HEADERS, build_direct_lod_query, write_direct_lod_export,
+        "direct_lod_incidents_task", "DIRECT LOD INCIDENTS REPORT",
+        {"drc_commision_rule": "drc_commision_rule"},
+    ),
+    "excel_rejected_detail": ReportSpec(
+        REJECTED_COLLECTION, REJECTED_HEADERS, build_rejected_query, write_rejected_export,
+        "rejected_incidents", "REJECTED INCIDENT REPORT",
+        {"drc_commision_rule": "drc_commision_rule"},
+    ),
+}
+
+
+def get_report_spec(function_name):
+    """Return the ReportSpec for a task function, or None if the export only runs as a whole"""
+    return REPORTS.get(function_name)
+
+
+def split_engine_options(params):
+    """Separate report engine options from the parameters passed to build_query"""
+    query_params = {key: value for key, value in params.items() if key not in ENGINE_OPTIONS}
+    options = {key: params[key] for key in ENGINE_OPTIONS if key in params}
+    return query_params, options
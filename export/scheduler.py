@@ -0,0 +1,89 @@
+import logging
+import time
+from datetime import datetime
+from importlib import import_module
+from export.task_processor import config_parser, load_tasks, run_batch
+from utils.connectDB import get_shared_db, close_shared_client
+from utils.schedule import parse_schedule
+
+logger = logging.getLogger('excel_data_writer')
+
+# Longest single sleep, so the loop notices a stop_after deadline promptly
+MAX_SLEEP_SECONDS = 60
+
+
+def load_schedules():
+    """Read the schedule of every configured task, returning {task_id: schedule}"""
+    schedules = {}
+    for task_id, function_name, module_path, _ in load_tasks():
+        expression = config_parser[f"Task_{task_id}"].get('schedule')
+        if not expression or expression.lower() == 'none':
+            logger.info(f"Task {task_id} has no schedule; it only runs in single-execution mode")
+            continue
+        try:
+            schedules[task_id] = parse_schedule(expression)
+        except ValueError as e:
+            logger.error(f"Task {task_id} has an invalid schedule '{expression}': {e}")
+    return schedules
+
+
+def warm_up(tasks):
+    """Import the task modules, load the styles and open the shared client once, before the first run"""
+    from utils.style_loader import STYLES
+    logger.info(f"Loaded {len(STYLES)} styles")
+
+    for task_id, function_name, module_path, _ in tasks:
+        try:
+            getattr(import_module(module_path), function_name)
+        except Exception as e:
+            logger.error(f"Task {task_id}: cannot load {module_path}.{function_name}: {e}")
+
+    try:
+        get_shared_db().client.admin.command('ping')
+    except Exception as e:
+        logger.warning(f"MongoDB ping failed during warm-up: {e}")
+
+
+def run_scheduler(stop_after=None):
+    """Run scheduled tasks until interrupted, keeping modules, styles and the Mongo pool loaded
+
+    stop_after, if given, is a datetime after which the loop exits; it is meant for trial runs.
+    """
+    schedules = load_schedules()
+    if not schedules:
+        logger.warning("No task has a schedule; nothing to run in daemon mode")
+        return
+
+    tasks = {task[0]: task for task in load_tasks(list(schedules))}
+    warm_up(tasks.values())
+
+    now = datetime.now()
+    next_runs = {task_id: schedule.next_run(now) for task_id, schedule in schedules.items()}
+    for task_id, next_run in next_runs.items():
+        logger.info(f"Task {task_id} scheduled ({schedules[task_id]!r}), next run at {next_run}")
+
+    try:
+        while stop_after is None or datetime.now() < stop_after:
+            now = datetime.now()
+            due = [task_id for task_id in tasks if next_runs[task_id] <= now]
+
+            if due:
+                # Tasks falling due together run as one batch, so they can share a scan
+                try:
+                    run_batch([tasks[task_id] for task_id in due])
+                except Exception as e:
+                    # A failed batch must not stop the daemon; its tasks are tried again at their next run
+                    logger.error(f"Scheduled batch for tasks {due} failed: {str(e)}", exc_info=True)
+                finished = datetime.now()
+                for task_id in due:
+                    next_runs[task_id] = schedules[task_id].next_run(finished)
+                    logger.info(f"Task {task_id} next run at {next_runs[task_id]}")
+                continue
+
+            wait = (min(next_runs.values()) - now).total_seconds()
+            time.sleep(min(max(wait, 0), MAX_SLEEP_SECONDS))
+
+    except KeyboardInterrupt:
+        logger.info("Scheduler interrupted")
+    finally:
+        close_shared_client()
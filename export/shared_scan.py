@@ -0,0 +1,152 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from export.process_writer import submit_report_write, write_report
+from export.report_registry import get_report_spec, split_engine_options
+from utils.config_loader import is_option_set
+from utils.progress import DEFAULT_PROGRESS_INTERVAL
+from utils.query_matcher import document_matches, is_supported_query, query_fields
+from utils.report_query import header_projection
+from utils.row_stream import compact_row
+
+logger = logging.getLogger('excel_data_writer')
+
+
+def group_tasks_by_collection(tasks):
+    """Build each registered task's query and group them by source collection
+
+    tasks is a list of (task_id, function_name, params). Tasks that are not registered,
+    fail validation or use operators the matcher cannot evaluate are left out, so the
+    runner executes them on their own and they report their own errors.
+    """
+    groups = {}
+    for task_id, function_name, params in tasks:
+        spec = get_report_spec(function_name)
+        if spec is None:
+            continue
+
+        query_params, options = split_engine_options(params)
+        # Server-side formatting replaces the raw values used for routing, while checkpointed
+        # and partitioned exports need cursors of their own
+        enabled_options = [name for name, value in options.items() if is_option_set(value)]
+        if enabled_options:
+            logger.info(f"Task {task_id} excluded from shared scan: runs with {', '.join(enabled_options)}")
+            continue
+
+        try:
+            query, filters = spec.build_query(**query_params)
+        except Exception as e:
+            logger.warning(f"Task {task_id} excluded from shared scan: {str(e)}")
+            continue
+
+        if not is_supported_query(query):
+            logger.info(f"Task {task_id} excluded from shared scan: query {query} cannot be matched in process")
+            continue
+
+        groups.setdefault(spec.collection, []).append({
+            "task_id": task_id,
+            "function_name": function_name,
+            "spec": spec,
+            "query": query,
+            "filters": filters,
+            "rows": [],
+        })
+    return groups
+
+
+def scan_collection(db, collection_name, members):
+    """Read a collection once with the $or of the members' queries and route each document to every matching report"""
+    queries = [member["query"] for member in members]
+    if len(queries) == 1:
+        combined_query = queries[0]
+    else:
+        # An empty query matches everything, so the combined scan must too
+        combined_query = {} if any(not query for query in queries) else {"$or": queries}
+    task_ids = [member["task_id"] for member in members]
+
+    logger.info(f"Executing shared scan on {collection_name} for tasks {task_ids}: {combined_query}")
+    scanned = 0
+    # Routing reads the query fields and rows keep the headers, so nothing else is fetched or decoded
+    fields = [field for member in members for field in member["spec"].headers + query_fields(member["query"])]
+    for document in db[collection_name].find(combined_query, header_projection(fields)):
+        scanned += 1
+        for member in members:
+            if document_matches(document, member["query"]):
+                member["rows"].append(compact_row(document, member["spec"].headers))
+
+    logger.info(f"Shared scan on {collection_name} read {scanned} documents | "
+                + ", ".join(f"Task {member['task_id']}: {len(member['rows'])}" for member in members))
+
+
+def write_member(member, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    """Write one routed report in this process, returning (success, seconds)"""
+    started = time.perf_counter()
+    try:
+        _, seconds = write_report(member["task_id"], member["function_name"], member["rows"], member["filters"], progress_interval)
+        return True, seconds
+    except Exception as e:
+        logger.error(f"Task {member['task_id']} export failed after shared scan: {str(e)}", exc_info=True)
+        return False, time.perf_counter() - started
+
+
+def run_shared_scans(db, tasks, write_processes=0, combine=True, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    """Run tasks that share a source collection off one scan per collection
+
+    With write_processes above 1 every registered task is fetched here, including
+    tasks alone on their collection, and the workbooks are built and saved on a
+    process pool while the next collection is scanned. combine=False keeps one
+    query per task, for using the process pool without shared scans.
+
+    Returns {task_id: (success, seconds, rows)} for the tasks handled here, each member
+    charged an equal share of its scan; every other task is left for the caller to run
+    individually, including the members of a scan that failed.
+    """
+    results = {}
+    pending = {}
+    min_members = 1 if write_processes > 1 else 2
+    executor = ProcessPoolExecutor(max_workers=write_processes) if write_processes > 1 else None
+
+    scans = []
+    for collection_name, members in group_tasks_by_collection(tasks).items():
+        if combine:
+            scans.append((collection_name, members))
+        else:
+            scans.extend((collection_name, [member]) for member in members)
+
+    try:
+        for collection_name, members in scans:
+            if len(members) < min_members:
+                continue
+            started = time.perf_counter()
+            try:
+                scan_collection(db, collection_name, members)
+            except Exception as e:
+                logger.error(f"Shared scan on {collection_name} failed, tasks will run individually: {str(e)}", exc_info=True)
+                continue
+            scan_share = (time.perf_counter() - started) / len(members)
+
+            for member in members:
+                rows = len(member["rows"])
+                if executor is not None:
+                    future = submit_report_write(executor, member["task_id"], member["function_name"], member["rows"],
+                                                 member["filters"], progress_interval)
+                    pending[member["task_id"]] = (future, scan_share, rows)
+                else:
+                    success, seconds = write_member(member, progress_interval)
+                    results[member["task_id"]] = (success, scan_share + seconds, rows)
+                member["rows"] = []
+
+        for task_id, (future, scan_share, rows) in pending.items():
+            try:
+                filepath, seconds = future.result()
+                logger.info(f"Task {task_id} workbook written by worker process: {filepath}")
+                results[task_id] = (True, scan_share + seconds, rows)
+            except Exception as e:
+                logger.error(f"Task {task_id} export failed in worker process: {str(e)}", exc_info=True)
+                results[task_id] = (False, scan_share, rows)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return results
@@ -0,0 +1,105 @@
+"""Order tasks longest-first from their history and row counts, and run them on a worker pool"""
+
+import heapq
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from export.report_engine import count_task_rows
+from utils.memory_profile import pop_task_profiles
+from utils.task_history import average_seconds, seconds_per_row
+
+logger = logging.getLogger('excel_data_writer')
+
+# Cost of one row for tasks without a history of their own, roughly what a typed
+# openpyxl row of the incident layout takes to fetch, write and save
+DEFAULT_SECONDS_PER_ROW = 0.001
+
+# Estimate for a task with neither a history nor a row count
+DEFAULT_TASK_SECONDS = 5.0
+
+def estimate_task_seconds(task_id, rows, history):
+    """Estimate a task's duration from its own history, scaled to the current row count when known"""
+    runs = history.get(str(task_id), [])
+    rate = seconds_per_row(runs)
+    if rate is not None and rows is not None:
+        return rate * rows
+    if runs:
+        return average_seconds(runs)
+    if rows is not None:
+        all_runs = [run for task_runs in history.values() for run in task_runs]
+        return (seconds_per_row(all_runs) or DEFAULT_SECONDS_PER_ROW) * rows
+    return DEFAULT_TASK_SECONDS
+
+
+def predict_makespan(estimates, workers):
+    """Batch duration if the estimates are started in the given order on the first free worker"""
+    finish_times = [0.0] * max(workers, 1)
+    for estimate in estimates:
+        earliest = heapq.heappop(finish_times)
+        heapq.heappush(finish_times, earliest + estimate)
+    return max(finish_times)
+
+
+def plan_tasks(db, tasks, history, thresholds, counts):
+    """Return [(task, rows, estimate)] sorted longest-first
+
+    Rows come from the preflight count of report_engine, capped at CSV_ROWS; tasks already
+    counted in counts are not counted again, and new counts are added to it for run_task.
+    """
+    planned = []
+    for task in tasks:
+        task_id, function_name, _, params = task
+        if task_id not in counts:
+            try:
+                counted = count_task_rows(db, function_name, params, thresholds)
+            except Exception as e:
+                logger.warning(f"Row count for {function_name} unavailable: {str(e)}")
+                counted = None
+            if counted is not None:
+                counts[task_id] = counted
+        rows = counts[task_id][0] if task_id in counts else None
+        estimate = estimate_task_seconds(task_id, rows, history)
+        planned.append((task, rows, estimate))
+        logger.info(f"Task {task_id} estimate: {estimate:.1f}s" + (f" for {rows} rows" if rows is not None else ""))
+
+    planned.sort(key=lambda item: item[2], reverse=True)
+    return planned
+
+
+def run_timed_task(task, counted=None):
+    """Worker entry point: run one task and return (status, seconds, memory profiles)"""
+    from export.task_processor import run_task
+
+    started = time.perf_counter()
+    status = run_task(*task, counted=counted)
+    return status, time.perf_counter() - started, pop_task_profiles()
+
+
+def run_planned_tasks(planned, workers, counts=None):
+    """Run planned tasks on a process pool in longest-first order, returning {task_id: (status, seconds, profiles)}
+
+    The pool hands tasks out in submission order, so each worker picks up the
+    longest remaining task as soon as it is free. counts holds the preflight
+    counts already made for the tasks, passed on so run_task does not count again.
+    """
+    counts = counts or {}
+    from export.task_processor import TASK_FAILED
+
+    predicted = predict_makespan([estimate for _, _, estimate in planned], workers)
+    logger.info(f"Running {len(planned)} tasks on {workers} workers, predicted batch time {predicted:.1f}s")
+
+    results = {}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(task[0], executor.submit(run_timed_task, task, counts.get(task[0]))) for task, _, _ in planned]
+        for task_id, future in futures:
+            try:
+                results[task_id] = future.result()
+            except Exception as e:
+                logger.error(f"Task {task_id} failed in worker process: {str(e)}", exc_info=True)
+                results[task_id] = (TASK_FAILED, None, {})
+
+    actual = time.perf_counter() - started
+    logger.info(f"Batch of {len(planned)} tasks finished in {actual:.1f}s (predicted {predicted:.1f}s)")
+    return results
@@ -1,6 +1,16 @@
 import logging
 import configparser
+import time
 from importlib import import_module
+from export.enrichment import clear_dimension_caches
+from export.report_engine import ENGINE_STYLED, choose_task_engine, load_engine_thresholds, run_engine_export
+from utils.config_loader import is_enabled
+from utils.connectDB import get_shared_db
+from utils.task_history import load_history, record_run, save_history
+from utils.task_logging import start_task_context, close_phases, end_task_context
+from utils.memory_profile import add_task_profiles, profile_task, write_profile_report
+from utils.progress import DEFAULT_PROGRESS_INTERVAL, set_progress_state, track_progress
+from utils.time_budget import time_budget, is_budget_timeout, remove_partial_outputs, task_timed_out
 
 logger = logging.getLogger('excel_data_writer')
 
@@ -11,61 +21,267 @@ config_parser.read('Config/coreConfig.ini')
 # Create Task_list from coreconfig.ini (only task IDs)
 Task_list = [task_id for task_id in config_parser['Tasks'].keys()]
 
-def process_tasks():
-    """Process tasks by calling functions specified in coreConfig.ini"""
-    try:
-        task_index = 0
+# Task keys read by the runner itself rather than passed to the task function
+RUNNER_KEYS = {'function_name', 'module_path', 'schedule', 'time_budget', 'engine'}
 
-        while task_index < len(Task_list):
-            task_id = Task_list[task_index]
-            task_section = f"Task_{task_id}"
+# Settings a [Task_N] section may give for an option it enables, and the [TASK_RUNNER] defaults used when it does not
+TASK_OPTION_DEFAULTS = {
+    'fragment_cache': {'fragment_mutable_days': 'FRAGMENT_MUTABLE_DAYS', 'fragment_max_age': 'FRAGMENT_MAX_AGE'},
+    'checkpoint': {'checkpoint_max_age': 'CHECKPOINT_MAX_AGE'},
+}
 
-            # Check if task section exists in tasks.ini
-            if task_section not in config_parser:
-                logger.warning(f"No configuration found for Task_Id {task_id}")
-                task_index += 1
-                continue
+# Outcome of a task run, as reported in the batch summary
+TASK_SUCCEEDED = 'succeeded'
+TASK_FAILED = 'failed'
+TASK_TIMED_OUT = 'timed out'
+
+def load_task(task_id):
+    """Read function_name, module_path and parameters for a task, or None if it is not configured"""
+    task_section = f"Task_{task_id}"
+
+    # Check if task section exists in tasks.ini
+    if task_section not in config_parser:
+        logger.warning(f"No configuration found for Task_Id {task_id}")
+        return None
+
+    task_config = config_parser[task_section]
+    function_name = task_config.get('function_name')
+    module_path = task_config.get('module_path')
+
+    if not function_name or not module_path:
+        logger.warning(f"Missing function_name or module_path for Task_Id {task_id}")
+        return None
+
+    # Parse parameters
+    params = {}
+    for key, value in task_config.items():
+        if key not in RUNNER_KEYS:
+            # Convert 'None' string to None, handle other values
+            if value.lower() == 'none':
+                params[key] = None
+            else:
+                params[key] = value
+
+    for option, defaults in TASK_OPTION_DEFAULTS.items():
+        if not is_enabled(params.get(option)):
+            continue
+        for key, runner_key in defaults.items():
+            if key not in params and config_parser.has_option('TASK_RUNNER', runner_key):
+                params[key] = config_parser.get('TASK_RUNNER', runner_key)
+
+    return function_name, module_path, params
+
+def get_time_budget(task_id):
+    """Seconds a task may run, from time_budget in [Task_N] or TASK_TIME_BUDGET in [TASK_RUNNER]; 0 is unlimited"""
+    task_section = f"Task_{task_id}"
+    if config_parser.has_option(task_section, 'time_budget'):
+        return config_parser.getfloat(task_section, 'time_budget')
+    return config_parser.getfloat('TASK_RUNNER', 'TASK_TIME_BUDGET', fallback=0)
+
+def get_task_engine(task_id):
+    """Writer setting for a task, from engine in [Task_N] or ENGINE in [TASK_RUNNER]: auto, styled, streaming or csv"""
+    task_section = f"Task_{task_id}"
+    if config_parser.has_option(task_section, 'engine'):
+        return config_parser.get(task_section, 'engine').strip().lower()
+    return config_parser.get('TASK_RUNNER', 'ENGINE', fallback='auto').strip().lower()
 
-            # Get task details
-            try:
-                task_config = config_parser[task_section]
-                function_name = task_config.get('function_name')
-                module_path = task_config.get('module_path')
-
-                if not function_name or not module_path:
-                    logger.warning(f"Missing function_name or module_path for Task_Id {task_id}")
-                    task_index += 1
-                    continue
-
-                # Import the module and get the function
-                module = import_module(module_path)
-                task_function = getattr(module, function_name)
-
-                # Parse parameters
-                params = {}
-                for key, value in task_config.items():
-                    if key not in ['function_name', 'module_path']:
-                        # Convert 'None' string to None, handle other values
-                        if value.lower() == 'none':
-                            params[key] = None
-                        else:
-                            params[key] = value
-
-                # Log and execute the task
-                logger.info(f"Processing Task_Id {task_id} with function {function_name} and params {params}")
+def run_task(task_id, function_name, module_path, params, counted=None):
+    """Import and execute a single task function within its time budget, returning TASK_SUCCEEDED, TASK_FAILED or TASK_TIMED_OUT
+
+    counted is the (rows, source) of a preflight count made earlier in the batch, so the rows are not counted again.
+    """
+    budget = get_time_budget(task_id)
+    memory_profile = config_parser.getboolean('TASK_RUNNER', 'MEMORY_PROFILE', fallback=False)
+    progress_interval = config_parser.getfloat('TASK_RUNNER', 'PROGRESS_INTERVAL', fallback=DEFAULT_PROGRESS_INTERVAL)
+    start_task_context(task_id)
+    with time_budget(budget) as outputs, profile_task(task_id, memory_profile), track_progress(task_id, progress_interval):
+        try:
+            # Import the module and get the function
+            module = import_module(module_path)
+            task_function = getattr(module, function_name)
+
+            # Large registered reports are streamed instead of built as a styled workbook
+            thresholds = load_engine_thresholds(config_parser)
+            engine, _, _ = choose_task_engine(get_shared_db(), task_id, function_name, params, thresholds,
+                                              get_task_engine(task_id), counted)
+
+            # Log and execute the task
+            logger.info(f"Processing Task_Id {task_id} with function {function_name} and params {params}")
+            if engine == ENGINE_STYLED:
                 success = task_function(**params)
+            else:
+                success = run_engine_export(get_shared_db(), function_name, params, engine, thresholds)
+
+        except Exception as e:
+            # A budget stop is logged below, once
+            if not is_budget_timeout(e):
+                logger.error(f"Task {task_id} processing failed: {str(e)}", exc_info=True)
+            success = False
+
+        # Exporters return False on a budget stop too, so only the flag set when the budget stopped the task tells them apart
+        timed_out = not success and task_timed_out()
+        set_progress_state(TASK_TIMED_OUT if timed_out else TASK_SUCCEEDED if success else TASK_FAILED)
+
+    timings = close_phases()
+    logger.info(f"Task {task_id} phase timings: {timings}", extra={"phase_timings": timings})
+    end_task_context()
+
+    if timed_out:
+        removed = remove_partial_outputs(outputs)
+        logger.error(f"Task {task_id} exceeded its time budget of {budget:g}s" + (f"; removed partial output {removed}" if removed else ""))
+        return TASK_TIMED_OUT
+
+    if success:
+        logger.info(f"Task {task_id} processed successfully")
+        return TASK_SUCCEEDED
+
+    logger.warning(f"Task {task_id} processing failed or no data found")
+    return TASK_FAILED
 
+def run_shared_scan_tasks(tasks, write_processes=0, combine=True):
+    """Run tasks reading the same collection off one combined scan
+
+    Returns ({task_id: (success, seconds, rows)}, {task_id: (rows, source)}): the results of the
+    tasks served here, and the preflight counts made while choosing engines, for the tasks left to run_task.
+    """
+    from export.shared_scan import run_shared_scans
+
+    try:
+        db = get_shared_db()
+    except Exception as e:
+        logger.warning(f"Shared scan skipped: MongoDB connection unavailable: {e}")
+        return {}, {}
+
+    # The budget is enforced by run_task, so budgeted tasks always run on their own
+    # Shared scans build styled workbooks, so only tasks the preflight leaves on the styled path join one
+    thresholds = load_engine_thresholds(config_parser)
+    shared = []
+    counts = {}
+    for task_id, function_name, _, params in tasks:
+        if get_time_budget(task_id):
+            logger.info(f"Task {task_id} excluded from shared scan: runs with a time budget")
+            continue
+        try:
+            engine, _, counted = choose_task_engine(db, task_id, function_name, params, thresholds, get_task_engine(task_id))
+        except Exception as e:
+            # run_task repeats the check and reports the error as the task's failure
+            logger.info(f"Task {task_id} excluded from shared scan: {str(e)}")
+            continue
+        if counted is not None:
+            counts[task_id] = counted
+        if engine != ENGINE_STYLED:
+            logger.info(f"Task {task_id} excluded from shared scan: written by the {engine} engine")
+            continue
+        shared.append((task_id, function_name, params))
+
+    results = run_shared_scans(
+        db,
+        shared,
+        write_processes,
+        combine,
+        config_parser.getfloat('TASK_RUNNER', 'PROGRESS_INTERVAL', fallback=DEFAULT_PROGRESS_INTERVAL)
+    )
+    return results, counts
+
+def run_parallel_tasks(tasks, workers, history, counts=None):
+    """Run tasks on a process pool, longest estimate first, recording each run in history
+
+    counts holds {task_id: (rows, source)} of preflight counts already made in the batch.
+    """
+    from export.task_planner import plan_tasks, run_planned_tasks
+
+    counts = dict(counts or {})
+    planned = plan_tasks(get_shared_db(), tasks, history, load_engine_thresholds(config_parser), counts)
+    results = {}
+    for task_id, (status, seconds, profiles) in run_planned_tasks(planned, workers, counts).items():
+        results[task_id] = status
+        add_task_profiles(profiles)
+        if seconds is not None:
+            # Only exact counts give the history a cost per row
+            counted = counts.get(task_id)
+            record_run(history, task_id, seconds, counted[0] if counted and counted[1] == "count" else None)
+    return results
+
+def load_tasks(task_ids=None):
+    """Load the configured tasks as (task_id, function_name, module_path, params), in Task_list order"""
+    tasks = []
+    for task_id in (Task_list if task_ids is None else task_ids):
+        task = load_task(task_id)
+        if task is not None:
+            tasks.append((task_id, *task))
+    return tasks
+
+def run_batch(tasks):
+    """Run a batch of loaded tasks, returning {task_id: status}"""
+    results = {}
+    # Dimension caches of enriched exports are shared by the tasks of one batch only
+    clear_dimension_caches()
+    try:
+        # Tasks sharing a source collection are served by one scan per collection, and
+        # with WRITE_PROCESSES above 1 their workbooks are serialized on a process pool
+        shared_results, counts = {}, {}
+        shared_scan = config_parser.getboolean('TASK_RUNNER', 'SHARED_SCAN', fallback=False)
+        write_processes = config_parser.getint('TASK_RUNNER', 'WRITE_PROCESSES', fallback=0)
+        if shared_scan or write_processes > 1:
+            shared_results, counts = run_shared_scan_tasks(tasks, write_processes, shared_scan)
+
+        # Shared-scan runs go into the history too, so the longest-first planner can estimate them
+        history = load_history()
+        remaining = []
+        for task in tasks:
+            task_id = task[0]
+            if task_id in shared_results:
+                success, seconds, rows = shared_results[task_id]
+                record_run(history, task_id, seconds, rows)
+                results[task_id] = TASK_SUCCEEDED if success else TASK_FAILED
                 if success:
-                    logger.info(f"Task {task_id} processed successfully")
+                    logger.info(f"Task {task_id} processed successfully (shared scan)")
                 else:
-                    logger.warning(f"Task {task_id} processing failed or no data found")
+                    logger.warning(f"Task {task_id} processing failed or no data found (shared scan)")
+                continue
+            remaining.append(task)
 
-            except Exception as e:
-                logger.error(f"Task {task_id} processing failed: {str(e)}", exc_info=True)
-                success = False
+        # With TASK_WORKERS above 1 the remaining tasks run in parallel, longest first
+        task_workers = config_parser.getint('TASK_RUNNER', 'TASK_WORKERS', fallback=0)
+        if task_workers > 1 and len(remaining) > 1:
+            results.update(run_parallel_tasks(remaining, task_workers, history, counts))
+        else:
+            for task in remaining:
+                started = time.perf_counter()
+                results[task[0]] = run_task(*task, counted=counts.get(task[0]))
+                record_run(history, task[0], time.perf_counter() - started)
+        save_history(history)
 
-            task_index += 1
+        # With MEMORY_PROFILE on, the per-task and per-phase peaks go to a JSON report
+        if config_parser.getboolean('TASK_RUNNER', 'MEMORY_PROFILE', fallback=False):
+            write_profile_report()
 
     except Exception as e:
         logger.error(f"Task processing failed: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+    finally:
+        clear_dimension_caches()
+
+    log_batch_summary(results)
+    return results
+
+def log_batch_summary(results):
+    """Log how many tasks of a batch succeeded, failed or ran out of time"""
+    by_status = {}
+    for task_id, status in results.items():
+        by_status.setdefault(status, []).append(task_id)
+    logger.info("Batch summary: " + ", ".join(
+        f"{len(task_ids)} {status} {task_ids}" for status, task_ids in sorted(by_status.items())
+    ))
+
+def plan_batch_tasks(tasks):
+    """Print the query, index, row count, engine and projected output of each task without running it"""
+    from export.batch_plan import plan_batch
+
+    return plan_batch(get_shared_db(), tasks, load_engine_thresholds(config_parser), get_task_engine, load_history())
+
+def process_tasks(plan=False):
+    """Process tasks by calling functions specified in coreConfig.ini, or with plan only report what they would cost"""
+    if plan:
+        return plan_batch_tasks(load_tasks())
+    return run_batch(load_tasks())
@@ -1,20 +1,44 @@
+import argparse
 import logging
 import logging.config
-from export.task_processor import process_tasks
+from export.task_processor import config_parser, process_tasks
+from utils.connectDB import close_shared_client
+from utils.task_logging import configure_task_logging
 
 # Load logger configuration
 logging.config.fileConfig('config/logger/loggers.ini')
 logger = logging.getLogger('excel_data_writer')
 
+# Tag records with the task and phase, and with QUEUE_LOGGING write them from a listener thread
+configure_task_logging(config_parser.getboolean('TASK_RUNNER', 'QUEUE_LOGGING', fallback=False))
+
 def main():
     """Main entry point to run task processing"""
-    logger.info("Starting task processing script (single execution)...")
+    parser = argparse.ArgumentParser(description="Run the Excel export tasks in coreConfig.ini")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and execute each task on the schedule in its [Task_N] section")
+    parser.add_argument("--plan", action="store_true",
+                        help="Print each task's query, index, row count, engine and projected size without exporting")
+    args = parser.parse_args()
+
+    if args.daemon:
+        from export.scheduler import run_scheduler
+        logger.info("Starting task scheduler (daemon mode)...")
+        run_scheduler()
+        return
+
+    if args.plan:
+        logger.info("Planning task batch (dry run, no files written)...")
+    else:
+        logger.info("Starting task processing script (single execution)...")
     try:
-        process_tasks()
-        logger.info("Task processing completed successfully")
+        process_tasks(plan=args.plan)
+        logger.info("Task planning completed" if args.plan else "Task processing completed successfully")
     except Exception as e:
         logger.error(f"Task processing failed: {str(e)}", exc_info=True)
         raise
+    finally:
+        close_shared_client()
 
 if __name__ == "__main__":
     logger.debug("Entering main execution block")
@@ -0,0 +1,78 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from utils import fragment_cache
+from utils.fragment_cache import fetch_with_fragments
+from utils.query_matcher import document_matches
+
+HEADERS = ["Account_Num", "Incident_Status", "Created_Dtm"]
+
+
+class FragmentCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = mock.patch.object(fragment_cache, "FRAGMENT_DIR", self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.day = datetime.combine(datetime.now().date() - timedelta(days=5), datetime.min.time())
+        self.documents = [
+            {"Account_Num": "A1", "Incident_Status": "Incident Open", "Created_Dtm": self.day + timedelta(hours=1)},
+            {"Account_Num": "A2", "Incident_Status": "Incident Open", "Created_Dtm": self.day + timedelta(hours=2)},
+        ]
+        self.date_range = {"$gte": self.day, "$lte": self.day + timedelta(days=1) - timedelta(seconds=1)}
+
+    def open_cursor(self, query):
+        return [document for document in self.documents if document_matches(document, query)]
+
+    def export(self, query):
+        return fetch_with_fragments(self.open_cursor, "incidents_details", query, HEADERS)
+
+    def fragment_files(self):
+        return [name for _, _, names in os.walk(self.directory) for name in names]
+
+    def test_status_filter_is_never_cached(self):
+        query = {"Incident_Status": "Incident Open", "Created_Dtm": self.date_range}
+        self.assertEqual(len(self.export(query)), 2)
+
+        self.documents[0]["Incident_Status"] = "Incident close"
+        rows = self.export(query)
+
+        self.assertEqual([row["Account_Num"] for row in rows], ["A2"])
+        self.assertEqual(self.fragment_files(), [])
+
+    def test_expired_fragment_is_read_again(self):
+        query = {"Created_Dtm": self.date_range}
+        self.assertEqual([row[1] for row in self.export(query)], ["Incident Open", "Incident Open"])
+        self.documents[0]["Incident_Status"] = "Incident close"
+
+        # Within FRAGMENT_MAX_AGE the cached day is reused
+        self.assertEqual([row[1] for row in self.export(query)], ["Incident Open", "Incident Open"])
+
+        # Age the fragment past FRAGMENT_MAX_AGE
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as fragment_file:
+                    fragment = pickle.load(fragment_file)
+                fragment["written_at"] -= timedelta(hours=fragment_cache.FRAGMENT_MAX_AGE + 1)
+                with open(path, 'wb') as fragment_file:
+                    pickle.dump(fragment, fragment_file)
+
+        self.assertEqual([row[1] for row in self.export(query)], ["Incident close", "Incident Open"])
+
+    def test_mutable_days_covers_the_day(self):
+        query = {"Created_Dtm": self.date_range}
+        fetch_with_fragments(self.open_cursor, "incidents_details", query, HEADERS, mutable_days=10)
+        self.assertEqual(self.fragment_files(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
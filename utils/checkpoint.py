@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import pickle
+import time
+from bson import json_util
+from utils.row_stream import compact_row
+from utils.time_budget import check_deadline
+
+logger = logging.getLogger('excel_data_writer')
+
+CHECKPOINT_DIR = os.path.join("exports", "checkpoints")
+
+# Rows fetched between two checkpoint writes
+CHECKPOINT_INTERVAL = 5000
+
+# Hours a checkpoint is resumed after its first batch; older spools are dropped and the export starts over.
+# 0 keeps them until the export finishes. A task sets its own with checkpoint_max_age, or CHECKPOINT_MAX_AGE in [TASK_RUNNER]
+CHECKPOINT_MAX_AGE = 24
+
+
+def checkpoint_key(report_name, query, headers, server_format=False):
+    """Stable key for a report run, so a retry with the same query, columns and formatting finds its checkpoint"""
+    key_text = json_util.dumps({"query": query, "headers": list(headers), "server_format": bool(server_format)}, sort_keys=True)
+    return f"{report_name}_{hashlib.sha1(key_text.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _paths(key):
+    base = os.path.join(CHECKPOINT_DIR, key)
+    return f"{base}.state.json", f"{base}.rows.pkl"
+
+
+def load_checkpoint(key):
+    """Return the saved state (last_id, row_count, spool_bytes, created_at) for a key, or None"""
+    state_path, _ = _paths(key)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, 'r', encoding='utf-8') as state_file:
+        return json_util.loads(state_file.read())
+
+
+def _save_state(key, state):
+    state_path, _ = _paths(key)
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as state_file:
+        state_file.write(json_util.dumps(state))
+    os.replace(temp_path, state_path)
+
+
+def read_checkpoint_rows(key, state):
+    """Load the rows written before the checkpoint, dropping any batch appended after the last saved state"""
+    _, rows_path = _paths(key)
+    rows = []
+    if not os.path.exists(rows_path):
+        return rows
+
+    with open(rows_path, 'r+b') as rows_file:
+        # A batch written without its state update is re-fetched, so discard it
+        rows_file.truncate(state["spool_bytes"])
+        while rows_file.tell() < state["spool_bytes"]:
+            rows.extend(pickle.load(rows_file))
+    return rows
+
+
+def append_checkpoint_rows(key, batch, state, last_id):
+    """Append a batch of rows to the spool and then record the batch's last _id"""
+    _, rows_path = _paths(key)
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+
+    with open(rows_path, 'ab') as rows_file:
+        pickle.dump(batch, rows_file, protocol=pickle.HIGHEST_PROTOCOL)
+        rows_file.flush()
+        os.fsync(rows_file.fileno())
+        spool_bytes = rows_file.tell()
+
+    state = {
+        "last_id": last_id,
+        "row_count": state["row_count"] + len(batch),
+        "spool_bytes": spool_bytes,
+        "created_at": state["created_at"],
+    }
+    _save_state(key, state)
+    return state
+
+
+def clear_checkpoint(key):
+    """Remove a checkpoint once its workbook has been saved"""
+    for path in _paths(key):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def checkpoint_expired(state, max_age):
+    """True for a state older than max_age hours, or written before states carried created_at"""
+    if "created_at" not in state:
+        return True
+    return bool(max_age) and time.time() - state["created_at"] > max_age * 3600
+
+
+def fetch_with_checkpoint(open_cursor, query, key, headers, interval=CHECKPOINT_INTERVAL, max_age=None):
+    """Fetch rows in _id order, persisting progress so a failed run resumes after the last saved _id
+
+    open_cursor(query) must return an iterable sorted by _id ascending. Rows are kept as
+    compact tuples of the header values, which keeps both the spool and the in-memory rows small.
+    A checkpoint older than max_age hours (CHECKPOINT_MAX_AGE when None) is dropped rather than resumed.
+    """
+    max_age = CHECKPOINT_MAX_AGE if max_age is None else float(max_age)
+    state = load_checkpoint(key)
+    if state and checkpoint_expired(state, max_age):
+        logger.info(f"Dropping expired checkpoint {key} of {state['row_count']} rows; fetching from the start")
+        clear_checkpoint(key)
+        state = None
+    if state:
+        rows = read_checkpoint_rows(key, state)
+        logger.info(f"Resuming {key} from checkpoint: {state['row_count']} rows already fetched, last _id {state['last_id']}")
+        resume_query = {"$and": [query, {"_id": {"$gt": state["last_id"]}}]}
+    else:
+        rows = []
+        state = {"last_id": None, "row_count": 0, "spool_bytes": 0, "created_at": time.time()}
+        resume_query = query
+
+    batch = []
+    last_id = None
+    for document in open_cursor(resume_query):
+        batch.append(compact_row(document, headers))
+        last_id = document["_id"]
+
+        if len(batch) >= interval:
+            state = append_checkpoint_rows(key, batch, state, last_id)
+            rows.extend(batch)
+            batch = []
+            check_deadline()
+
+    if batch:
+        state = append_checkpoint_rows(key, batch, state, last_id)
+        rows.extend(batch)
+
+    return rows
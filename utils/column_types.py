@@ -0,0 +1,93 @@
+from datetime import datetime, date
+from decimal import Decimal
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+
+# Excel number formats applied to typed cells
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+AMOUNT_FORMAT = '#,##0.00'
+COUNT_FORMAT = '0'
+
+# Column type registry keyed by the header names used in the export modules
+COLUMN_TYPES = {
+    # Timestamps
+    "Created_Dtm": "datetime",
+    "Rejected_Dtm": "datetime",
+    "created_dtm": "datetime",
+    "proceed_on": "datetime",
+
+    # Monetary amounts
+    "Arrears": "amount",
+    "Amount": "amount",
+    "tot_arrease": "amount",
+    "total_arrears": "amount",
+
+    # Whole number counts
+    "case_count": "count",
+    "Monitor_Months": "count",
+
+    # Identifiers (ObjectIds are written as text)
+    "Id": "id",
+    "Incident_Id": "id",
+    "case_id": "id",
+    "Batch_id": "id",
+    "drc_id": "id",
+}
+
+
+def _to_datetime(value):
+    """Keep native datetimes and promote plain dates so Excel stores a serial date"""
+    if isinstance(value, datetime):
+        return value, DATETIME_FORMAT
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day), DATETIME_FORMAT
+    return value, None
+
+
+def _to_number(value, number_format):
+    """Convert Mongo/str numerics to int or float, leaving anything non-numeric untouched"""
+    if isinstance(value, bool):
+        return value, None
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    if isinstance(value, Decimal):
+        return float(value), number_format
+    if isinstance(value, (int, float)):
+        return value, number_format
+    if isinstance(value, str) and value.strip():
+        try:
+            number = float(value.replace(',', ''))
+        except ValueError:
+            return value, None
+        return (int(number) if number.is_integer() and number_format == COUNT_FORMAT else number), number_format
+    return value, None
+
+
+def _to_id(value):
+    """ObjectIds have no Excel equivalent, so write them as their hex string"""
+    if isinstance(value, ObjectId):
+        return str(value), None
+    return value, None
+
+
+def _passthrough(value):
+    return value, None
+
+
+# Precomputed converters so the row loop does a single dict lookup per column
+_CONVERTERS = {
+    "datetime": _to_datetime,
+    "amount": lambda value: _to_number(value, AMOUNT_FORMAT),
+    "count": lambda value: _to_number(value, COUNT_FORMAT),
+    "id": _to_id,
+}
+
+
+def get_column_converter(header):
+    """Return the converter for a header; it maps a raw value to (cell value, number format or None)"""
+    return _CONVERTERS.get(COLUMN_TYPES.get(header), _passthrough)
+
+
+def get_column_converters(headers):
+    """Return the converters for a header list, in column order"""
+    return [get_column_converter(header) for header in headers]
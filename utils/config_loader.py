@@ -18,4 +18,24 @@ def get_config():
         return config
     except Exception as e:
         logger.error(f"Failed to load configuration: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+def is_enabled(value):
+    """
+    Interpret an optional task parameter such as 'True', 'yes' or '1' as a boolean.
+    """
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    return str(value).strip().lower() in ('true', 'yes', '1', 'on')
+
+
+def is_option_set(value):
+    """
+    True for an optional task parameter that is switched on or holds a value such as a partition count.
+    """
+    if value is None:
+        return False
+    return is_enabled(value) or str(value).strip().lower() not in ('false', 'no', '0', 'off', '')
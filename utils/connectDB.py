@@ -1,5 +1,8 @@
 from pymongo import MongoClient
 import logging
+import os
+import threading
+from utils.config_loader import get_config
 
 logger = logging.getLogger('excel_data_writer')
 
@@ -23,4 +26,48 @@ def get_db_connection(config):
         return db
     except Exception as e:
         logger.error(f"Error connecting to MongoDB: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+# Process-wide client, kept open between tasks so its connection pool stays warm
+_shared_client = None
+_shared_db_name = None
+_shared_pid = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_db(config=None):
+    """
+    Return the database from a process-wide MongoClient, creating the client on first use.
+    """
+    global _shared_client, _shared_db_name, _shared_pid
+
+    with _shared_lock:
+        # A client inherited from the parent of a worker process must not be reused
+        if _shared_client is None or _shared_pid != os.getpid():
+            config = config or get_config()
+            mongo_uri = config['DATABASE'].get('MONGO_URI', '').strip()
+            db_name = config['DATABASE'].get('DB_NAME', '').strip()
+
+            if not mongo_uri or not db_name:
+                raise ValueError("Missing MONGO_URI or DB_NAME in the configuration.")
+
+            _shared_client = MongoClient(mongo_uri)
+            _shared_db_name = db_name
+            _shared_pid = os.getpid()
+            logger.info(f"Connected to MongoDB successfully | Database name: {db_name}")
+
+    return _shared_client[_shared_db_name]
+
+
+def close_shared_client():
+    """
+    Close the process-wide MongoClient, if one was opened.
+    """
+    global _shared_client
+
+    with _shared_lock:
+        if _shared_client is not None:
+            _shared_client.close()
+            _shared_client = None
+            logger.info("MongoDB connection closed")
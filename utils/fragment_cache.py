@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import pickle
+from datetime import datetime, timedelta
+from bson import json_util
+from utils.row_stream import compact_row
+
+logger = logging.getLogger('excel_data_writer')
+
+FRAGMENT_DIR = os.path.join("exports", "fragments")
+
+# Days up to and including today that are still changing, so always queried and never cached;
+# a task sets its own with fragment_mutable_days, or FRAGMENT_MUTABLE_DAYS in [TASK_RUNNER]
+FRAGMENT_MUTABLE_DAYS = 1
+
+# Hours a cached fragment is reused before its day is queried again; 0 keeps fragments until
+# their files are removed. A task sets its own with fragment_max_age, or FRAGMENT_MAX_AGE in [TASK_RUNNER]
+FRAGMENT_MAX_AGE = 24
+
+# Fields updated after a document is created; a query filtering on one selects different
+# documents for the same day over time, so its days are never cached
+FRAGMENT_CHANGEABLE_FIELDS = ("Incident_Status", "Actions")
+
+
+def _fragment_dir(report_name, base_query, headers):
+    """Directory holding one report's fragments for one set of non-date filters"""
+    key_text = json_util.dumps({"query": base_query, "headers": list(headers)}, sort_keys=True)
+    return os.path.join(FRAGMENT_DIR, f"{report_name}_{hashlib.sha1(key_text.encode('utf-8')).hexdigest()[:16]}")
+
+
+def _fragment_path(directory, day):
+    return os.path.join(directory, f"{day.isoformat()}.pkl")
+
+
+def _load_fragment(path, max_age):
+    """A day's cached rows, or None when the fragment is older than max_age hours"""
+    with open(path, 'rb') as fragment_file:
+        fragment = pickle.load(fragment_file)
+    # Fragments written before they carried a written_at time are treated as expired
+    if not isinstance(fragment, dict):
+        return None
+    if max_age and datetime.now() - fragment["written_at"] > timedelta(hours=max_age):
+        return None
+    return fragment["rows"]
+
+
+def _save_fragment(path, rows):
+    """Write a day's rows with the time they were read, atomically, so a reader never sees a partial fragment"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as fragment_file:
+        pickle.dump({"written_at": datetime.now(), "rows": rows}, fragment_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def _missing_runs(days):
+    """Group days into runs of consecutive days, so each run is one range query"""
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][-1] + timedelta(days=1):
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
+
+
+def fetch_with_fragments(open_cursor, report_name, query, headers, date_field="Created_Dtm", mutable_days=None, max_age=None):
+    """Fetch a date-range report day by day, reusing cached fragments for days that can no longer change
+
+    query must bound date_field with $gte and $lte and must not filter on FRAGMENT_CHANGEABLE_FIELDS.
+    Days wholly inside the range and older than mutable_days (FRAGMENT_MUTABLE_DAYS when None) are
+    read from the cache when present and younger than max_age hours (FRAGMENT_MAX_AGE when None),
+    and cached after they are fetched; the rest are queried every time. Missing days are fetched
+    with one range query per run of consecutive days. open_cursor(query) returns the
+    documents of a query; rows come back in day order as compact tuples of the header values.
+    """
+    date_range = query.get(date_field)
+    if not isinstance(date_range, dict) or set(date_range) != {"$gte", "$lte"}:
+        logger.info(f"Fragment cache skipped for {report_name}: {date_field} is not a $gte/$lte range")
+        return list(open_cursor(query))
+    changeable = [field for field in FRAGMENT_CHANGEABLE_FIELDS if field in query]
+    if changeable:
+        logger.warning(f"Fragment cache skipped for {report_name}: the query filters on {', '.join(changeable)}, which change after {date_field}")
+        return list(open_cursor(query))
+
+    mutable_days = FRAGMENT_MUTABLE_DAYS if mutable_days is None else int(mutable_days)
+    max_age = FRAGMENT_MAX_AGE if max_age is None else float(max_age)
+
+    start, end = date_range["$gte"], date_range["$lte"]
+    base_query = {field: condition for field, condition in query.items() if field != date_field}
+    directory = _fragment_dir(report_name, base_query, headers)
+    first_mutable = datetime.now().date() - timedelta(days=mutable_days - 1)
+
+    days = []
+    day = start.date()
+    while day <= end.date():
+        days.append(day)
+        day += timedelta(days=1)
+
+    def cacheable(day):
+        day_start = datetime.combine(day, datetime.min.time())
+        return day < first_mutable and start <= day_start and end >= day_start + timedelta(days=1) - timedelta(seconds=1)
+
+    rows_by_day = {}
+    for day in days:
+        path = _fragment_path(directory, day)
+        if cacheable(day) and os.path.exists(path):
+            rows = _load_fragment(path, max_age)
+            if rows is not None:
+                rows_by_day[day] = rows
+
+    missing = [day for day in days if day not in rows_by_day]
+    logger.info(f"Fragment cache for {report_name}: {len(rows_by_day)} of {len(days)} days cached, querying {len(missing)}")
+
+    for run in _missing_runs(missing):
+        run_start = max(start, datetime.combine(run[0], datetime.min.time()))
+        run_end = datetime.combine(run[-1] + timedelta(days=1), datetime.min.time())
+        range_query = dict(base_query, **{date_field: {"$gte": run_start, "$lt": run_end, "$lte": end}})
+
+        for day in run:
+            rows_by_day[day] = []
+        for document in open_cursor(range_query):
+            rows_by_day[document[date_field].date()].append(compact_row(document, headers))
+
+        for day in run:
+            if cacheable(day):
+                _save_fragment(_fragment_path(directory, day), rows_by_day[day])
+
+    return [row for day in days for row in rows_by_day[day]]
@@ -0,0 +1,115 @@
+"""Opt-in tracemalloc profiling of task memory, per task and per phase (fetch, cells, save)"""
+
+import json
+import logging
+import os
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from utils.task_logging import enter_phase
+
+logger = logging.getLogger('excel_data_writer')
+
+# Allocation sites kept per phase
+TOP_SITES = 10
+
+# Stack depth recorded per allocation; deeper stacks cost more memory while profiling
+TRACE_FRAMES = 1
+
+# Profile of the task running in this process while profiling is on
+_current = None
+
+# Finished task profiles, keyed by task id, waiting to be written
+_profiles = {}
+
+
+def _top_sites(before, after):
+    """Largest allocation growth between two snapshots, by source line"""
+    stats = after.compare_to(before, 'lineno')
+    return [
+        {"site": str(stat.traceback[0]), "size_bytes": stat.size_diff, "count": stat.count_diff}
+        for stat in stats[:TOP_SITES] if stat.size_diff > 0
+    ]
+
+
+def _end_phase():
+    """Record the peak and allocation sites of the phase in progress"""
+    phase = _current["phase"]
+    if phase is None:
+        return
+    current, peak = tracemalloc.get_traced_memory()
+    _current["phases"][phase["name"]] = {
+        "peak_bytes": peak,
+        "net_bytes": current - phase["start_bytes"],
+        "top_sites": _top_sites(phase["snapshot"], tracemalloc.take_snapshot()),
+    }
+    _current["peak_bytes"] = max(_current["peak_bytes"], peak)
+    _current["phase"] = None
+
+
+def mark_phase(name):
+    """End the current phase and start the named one, for the phase timings and, while profiling, the memory profile"""
+    enter_phase(name)
+    if _current is None:
+        return
+    _end_phase()
+    tracemalloc.reset_peak()
+    _current["phase"] = {
+        "name": name,
+        "start_bytes": tracemalloc.get_traced_memory()[0],
+        "snapshot": tracemalloc.take_snapshot(),
+    }
+
+
+@contextmanager
+def profile_task(task_id, enabled=True):
+    """Trace the enclosed task's allocations, keeping its profile for write_profile_report"""
+    global _current
+    if not enabled:
+        yield
+        return
+
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(TRACE_FRAMES)
+    _current = {"peak_bytes": 0, "phases": {}, "phase": None}
+    mark_phase("setup")
+    try:
+        yield
+    finally:
+        _end_phase()
+        profile = _current
+        _current = None
+        if started_here:
+            tracemalloc.stop()
+        del profile["phase"]
+        _profiles[str(task_id)] = profile
+        logger.info(f"Task {task_id} memory peak {profile['peak_bytes'] / 1048576:.1f} MiB | " + ", ".join(
+            f"{name} {phase['peak_bytes'] / 1048576:.1f} MiB" for name, phase in profile["phases"].items()
+        ))
+
+
+def pop_task_profiles():
+    """Return the profiles gathered in this process and forget them"""
+    profiles = dict(_profiles)
+    _profiles.clear()
+    return profiles
+
+
+def add_task_profiles(profiles):
+    """Merge profiles gathered in worker processes"""
+    _profiles.update(profiles)
+
+
+def write_profile_report(output_dir="exports"):
+    """Write the gathered task profiles to a timestamped JSON report, returning its path or None"""
+    profiles = pop_task_profiles()
+    if not profiles:
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    filepath = os.path.join(output_dir, f"memory_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(filepath, 'w', encoding='utf-8') as report_file:
+        json.dump({"generated_at": datetime.now().isoformat(timespec='seconds'), "tasks": profiles}, report_file, indent=2)
+    logger.info(f"Memory profile written to {filepath}")
+    return filepath
@@ -0,0 +1,128 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING
+from utils.report_query import fetch_rows
+from utils.row_stream import compact_rows
+
+logger = logging.getLogger('excel_data_writer')
+
+# Fields a report can be range-partitioned on, with the BSON type of their values
+PARTITION_FIELD_TYPES = {
+    "_id": "objectId",
+    "Created_Dtm": "date",
+}
+
+# Sampled documents per partition when choosing split points
+SAMPLES_PER_PARTITION = 20
+
+
+def _sample_split_points(collection, query, field, partitions):
+    """Pick split points from a random sample of the matching documents"""
+    pipeline = [
+        {"$match": query},
+        {"$sample": {"size": partitions * SAMPLES_PER_PARTITION}},
+        {"$project": {"_id": 0, "value": f"${field}"}},
+    ]
+    values = sorted(
+        document["value"] for document in collection.aggregate(pipeline, allowDiskUse=True)
+        if isinstance(document.get("value"), (ObjectId, datetime))
+    )
+    if not values:
+        return []
+    step = len(values) / partitions
+    return sorted({values[int(step * index)] for index in range(1, partitions) if int(step * index) < len(values)})
+
+
+def _bucket_auto_split_points(collection, query, field, partitions):
+    """Pick split points with $bucketAuto; exact, but the server reads every matching key"""
+    pipeline = [
+        {"$match": {"$and": [query, {field: {"$type": PARTITION_FIELD_TYPES[field]}}]}},
+        {"$bucketAuto": {"groupBy": f"${field}", "buckets": partitions}},
+    ]
+    buckets = list(collection.aggregate(pipeline, allowDiskUse=True))
+    return [bucket["_id"]["min"] for bucket in buckets[1:]]
+
+
+def build_partition_queries(collection, query, partitions, field="_id", method="sample"):
+    """Split a query into disjoint range queries on field, in ascending field order
+
+    The first and last ranges are open-ended, so every document matched by the query
+    falls into exactly one range whatever the split points are. _id values are assumed
+    to be ObjectIds; for other fields, documents whose value is missing or not of the
+    expected type get an extra partition of their own.
+    """
+    if field not in PARTITION_FIELD_TYPES:
+        raise ValueError(f"Invalid partition field '{field}'. Must be one of: {', '.join(PARTITION_FIELD_TYPES)}")
+
+    if method == "bucket_auto":
+        split_points = _bucket_auto_split_points(collection, query, field, partitions)
+    elif method == "sample":
+        split_points = _sample_split_points(collection, query, field, partitions)
+    else:
+        raise ValueError(f"Invalid split method '{method}'. Must be 'sample' or 'bucket_auto'")
+
+    bounds = [None] + split_points + [None]
+    queries = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        field_range = {}
+        if lower is not None:
+            field_range["$gte"] = lower
+        if upper is not None:
+            field_range["$lt"] = upper
+        if not field_range:
+            # No split points: a single partition holding the whole query
+            if field == "_id":
+                queries.append(query)
+                continue
+            field_range["$type"] = PARTITION_FIELD_TYPES[field]
+        queries.append({"$and": [query, {field: field_range}]})
+
+    if field != "_id":
+        queries.append({"$and": [query, {field: {"$not": {"$type": PARTITION_FIELD_TYPES[field]}}}]})
+
+    return queries
+
+
+def fetch_partitioned(open_cursor, partition_queries, workers=None, max_pending=None):
+    """Read the partitions concurrently on a thread pool and yield their rows in partition order
+
+    open_cursor(query) returns the cursor for one partition; it should sort on the
+    partition field so the concatenated output is ordered. max_pending caps the
+    partitions read ahead of the one being yielded, bounding memory when the
+    consumer is slower than the reads; by default every partition is queued at once.
+    """
+    workers = workers or len(partition_queries)
+    max_pending = max_pending or len(partition_queries)
+    logger.info(f"Fetching {len(partition_queries)} partitions on {workers} threads")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        queries = iter(enumerate(partition_queries))
+        for index, query in islice(queries, max_pending):
+            pending.append((index, executor.submit(lambda query: list(open_cursor(query)), query)))
+
+        while pending:
+            index, future = pending.popleft()
+            rows = future.result()
+            for next_index, query in islice(queries, 1):
+                pending.append((next_index, executor.submit(lambda query: list(open_cursor(query)), query)))
+            logger.info(f"Partition {index + 1}/{len(partition_queries)} returned {len(rows)} rows")
+            yield from rows
+
+
+def fetch_rows_partitioned(collection, query, headers, partitions, field="_id", method="sample", server_format=False):
+    """Yield a report query's compact rows read on parallel range cursors, in field order
+
+    The generator can feed a streaming writer directly; only the partitions being read ahead are held in memory.
+    """
+    partition_queries = build_partition_queries(collection, query, partitions, field, method)
+    return fetch_partitioned(
+        lambda partition_query: compact_rows(
+            fetch_rows(collection, partition_query, headers, server_format, sort=[(field, ASCENDING)]), headers
+        ),
+        partition_queries
+    )
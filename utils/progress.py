@@ -0,0 +1,178 @@
+"""Progress of the running export (rows written, throughput, percent complete, ETA) for the log, status files and listeners"""
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger('excel_data_writer')
+
+# One JSON status file per task, rewritten at each report, for metrics exporters and job-status endpoints
+PROGRESS_DIR = os.path.join("exports", "progress")
+
+# Seconds between two progress reports when [TASK_RUNNER] PROGRESS_INTERVAL is not set
+DEFAULT_PROGRESS_INTERVAL = 10
+
+# Progress of the task running in this process while it is tracked
+_progress = None
+
+# Callables given each snapshot as it is reported, for in-process consumers
+_listeners = []
+
+
+def add_progress_listener(callback):
+    """Call callback(snapshot) with every progress report made in this process"""
+    _listeners.append(callback)
+
+
+def remove_progress_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def _status_path(task_id):
+    return os.path.join(PROGRESS_DIR, f"{task_id}.json")
+
+
+def progress_snapshot():
+    """Rows written, rows per second, percent complete and ETA of the tracked task, or None"""
+    if _progress is None:
+        return None
+
+    now = time.monotonic()
+    rows, total = _progress["rows"], _progress["total"]
+    # While running, throughput over the last report window follows the current writer;
+    # the final report gives the average over the whole task
+    window_rows = rows - _progress["window_rows"]
+    window_seconds = now - _progress["window_started"]
+    if _progress["state"] != "running" or window_rows <= 0 or window_seconds <= 0:
+        window_rows, window_seconds = rows, now - _progress["started"]
+    rate = window_rows / window_seconds if window_seconds > 0 else 0.0
+
+    percent = eta = None
+    if total:
+        percent = round(min(rows / total, 1.0) * 100, 1)
+        eta = round(max(total - rows, 0) / rate, 1) if rate else None
+
+    return {
+        "task_id": _progress["task_id"],
+        "state": _progress["state"],
+        "rows": rows,
+        "total_rows": total,
+        "percent": percent,
+        "rows_per_second": round(rate, 1),
+        "eta_seconds": eta,
+        "elapsed_seconds": round(now - _progress["started"], 1),
+        "updated_at": datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def _write_status(snapshot):
+    """Replace the task's status file atomically, so a reader never sees a partial file"""
+    try:
+        os.makedirs(PROGRESS_DIR, exist_ok=True)
+        path = _status_path(snapshot["task_id"])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as status_file:
+            json.dump(snapshot, status_file)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write progress status for Task {snapshot['task_id']}: {e}")
+
+
+def _emit():
+    snapshot = progress_snapshot()
+    if snapshot["total_rows"]:
+        eta = f"{snapshot['eta_seconds']:.0f}s" if snapshot["eta_seconds"] is not None else "unknown"
+        message = (f"Task {snapshot['task_id']} progress: {snapshot['rows']}/{snapshot['total_rows']} rows "
+                   f"({snapshot['percent']}%), {snapshot['rows_per_second']:.0f} rows/s, ETA {eta}")
+    else:
+        message = f"Task {snapshot['task_id']} progress: {snapshot['rows']} rows, {snapshot['rows_per_second']:.0f} rows/s"
+    logger.info(message, extra={"progress": snapshot})
+    _write_status(snapshot)
+    for callback in list(_listeners):
+        try:
+            callback(snapshot)
+        except Exception as e:
+            logger.warning(f"Progress listener failed: {e}")
+
+    _progress["window_rows"] = _progress["rows"]
+    _progress["window_started"] = time.monotonic()
+
+
+@contextmanager
+def track_progress(task_id, interval=DEFAULT_PROGRESS_INTERVAL):
+    """Report the enclosed task's progress every interval seconds; 0 turns reporting off"""
+    global _progress
+    if not interval:
+        yield
+        return
+
+    now = time.monotonic()
+    _progress = {
+        "task_id": str(task_id), "state": "running", "interval": float(interval),
+        "rows": 0, "total": None, "started": now, "window_rows": 0, "window_started": now,
+    }
+    try:
+        yield
+    finally:
+        if _progress["state"] == "running":
+            _progress["state"] = "finished"
+        _emit()
+        _progress = None
+
+
+def set_progress_state(state):
+    """Set the state reported for the tracked task, such as its outcome before tracking ends"""
+    if _progress is not None:
+        _progress["state"] = state
+
+
+def set_expected_rows(total):
+    """Record the row count the tracked task is expected to write, for percent complete and ETA"""
+    if _progress is not None:
+        _progress["total"] = total
+
+
+def report_progress(rows, total=None):
+    """Record rows written so far by the current writer, reporting once the interval has passed
+
+    Called from the row loops every CHECK_INTERVAL rows, so the cost per row stays a counter check.
+    Writers report 0 rows as they start, so time spent fetching is not counted as writing.
+    """
+    if _progress is None:
+        return
+    # A writer starting, such as the next sheet or CSV run
+    if rows == 0 or rows < _progress["rows"]:
+        _progress["window_rows"] = 0
+        _progress["window_started"] = time.monotonic()
+    _progress["rows"] = rows
+    if total is not None:
+        _progress["total"] = total
+    if time.monotonic() - _progress["window_started"] >= _progress["interval"]:
+        _emit()
+
+
+def read_progress(task_id=None):
+    """Status of one task, or of every task with a status file, as written by the running exports
+
+    Works from any process, such as a metrics exporter or an API job-status endpoint.
+    """
+    if task_id is not None:
+        try:
+            with open(_status_path(task_id), encoding='utf-8') as status_file:
+                return json.load(status_file)
+        except (OSError, ValueError):
+            return None
+
+    if not os.path.isdir(PROGRESS_DIR):
+        return {}
+    statuses = {}
+    for name in sorted(os.listdir(PROGRESS_DIR)):
+        if name.endswith(".json"):
+            status = read_progress(name[:-len(".json")])
+            if status is not None:
+                statuses[status["task_id"]] = status
+    return statuses
@@ -0,0 +1,126 @@
+import re
+
+# Operators the in-process matcher can evaluate; anything else keeps a task on its own query
+SUPPORTED_OPERATORS = {"$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte", "$regex", "$options", "$exists"}
+
+
+def is_supported_query(query):
+    """Check whether every operator in a find() filter can be evaluated by document_matches"""
+    for field, condition in query.items():
+        if field in ("$and", "$or"):
+            if not all(is_supported_query(sub_query) for sub_query in condition):
+                return False
+        elif field.startswith('$'):
+            return False
+        elif isinstance(condition, dict) and any(key.startswith('$') for key in condition):
+            if not set(condition).issubset(SUPPORTED_OPERATORS):
+                return False
+    return True
+
+
+def query_fields(query):
+    """Field paths a find() filter reads, including those inside $and and $or"""
+    fields = []
+    for field, condition in query.items():
+        if field in ("$and", "$or"):
+            for sub_query in condition:
+                fields.extend(query_fields(sub_query))
+        elif not field.startswith('$'):
+            fields.append(field)
+    return fields
+
+
+def _get_field(document, field):
+    """Resolve a dotted field path, returning (found, value)"""
+    value = document
+    for part in field.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return False, None
+    return True, value
+
+
+def _candidates(value):
+    """Mongo compares array fields element-wise as well as as a whole"""
+    if isinstance(value, list):
+        return [value] + value
+    return [value]
+
+
+def _compare(value, operand, compare):
+    try:
+        return compare(value, operand)
+    except TypeError:
+        return False
+
+
+def _match_regex(value, pattern, options=""):
+    flags = 0
+    if 'i' in options:
+        flags |= re.IGNORECASE
+    if 'm' in options:
+        flags |= re.MULTILINE
+    if 's' in options:
+        flags |= re.DOTALL
+    if 'x' in options:
+        flags |= re.VERBOSE
+    return isinstance(value, str) and re.search(pattern, value, flags) is not None
+
+
+def _match_operators(found, value, condition):
+    for operator, operand in condition.items():
+        if operator == "$options":
+            continue
+        values = _candidates(value) if found else []
+
+        if operator == "$exists":
+            matched = found == bool(operand)
+        elif operator == "$eq":
+            matched = any(candidate == operand for candidate in values) or (not found and operand is None)
+        elif operator == "$ne":
+            matched = not (any(candidate == operand for candidate in values) or (not found and operand is None))
+        elif operator == "$in":
+            matched = any(candidate in operand for candidate in values) or (not found and None in operand)
+        elif operator == "$nin":
+            matched = not (any(candidate in operand for candidate in values) or (not found and None in operand))
+        elif operator == "$gt":
+            matched = any(_compare(candidate, operand, lambda a, b: a > b) for candidate in values)
+        elif operator == "$gte":
+            matched = any(_compare(candidate, operand, lambda a, b: a >= b) for candidate in values)
+        elif operator == "$lt":
+            matched = any(_compare(candidate, operand, lambda a, b: a < b) for candidate in values)
+        elif operator == "$lte":
+            matched = any(_compare(candidate, operand, lambda a, b: a <= b) for candidate in values)
+        elif operator == "$regex":
+            matched = any(_match_regex(candidate, operand, condition.get("$options", "")) for candidate in values)
+        else:
+            raise ValueError(f"Unsupported query operator '{operator}'")
+
+        if not matched:
+            return False
+    return True
+
+
+def document_matches(document, query):
+    """Evaluate a find() filter against a fetched document, mirroring Mongo semantics for the supported operators"""
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(document_matches(document, sub_query) for sub_query in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(document_matches(document, sub_query) for sub_query in condition):
+                return False
+            continue
+
+        found, value = _get_field(document, field)
+        if isinstance(condition, dict) and any(key.startswith('$') for key in condition):
+            if not _match_operators(found, value, condition):
+                return False
+        elif not found:
+            if condition is not None:
+                return False
+        elif not any(candidate == condition for candidate in _candidates(value)):
+            return False
+    return True
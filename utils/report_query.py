@@ -0,0 +1,78 @@
+from utils.column_types import COLUMN_TYPES
+from utils.time_budget import aggregate_options, limit_cursor
+
+# Same layout the exports used when they formatted dates with strftime
+SERVER_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _format_expression(header):
+    """Aggregation expression that formats a header's value on the server, or 1 to pass it through"""
+    column_type = COLUMN_TYPES.get(header)
+    field = f"${header}"
+
+    # Values of an unexpected BSON type are passed through instead of failing the pipeline
+    if column_type == "datetime":
+        return {"$cond": [
+            {"$eq": [{"$type": field}, "date"]},
+            {"$dateToString": {"format": SERVER_DATE_FORMAT, "date": field}},
+            field
+        ]}
+    if column_type == "id":
+        return {"$cond": [
+            {"$eq": [{"$type": field}, "objectId"]},
+            {"$toString": field},
+            field
+        ]}
+    return 1
+
+
+def build_format_projection(headers):
+    """Build a $project stage returning only the header fields, with dates and ObjectIds already stringified"""
+    return {"$project": {header: _format_expression(header) for header in headers}}
+
+
+def build_server_format_pipeline(query, headers):
+    """Aggregation equivalent of find(query) whose rows arrive ready to write"""
+    return [{"$match": query}, build_format_projection(headers)]
+
+
+def header_projection(fields):
+    """find() projection returning only the given fields (and _id), so nothing else is sent or decoded
+
+    A field nested under another listed field is dropped, since projecting both is a path collision.
+    """
+    fields = set(fields)
+    return {
+        field: 1 for field in sorted(fields)
+        if not any(field.startswith(f"{other}.") for other in fields)
+    }
+
+
+def build_report_pipeline(query, headers, server_format=False, sort=None, stages=None):
+    """Aggregation run by fetch_rows when it cannot use find(): match, sort, extra stages, then the header projection"""
+    pipeline = [{"$match": query}]
+    if sort:
+        pipeline.append({"$sort": dict(sort)})
+    pipeline.extend(stages or [])
+    pipeline.append(build_format_projection(headers) if server_format else {"$project": header_projection(headers)})
+    return pipeline
+
+
+def fetch_rows(collection, query, headers, server_format=False, sort=None, stages=None):
+    """Run a report query, formatting values on the server when server_format is set
+
+    Server formatting trades the native Excel dates written by the typed cells for
+    text dates, in exchange for no per-value conversion on the export host.
+    sort is an optional list of (field, direction) pairs, and stages optional
+    aggregation stages run on the matched documents, such as $lookup joins. Queries
+    run within the remaining time budget of the task, if it has one. Either way only
+    _id and the header fields come back, so wide documents cost no more to decode than narrow ones.
+    """
+    if server_format or stages:
+        pipeline = build_report_pipeline(query, headers, server_format, sort, stages)
+        return collection.aggregate(pipeline, allowDiskUse=True, **aggregate_options())
+
+    cursor = limit_cursor(collection.find(query, header_projection(headers)))
+    if sort:
+        cursor = cursor.sort(sort)
+    return cursor
@@ -0,0 +1,36 @@
+class CountingIterator:
+    """Wrap a cursor so its rows can be streamed into a sheet while still counting how many were written"""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self._rows)
+        self.count += 1
+        return row
+
+
+def compact_row(document, headers):
+    """A document as a tuple of its header values in column order, with '' for missing fields"""
+    return tuple([document.get(header, "") for header in headers])
+
+
+def compact_rows(documents, headers):
+    """Yield compact rows straight from a cursor, so the decoded documents can be freed as they are read
+
+    A tuple of a few values takes a fraction of the memory of the document dict it
+    replaces, and writers index it by column position instead of by header name.
+    """
+    for document in documents:
+        yield compact_row(document, headers)
+
+
+def row_values(record, headers):
+    """Header values of a row in column order, from a compact row or a document; compact rows may carry extra trailing values"""
+    if isinstance(record, (tuple, list)):
+        return record
+    return [record.get(header, "") for header in headers]
@@ -0,0 +1,117 @@
+import re
+from datetime import timedelta
+
+# Cron fields in order, with their allowed ranges
+CRON_FIELDS = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),
+]
+
+INTERVAL_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+INTERVAL_PATTERN = re.compile(r"^every\s+(\d+)\s*([smhd])$", re.IGNORECASE)
+
+
+def _parse_cron_field(text, low, high):
+    """Expand one cron field (*, */n, a, a-b, a-b/n and comma lists) to a set of values"""
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid cron step '{step_text}'")
+
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron value '{part}' out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day month weekday (0 = Sunday)"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Cron expression '{expression}' must have {len(CRON_FIELDS)} fields")
+
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_cron_field(text, low, high) for text, (_, low, high) in zip(fields, CRON_FIELDS)
+        )
+        # Sunday may be written as 0 or 7
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment):
+        # As in cron, a restricted day and weekday match when either one does
+        weekday = (moment.weekday() + 1) % 7
+        if self.any_day or self.any_weekday:
+            return moment.day in self.days and weekday in self.weekdays
+        return moment.day in self.days or weekday in self.weekdays
+
+    def next_run(self, after):
+        """Return the first matching minute strictly after the given datetime"""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # A matching minute always exists within four years (29 February)
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+                continue
+            if moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+                continue
+            return moment
+        raise ValueError(f"Cron expression '{self.expression}' never matches")
+
+    def __repr__(self):
+        return f"CronSchedule('{self.expression}')"
+
+
+class IntervalSchedule:
+    """Fixed cadence such as 'every 15m', measured from the previous run"""
+
+    def __init__(self, interval, expression):
+        self.interval = interval
+        self.expression = expression
+
+    def next_run(self, after):
+        """Return the time one interval after the given datetime"""
+        return after + self.interval
+
+    def __repr__(self):
+        return f"IntervalSchedule('{self.expression}')"
+
+
+def parse_schedule(expression):
+    """Parse a task schedule, either 'every <n><s|m|h|d>' or a five-field cron expression"""
+    expression = expression.strip()
+    match = INTERVAL_PATTERN.match(expression)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2).lower()
+        if amount < 1:
+            raise ValueError(f"Schedule interval must be positive: '{expression}'")
+        return IntervalSchedule(timedelta(**{INTERVAL_UNITS[unit]: amount}), expression)
+    return CronSchedule(expression)
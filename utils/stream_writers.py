@@ -0,0 +1,158 @@
+"""Writers that stream rows straight from a cursor, for exports too large for the styled in-memory workbook"""
+
+import csv
+from datetime import datetime, date
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from utils.column_types import get_column_converters
+from utils.memory_profile import mark_phase
+from utils.progress import report_progress
+from utils.row_stream import row_values
+from utils.style_loader import STYLES
+from utils.summary_stats import add_to_summary, write_summary_sheet
+from utils.time_budget import CHECK_INTERVAL, check_deadline, register_output
+
+# Fixed column width in streamed sheets; auto-fitting would need a second pass over the rows
+STREAMING_COLUMN_WIDTH = 20
+
+
+def _styled_cell(ws, value, style, border=False):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = STYLES[style]['font']
+    cell.fill = STYLES[style]['fill']
+    cell.alignment = STYLES[style]['alignment']
+    if border:
+        cell.border = STYLES[style]['border']
+    return cell
+
+
+def _filter_text(value):
+    """Render a filter value the way the styled sheets do, including (start, end) date ranges"""
+    if isinstance(value, tuple):
+        start, end = value
+        return f"{start.strftime('%Y-%m-%d') if start else 'Beginning'} to {end.strftime('%Y-%m-%d') if end else 'Now'}"
+    return str(value)
+
+
+def start_streaming_sheet(wb, title, headers, filters=None, sheet_title=None):
+    """Add a write-only sheet holding the title, filter and header rows, returning (ws, columns) for append_streaming_row"""
+    ws = wb.create_sheet(title=sheet_title or title)
+    for col_idx in range(1, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = STREAMING_COLUMN_WIDTH
+
+    ws.append([_styled_cell(ws, title, 'MainHeader_Style')])
+    row_idx = 1
+    if filters:
+        active = [(name, value) for name, value in filters.items() if value and (not isinstance(value, tuple) or any(value))]
+        if active:
+            ws.append([])
+            row_idx += 1
+        for name, value in active:
+            ws.append([None,
+                       _styled_cell(ws, f"{name.replace('_', ' ').title()}:", 'FilterParam_Style'),
+                       _styled_cell(ws, _filter_text(value), 'FilterValue_Style')])
+            row_idx += 1
+    ws.append([])
+    row_idx += 1
+
+    ws.append([_styled_cell(ws, header.replace('_', ' ').title(), 'SubHeader_Style', border=True) for header in headers])
+    row_idx += 1
+    ws.auto_filter.ref = f"A{row_idx}:{get_column_letter(len(headers))}{row_idx}"
+
+    return ws, (headers, get_column_converters(headers))
+
+
+def append_streaming_row(ws, columns, record):
+    """Append one compact row or document to a sheet from start_streaming_sheet, typing its cells"""
+    headers, converters = columns
+    values = []
+    for value, convert in zip(row_values(record, headers), converters):
+        value, number_format = convert(value)
+        if number_format:
+            value = WriteOnlyCell(ws, value=value)
+            value.number_format = number_format
+        values.append(value)
+    ws.append(values)
+
+
+def write_streaming_workbook(filepath, title, headers, rows, filters=None, summary=None):
+    """Write rows to a write-only workbook as they arrive, returning the number of data rows
+
+    Only the title, filter and header cells are styled. Data cells carry just their
+    number format, which keeps the per-row cost flat and memory independent of row count.
+    With a summary from new_summary, each row is counted into it and a Summary sheet follows the data.
+    """
+    wb = Workbook(write_only=True)
+    ws, columns = start_streaming_sheet(wb, title, headers, filters)
+
+    count = 0
+    report_progress(count)
+    for count, record in enumerate(rows, 1):
+        if count % CHECK_INTERVAL == 0:
+            check_deadline()
+            report_progress(count)
+        append_streaming_row(ws, columns, record)
+        if summary is not None:
+            add_to_summary(summary, record)
+    report_progress(count)
+
+    if summary is not None:
+        write_summary_sheet(wb, title, summary)
+
+    mark_phase("save")
+    register_output(filepath)
+    wb.save(filepath)
+    return count
+
+
+def _csv_value(value):
+    """Plain text for a CSV field; dates use the same layout as the server-formatted exports"""
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d %H:%M:%S' if isinstance(value, datetime) else '%Y-%m-%d')
+    if value is None:
+        return ""
+    return str(value)
+
+
+def write_csv_parts(base_path, headers, rows, part_rows, summary=None):
+    """Write rows to numbered CSV files of at most part_rows rows each, returning (paths, row count)
+
+    Each part repeats the header row, so it opens on its own in Excel. A summary
+    from new_summary is updated with each row; the caller writes it out.
+    """
+    paths = []
+    csv_file = None
+    writer = None
+    count = 0
+    report_progress(count)
+    try:
+        for count, record in enumerate(rows, 1):
+            if (count - 1) % part_rows == 0:
+                if csv_file:
+                    csv_file.close()
+                path = f"{base_path}_part{len(paths) + 1:03d}.csv"
+                csv_file = open(register_output(path), 'w', newline='', encoding='utf-8-sig')
+                writer = csv.writer(csv_file)
+                writer.writerow(headers)
+                paths.append(path)
+            if count % CHECK_INTERVAL == 0:
+                check_deadline()
+                report_progress(count)
+            writer.writerow([_csv_value(value) for value in row_values(record, headers)[:len(headers)]])
+            if summary is not None:
+                add_to_summary(summary, record)
+
+        report_progress(count)
+
+        # An empty result still produces one part holding the header
+        if not paths:
+            path = f"{base_path}_part001.csv"
+            with open(register_output(path), 'w', newline='', encoding='utf-8-sig') as empty_file:
+                csv.writer(empty_file).writerow(headers)
+            paths.append(path)
+    finally:
+        if csv_file:
+            csv_file.close()
+
+    return paths, count
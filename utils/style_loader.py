@@ -65,8 +65,18 @@ def load_table_styles():
         return style
     
     for section in config.sections():
-        styles[section] = parse_style(section)
+        if section != 'Data_Region':
+            styles[section] = parse_style(section)
     
     return styles
 
+def load_data_region_settings():
+    """Load the data region styling mode and Excel table style from table_format.ini"""
+    config = ConfigParser()
+    config.read(os.path.join('config', 'table_format.ini'))
+    return {
+        'mode': config.get('Data_Region', 'mode', fallback='column'),
+        'table_style': config.get('Data_Region', 'table_style', fallback='TableStyleMedium2'),
+    }
+
 STYLES = load_table_styles()
\ No newline at end of file
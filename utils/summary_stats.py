@@ -0,0 +1,127 @@
+"""Summary of an export accumulated row by row while it is written: counts per category and amount totals, in constant memory"""
+
+import csv
+
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+from utils.column_types import AMOUNT_FORMAT, COLUMN_TYPES, COUNT_FORMAT, get_column_converters
+from utils.row_stream import row_values
+from utils.style_loader import STYLES
+from utils.time_budget import register_output
+
+# Columns whose values are counted, when the report has them
+SUMMARY_COUNT_FIELDS = ("Incident_Status", "Actions", "Source_Type")
+
+# Distinct values counted per column; later new values share one row, so a free-text column cannot grow the summary
+MAX_DISTINCT_VALUES = 1000
+OTHER_VALUES = "(other values)"
+BLANK_VALUE = "(blank)"
+
+SUMMARY_SHEET_TITLE = "Summary"
+SUMMARY_COLUMN_WIDTH = 25
+
+
+def new_summary(headers):
+    """Empty accumulator for rows of the given headers; amount columns are those typed 'amount' in COLUMN_TYPES"""
+    converters = get_column_converters(headers)
+    return {
+        "headers": headers,
+        "rows": 0,
+        "count_columns": [(index, header) for index, header in enumerate(headers) if header in SUMMARY_COUNT_FIELDS],
+        "amount_columns": [
+            (index, header, converters[index])
+            for index, header in enumerate(headers) if COLUMN_TYPES.get(header) == "amount"
+        ],
+        "counts": {header: {} for header in headers if header in SUMMARY_COUNT_FIELDS},
+        "amounts": {
+            header: {"rows": 0, "sum": 0.0, "min": None, "max": None}
+            for header in headers if COLUMN_TYPES.get(header) == "amount"
+        },
+    }
+
+
+def add_to_summary(summary, record):
+    """Count one compact row or document into the summary"""
+    values = row_values(record, summary["headers"])
+    summary["rows"] += 1
+
+    for index, header in summary["count_columns"]:
+        value = values[index]
+        key = BLANK_VALUE if value is None or value == "" else str(value)
+        counts = summary["counts"][header]
+        if key not in counts and len(counts) >= MAX_DISTINCT_VALUES:
+            key = OTHER_VALUES
+        counts[key] = counts.get(key, 0) + 1
+
+    for index, header, convert in summary["amount_columns"]:
+        number, number_format = convert(values[index])
+        # Blank and non-numeric cells are left out of the totals
+        if number_format is None:
+            continue
+        number = float(number)
+        amount = summary["amounts"][header]
+        amount["rows"] += 1
+        amount["sum"] += number
+        amount["min"] = number if amount["min"] is None else min(amount["min"], number)
+        amount["max"] = number if amount["max"] is None else max(amount["max"], number)
+
+
+def summary_sections(summary):
+    """The summary as (header row, data rows) sections, largest counts first"""
+    sections = [(["Rows", "Count"], [["All rows", summary["rows"]]])]
+    for header, counts in summary["counts"].items():
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        sections.append(([header.replace('_', ' ').title(), "Count"], [[value, count] for value, count in ranked]))
+    if summary["amounts"]:
+        sections.append((
+            ["Amount", "Sum", "Min", "Max", "Rows With Value"],
+            [[header.replace('_', ' ').title(), amount["sum"], amount["min"], amount["max"], amount["rows"]]
+             for header, amount in summary["amounts"].items()],
+        ))
+    return sections
+
+
+def _cell(ws, value, style, number_format=None):
+    """A styled cell; header cells get their fill, value cells look like the data cells of the report sheet"""
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = STYLES[style]['font']
+    cell.alignment = STYLES[style]['alignment']
+    if style != 'Border_Style':
+        cell.fill = STYLES[style]['fill']
+    if style != 'MainHeader_Style':
+        cell.border = STYLES[style]['border']
+    if number_format:
+        cell.number_format = number_format
+    return cell
+
+
+def write_summary_sheet(wb, title, summary):
+    """Append a Summary sheet to a regular or write-only workbook"""
+    ws = wb.create_sheet(title=SUMMARY_SHEET_TITLE)
+    for col_idx in range(1, 6):
+        ws.column_dimensions[get_column_letter(col_idx)].width = SUMMARY_COLUMN_WIDTH
+
+    ws.append([_cell(ws, f"{title} SUMMARY", 'MainHeader_Style')])
+    for headers, rows in summary_sections(summary):
+        ws.append([])
+        ws.append([_cell(ws, header, 'SubHeader_Style') for header in headers])
+        for row in rows:
+            ws.append([
+                _cell(ws, value, 'Border_Style',
+                      number_format=COUNT_FORMAT if isinstance(value, int) else AMOUNT_FORMAT if isinstance(value, float) else None)
+                for value in row
+            ])
+    return ws
+
+
+def write_summary_csv(path, summary):
+    """Write the summary sections to a CSV file, a blank line between sections"""
+    with open(register_output(path), 'w', newline='', encoding='utf-8-sig') as summary_file:
+        writer = csv.writer(summary_file)
+        for number, (headers, rows) in enumerate(summary_sections(summary)):
+            if number:
+                writer.writerow([])
+            writer.writerow(headers)
+            writer.writerows(rows)
+    return path
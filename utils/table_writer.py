@@ -0,0 +1,116 @@
+from openpyxl.styles import NamedStyle
+from openpyxl.worksheet.table import Table, TableStyleInfo
+from openpyxl.utils import get_column_letter
+from utils.column_types import get_column_converters
+from utils.style_loader import STYLES, load_data_region_settings
+from utils.summary_stats import add_to_summary
+from utils.progress import report_progress
+from utils.row_stream import row_values
+from utils.time_budget import CHECK_INTERVAL, check_deadline
+
+# Font, border and alignment set on every data cell, one attribute at a time
+STYLE_MODE_CELL = "cell"
+# Border_Style registered once per column number format as a named style, then named on each data cell
+STYLE_MODE_COLUMN = "column"
+# Data cells carry only their number format; an Excel table style draws the rest
+STYLE_MODE_TABLE = "table"
+
+STYLE_MODES = (STYLE_MODE_CELL, STYLE_MODE_COLUMN, STYLE_MODE_TABLE)
+
+DATA_REGION = load_data_region_settings()
+
+
+def _named_styles(ws):
+    """Return a lookup of number format -> name of a Border_Style named style registered once in ws's workbook"""
+    workbook = ws.parent
+    resolved = {}
+
+    def style_for(number_format):
+        if number_format not in resolved:
+            name = "Border_Style" if number_format == "General" else f"Border_Style {number_format}"
+            # Sheets of one workbook share its named styles
+            if name not in workbook.named_styles:
+                workbook.add_named_style(NamedStyle(
+                    name=name,
+                    font=STYLES['Border_Style']['font'],
+                    border=STYLES['Border_Style']['border'],
+                    alignment=STYLES['Border_Style']['alignment'],
+                    number_format=number_format,
+                ))
+            resolved[number_format] = name
+        return resolved[number_format]
+
+    return style_for
+
+
+def _add_table(ws, headers, header_row, last_row):
+    """Cover the header and data rows with an Excel table drawn in the configured table style"""
+    # Table names are unique per workbook and may only hold letters, digits and underscores
+    base_name = "".join(ch for ch in ws.title.title() if ch.isalnum()) or "Data"
+    taken = {name for sheet in ws.parent.worksheets for name in sheet.tables}
+    number = 1
+    while f"{base_name}_{number}" in taken:
+        number += 1
+    table = Table(
+        displayName=f"{base_name}_{number}",
+        ref=f"A{header_row}:{get_column_letter(len(headers))}{last_row}",
+    )
+    table.tableStyleInfo = TableStyleInfo(name=DATA_REGION['table_style'], showRowStripes=True)
+    ws.add_table(table)
+
+
+def set_auto_filter(ws, ref):
+    """Set the sheet AutoFilter unless an Excel table already provides one; Excel rejects both over the same cells"""
+    if not ws.tables:
+        ws.auto_filter.ref = ref
+
+
+def write_data_rows(ws, data, headers, row_idx, style_mode=None, summary=None):
+    """Write compact rows or documents below the header row as typed cells with Border_Style, returning the last row index
+
+    style_mode is one of STYLE_MODES and defaults to the [Data_Region] mode in
+    table_format.ini. The cell and column modes format data cells alike; column
+    mode registers each style once instead of three style lookups per cell.
+    A summary from new_summary is updated with each row as it is written.
+    """
+    style_mode = style_mode or DATA_REGION['mode']
+    if style_mode not in STYLE_MODES:
+        raise ValueError(f"Invalid style mode '{style_mode}'. Must be one of: {', '.join(STYLE_MODES)}")
+
+    converters = get_column_converters(headers)
+    font = STYLES['Border_Style']['font']
+    border = STYLES['Border_Style']['border']
+    alignment = STYLES['Border_Style']['alignment']
+    style_for = _named_styles(ws)
+    header_row = row_idx
+    total = len(data) if hasattr(data, '__len__') else None
+
+    count = 0
+    report_progress(count, total)
+    for count, record in enumerate(data, 1):
+        # Stop cooperatively once the task is out of time
+        if count % CHECK_INTERVAL == 0:
+            check_deadline()
+            report_progress(count, total)
+        row_idx += 1
+        if summary is not None:
+            add_to_summary(summary, record)
+        for col_idx, (value, convert) in enumerate(zip(row_values(record, headers), converters), 1):
+            value, number_format = convert(value)
+            cell = ws.cell(row=row_idx, column=col_idx, value=value)
+            if style_mode == STYLE_MODE_COLUMN:
+                # Without a column format the cell keeps the one openpyxl gave its value
+                cell.style = style_for(number_format or cell.number_format)
+                continue
+            if number_format:
+                cell.number_format = number_format
+            if style_mode == STYLE_MODE_CELL:
+                cell.font = font
+                cell.border = border
+                cell.alignment = alignment
+
+    report_progress(count, total)
+    if style_mode == STYLE_MODE_TABLE and row_idx > header_row:
+        _add_table(ws, headers, header_row, row_idx)
+
+    return row_idx
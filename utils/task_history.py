@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+from datetime import datetime
+
+logger = logging.getLogger('excel_data_writer')
+
+HISTORY_PATH = os.path.join("exports", "task_history.json")
+
+# Runs kept per task; the estimate averages over them
+HISTORY_RUNS = 10
+
+
+def load_history(path=HISTORY_PATH):
+    """Return {task_id: [run, ...]} with each run holding seconds, rows and finished_at"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as history_file:
+            return json.load(history_file)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable task history {path}: {e}")
+        return {}
+
+
+def save_history(history, path=HISTORY_PATH):
+    """Write the history atomically, so an interrupted save keeps the previous file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as history_file:
+        json.dump(history, history_file, indent=2)
+    os.replace(temp_path, path)
+
+
+def record_run(history, task_id, seconds, rows=None):
+    """Append one run to a task's history, keeping the most recent HISTORY_RUNS"""
+    runs = history.setdefault(str(task_id), [])
+    runs.append({
+        "seconds": round(seconds, 3),
+        "rows": rows,
+        "finished_at": datetime.now().isoformat(timespec='seconds'),
+    })
+    del runs[:-HISTORY_RUNS]
+
+
+def seconds_per_row(runs):
+    """Average cost of one row over runs with a known row count, or None"""
+    counted = [run for run in runs if run.get("rows")]
+    if not counted:
+        return None
+    return sum(run["seconds"] for run in counted) / sum(run["rows"] for run in counted)
+
+
+def average_seconds(runs):
+    """Average duration over the recorded runs, or None"""
+    if not runs:
+        return None
+    return sum(run["seconds"] for run in runs) / len(runs)
@@ -0,0 +1,129 @@
+"""Task-aware logging: JSON records carrying the task id and phase, and queue-based handlers off the export thread"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import util as multiprocessing_util
+
+# Task and phase of the work running in this process; tasks run one at a time per process
+_context = {"task_id": None, "phase": None, "phase_started": None, "timings": {}}
+
+# Attributes every LogRecord has, so anything else on a record came from extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "task_id", "phase"}
+
+
+def _close_phase():
+    if _context["phase"] is not None:
+        elapsed = time.perf_counter() - _context["phase_started"]
+        _context["timings"][_context["phase"]] = round(_context["timings"].get(_context["phase"], 0) + elapsed, 3)
+
+
+def start_task_context(task_id):
+    """Tag the following log records with task_id until end_task_context"""
+    _context.update(task_id=str(task_id), phase=None, phase_started=None, timings={})
+
+
+def enter_phase(name):
+    """Close the current phase's timing and tag the following records with the new phase"""
+    if _context["task_id"] is None:
+        return
+    _close_phase()
+    _context.update(phase=name, phase_started=time.perf_counter())
+
+
+def close_phases():
+    """Stop timing the current phase and return the seconds spent in each phase so far"""
+    _close_phase()
+    _context.update(phase=None, phase_started=None)
+    return dict(_context["timings"])
+
+
+def end_task_context():
+    """Clear the task tag, returning the seconds spent in each phase"""
+    timings = close_phases()
+    _context.update(task_id=None, timings={})
+    return timings
+
+
+class TaskContextFilter(logging.Filter):
+    """Stamp records with the task id and phase of the emitting process"""
+
+    def filter(self, record):
+        record.task_id = _context["task_id"]
+        record.phase = _context["phase"]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the task id, phase and any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "function": record.funcName,
+            "line": record.lineno,
+            "task_id": getattr(record, "task_id", None),
+            "phase": getattr(record, "phase", None),
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TaskQueueHandler(QueueHandler):
+    """Queue records for a listener thread that owns the real handlers
+
+    A forked worker process does not inherit the listener thread, so the first
+    record emitted in a new process starts a listener of its own there.
+    """
+
+    def __init__(self, handlers):
+        super().__init__(queue.SimpleQueue())
+        self.targets = handlers
+        self.pid = None
+        self.listener = None
+        self.start_lock = threading.Lock()
+        self._start_listener()
+
+    def _start_listener(self):
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+        self.pid = os.getpid()
+        # Flush the queue at exit; multiprocessing finalizers also run in worker processes, which skip atexit
+        multiprocessing_util.Finalize(self, self.listener.stop, exitpriority=10)
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            with self.start_lock:
+                if self.pid != os.getpid():
+                    self._start_listener()
+        super().emit(record)
+
+
+def configure_task_logging(use_queue=False, logger_names=('excel_data_writer',)):
+    """Add task and phase fields to the configured handlers, and with use_queue move them behind a queue"""
+    for name in logger_names:
+        target_logger = logging.getLogger(name)
+        handlers = list(target_logger.handlers)
+        if not handlers or any(isinstance(handler, TaskQueueHandler) for handler in handlers):
+            continue
+
+        if use_queue:
+            for handler in handlers:
+                target_logger.removeHandler(handler)
+            queue_handler = TaskQueueHandler(handlers)
+            # The filter runs in the emitting thread, where the task context is known
+            queue_handler.addFilter(TaskContextFilter())
+            target_logger.addHandler(queue_handler)
+        else:
+            for handler in handlers:
+                handler.addFilter(TaskContextFilter())
@@ -0,0 +1,121 @@
+"""Per-task time budgets, enforced with maxTimeMS on queries and checks in the row loops"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from pymongo.errors import ExecutionTimeout
+
+logger = logging.getLogger('excel_data_writer')
+
+# Rows written between two deadline checks in a row loop
+CHECK_INTERVAL = 1000
+
+# Deadline of the task running in this process, as a time.monotonic() value
+_deadline = None
+
+# Files created by the task running in this process, so a timed-out task removes only its own output
+_outputs = None
+
+# Set once the running task is stopped by its budget, so only a real timeout is reported as one
+_timed_out = False
+
+
+class TaskTimeout(Exception):
+    """Raised when the running task has used up its time budget"""
+
+
+@contextmanager
+def time_budget(seconds):
+    """Run the enclosed task with a budget of seconds; None or 0 means unlimited
+
+    Yields the list of output files the task registers with register_output.
+    """
+    global _deadline, _outputs, _timed_out
+    previous = _deadline, _outputs, _timed_out
+    _deadline = time.monotonic() + float(seconds) if seconds else None
+    _outputs = []
+    _timed_out = False
+    try:
+        yield _outputs
+    finally:
+        _deadline, _outputs, _timed_out = previous
+
+
+def register_output(path):
+    """Record a file the running task is about to write, returning the path"""
+    if _outputs is not None:
+        _outputs.append(path)
+    return path
+
+
+def budget_expired():
+    """True once the running task is past its deadline"""
+    return _deadline is not None and time.monotonic() >= _deadline
+
+
+def check_deadline():
+    """Raise TaskTimeout if the running task is past its deadline, flagging the task as timed out"""
+    global _timed_out
+    if budget_expired():
+        _timed_out = True
+        raise TaskTimeout("Task time budget exceeded")
+
+
+def is_budget_timeout(error):
+    """True for an error that stopped the task at its budget: TaskTimeout, or a query cut off by the budget's maxTimeMS
+
+    Flags the task as timed out; handlers pass such errors on without logging them,
+    since the task runner reports the timeout once.
+    """
+    global _timed_out
+    if isinstance(error, TaskTimeout) or (isinstance(error, ExecutionTimeout) and _deadline is not None):
+        _timed_out = True
+        return True
+    return False
+
+
+def task_timed_out():
+    """True once the running task has been stopped by its time budget"""
+    return _timed_out
+
+
+def remaining_ms():
+    """Milliseconds left in the running task's budget, or None without a budget"""
+    if _deadline is None:
+        return None
+    check_deadline()
+    return max(int((_deadline - time.monotonic()) * 1000), 1)
+
+
+def limit_cursor(cursor):
+    """Apply the remaining budget to a find() cursor as maxTimeMS"""
+    milliseconds = remaining_ms()
+    if milliseconds is not None:
+        cursor = cursor.max_time_ms(milliseconds)
+    return cursor
+
+
+def aggregate_options():
+    """Keyword arguments carrying the remaining budget to collection.aggregate()"""
+    milliseconds = remaining_ms()
+    return {"maxTimeMS": milliseconds} if milliseconds is not None else {}
+
+
+def remove_partial_outputs(paths):
+    """Delete the output files a task registered, returning the paths removed
+
+    Only the task's own files are removed, so finished outputs of tasks running at
+    the same time are kept. Checkpoints are not registered outputs, so a timed-out export can resume.
+    """
+    removed = []
+    for path in sorted(set(paths)):
+        if not os.path.isfile(path):
+            continue
+        try:
+            os.remove(path)
+            removed.append(path)
+        except OSError as e:
+            logger.warning(f"Could not remove partial output {path}: {e}")
+    return removed